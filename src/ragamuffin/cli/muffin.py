@@ -2,14 +2,23 @@ import logging
 import sys
 
 import click
+from llama_index.core.agent import AgentRunner
+from llama_index.core.query_engine import RetrieverQueryEngine
+from llama_index.core.tools import QueryEngineTool
 
 from ragamuffin.cli.utils import format_list
 from ragamuffin.error_handling import ensure_string, exit_on_error
 from ragamuffin.libraries.files import LocalLibrary
 from ragamuffin.libraries.git_repo import GitLibrary
+from ragamuffin.libraries.utils import delete_library_state, get_library_state_dir
 from ragamuffin.libraries.zotero import ZoteroLibrary
-from ragamuffin.models.model_picker import configure_llamaindex_embedding_model, get_llm_by_name
+from ragamuffin.models.model_picker import (
+    close_embedding_pool,
+    configure_llamaindex_embedding_model,
+    get_llm_by_name,
+)
 from ragamuffin.settings import get_settings
+from ragamuffin.storage.hybrid_retriever import QueryRecordingRetriever
 from ragamuffin.storage.utils import get_storage
 
 logger = logging.getLogger(__name__)
@@ -29,21 +38,31 @@ def generate() -> None:
 @generate.command(name="from_files")
 @click.argument("name")
 @click.argument("source_dir", type=click.Path(exists=True, file_okay=True))
+@click.option("--workers", default=1, show_default=True, help="Number of processes used to parse documents.")
+@click.option(
+    "--embed-workers", default=1, show_default=True, help="Number of processes used to compute local embeddings."
+)
+@click.option("--resume", is_flag=True, help="Continue an interrupted run from its last checkpoint.")
 @exit_on_error
-def create_agent_from_files(name: str, source_dir: str) -> None:
+def create_agent_from_files(name: str, source_dir: str, workers: int, embed_workers: int, resume: bool) -> None:
     """Create a new chat agent using a directory of documents.
 
     \b
     Args:
         name: A name for the chat agent.
         source_dir: A directory containing the documents it will know.
+        workers: Number of processes used to parse documents.
+        resume: Continue an interrupted run from its last checkpoint.
     """
     logger.info(f"Creating a new chat agent '{name}' from '{source_dir}'.")
 
     storage = get_storage()
-    library = LocalLibrary(library_dir=source_dir)
+    library = LocalLibrary(library_dir=source_dir, workers=workers)
     reader = library.get_reader()
-    storage.generate_index(name, reader)
+    try:
+        storage.generate_index(name, reader, embed_workers=embed_workers, resume=resume)
+    finally:
+        close_embedding_pool()
 
     logger.info(f"Agent '{name}' created successfully.")
     logger.info(f"Use this command to chat: muffin chat {name}")
@@ -52,19 +71,50 @@ def create_agent_from_files(name: str, source_dir: str) -> None:
 @generate.command(name="from_zotero")
 @click.argument("name")
 @click.option("--collection", multiple=True, help="Zotero collections to include when generating the index.")
+@click.option("--workers", default=1, show_default=True, help="Number of processes used to parse documents.")
+@click.option("--download-workers", default=4, show_default=True, help="Number of concurrent article downloads.")
+@click.option("--use-fulltext", is_flag=True, help="Use text indexed by Zotero instead of downloading PDFs.")
+@click.option(
+    "--embed-workers", default=1, show_default=True, help="Number of processes used to compute local embeddings."
+)
+@click.option("--resume", is_flag=True, help="Continue an interrupted run from its last checkpoint.")
 @exit_on_error
-def create_agent_from_zotero(collection: list[str], name: str) -> None:
+def create_agent_from_zotero(  # noqa: PLR0913
+    collection: list[str],
+    name: str,
+    workers: int,
+    download_workers: int,
+    use_fulltext: bool,
+    embed_workers: int,
+    resume: bool,
+) -> None:
     """Create an agent from your Zotero library."""
     logger.info("Creating Zotero chat...")
     settings = get_settings()
     storage = get_storage()
 
+    # Only fetch changes from Zotero if the agent was generated before
+    if name not in storage.list_agents():
+        delete_library_state(name)
+
     lib_id = ensure_string(settings.get("zotero_library_id"))
     api_key = ensure_string(settings.get("zotero_api_key"))
-    library = ZoteroLibrary(library_id=lib_id, api_key=api_key, collections=collection)
+    library = ZoteroLibrary(
+        library_id=lib_id,
+        api_key=api_key,
+        collections=collection,
+        workers=workers,
+        download_workers=download_workers,
+        sync_state_path=get_library_state_dir(name) / "zotero.json",
+        use_fulltext=use_fulltext,
+    )
 
     reader = library.get_reader()
-    storage.generate_index(name, reader)
+    try:
+        storage.generate_index(name, reader, embed_workers=embed_workers, resume=resume)
+    finally:
+        close_embedding_pool()
+    library.save_sync_state()
 
     logger.info(f"Agent '{name}' created successfully.")
     logger.info(f"Use this command to chat: muffin chat {name}")
@@ -74,15 +124,52 @@ def create_agent_from_zotero(collection: list[str], name: str) -> None:
 @click.argument("name")
 @click.argument("repo_url")
 @click.option("--ref", help="The branch, tag, or commit hash to checkout.")
+@click.option("--include", multiple=True, help="Glob pattern of files to include, e.g. '*.py'.")
+@click.option("--exclude", multiple=True, help="Glob pattern of files to exclude, e.g. 'vendor/*'.")
+@click.option(
+    "--max-file-size", default=1024 * 1024, show_default=True, help="Skip text files larger than this (bytes)."
+)
+@click.option("--workers", default=1, show_default=True, help="Number of processes used to parse documents.")
+@click.option(
+    "--embed-workers", default=1, show_default=True, help="Number of processes used to compute local embeddings."
+)
+@click.option("--resume", is_flag=True, help="Continue an interrupted run from its last checkpoint.")
 @exit_on_error
-def create_agent_from_git(name: str, repo_url: str, ref: str | None) -> None:
+def create_agent_from_git(  # noqa: PLR0913
+    name: str,
+    repo_url: str,
+    ref: str | None,
+    include: list[str],
+    exclude: list[str],
+    max_file_size: int,
+    workers: int,
+    embed_workers: int,
+    resume: bool,
+) -> None:
     """Create an agent from a Git repository."""
     logger.info("Creating a chat agent from a Git repository...")
 
-    library = GitLibrary(git_repo=repo_url, ref=ref)
-    reader = library.get_reader()
     storage = get_storage()
-    storage.generate_index(name, reader)
+
+    # Only report the files changed since the previous commit if the agent was generated before
+    if name not in storage.list_agents():
+        delete_library_state(name)
+
+    library = GitLibrary(
+        git_repo=repo_url,
+        ref=ref,
+        include=list(include),
+        exclude=list(exclude),
+        max_file_size=max_file_size,
+        state_dir=get_library_state_dir(name),
+        workers=workers,
+    )
+    reader = library.get_reader()
+    try:
+        storage.generate_index(name, reader, embed_workers=embed_workers, resume=resume)
+    finally:
+        close_embedding_pool()
+    library.save_sync_state()
 
     logger.info(f"Agent '{name}' created successfully.")
     logger.info(f"Use this command to chat: muffin chat {name}")
@@ -106,16 +193,19 @@ def chat(name: str) -> None:
 
     logger.info("Loading the RAG embedding index...")
     configure_llamaindex_embedding_model()
-    index = storage.load_index(name)
+    retriever = QueryRecordingRetriever(storage.load_retriever(name, similarity_top_k=6))
 
     logger.info("Starting the chat interface...")
     llm_model = ensure_string(settings.get("llm_model"))
     llm = get_llm_by_name(llm_model)
-    agent = index.as_chat_engine(llm=llm, similarity_top_k=6)
+    query_engine = RetrieverQueryEngine.from_args(retriever, llm=llm)
+    agent = AgentRunner.from_llm(tools=[QueryEngineTool.from_defaults(query_engine=query_engine)], llm=llm)
 
     from ragamuffin.webui.gradio_chat import GradioAgentChatUI
 
-    webapp = GradioAgentChatUI(agent, name=name)
+    webapp = GradioAgentChatUI(
+        agent, name=name, sentence_store=storage.load_sentence_store(name), query_recorder=retriever
+    )
     webapp.run()
 
 
@@ -145,6 +235,7 @@ def delete(name: str) -> None:
     """
     storage = get_storage()
     storage.delete_agent(name)
+    delete_library_state(name)
 
 
 if __name__ == "__main__":
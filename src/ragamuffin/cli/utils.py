@@ -1,4 +1,4 @@
-from collections.abc import Generator, Sequence
+from collections.abc import Generator, Iterable, Sized
 from typing import TypeVar
 
 from rich.progress import (
@@ -14,8 +14,12 @@ from rich.progress import (
 T = TypeVar("T")
 
 
-def track(items: Sequence[T], total: int | None = None, description: str = "") -> Generator[T, None, None]:
-    """Track the progress of an iterable with a progress bar."""
+def track(items: Iterable[T], total: int | None = None, description: str = "") -> Generator[T, None, None]:
+    """Track the progress of an iterable with a progress bar.
+
+    Without a `total`, the number of items is taken from sized collections, and the progress bar
+    of other iterables has no end.
+    """
     with Progress(
         SpinnerColumn(),
         TextColumn("[progress.description]{task.description}"),
@@ -24,7 +28,9 @@ def track(items: Sequence[T], total: int | None = None, description: str = "") -
         TaskProgressColumn(),
         TimeRemainingColumn(),
     ) as progress:
-        task = progress.add_task(description, total=total or len(items))
+        if total is None and isinstance(items, Sized):
+            total = len(items)
+        task = progress.add_task(description, total=total)
         for item in items:
             yield item
             progress.update(task, advance=1)
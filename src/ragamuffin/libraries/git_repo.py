@@ -1,61 +1,379 @@
+import json
 import logging
+import mimetypes
 import re
 import shutil
 import tempfile
-from pathlib import Path
+from collections.abc import Iterable, Iterator
+from fnmatch import fnmatch
+from pathlib import Path, PurePosixPath
+from typing import Any
 
 from git import GitCommandError, Repo
-from llama_index.core import SimpleDirectoryReader
-from llama_index.core.readers.base import BaseReader
+from llama_index.core import Document, SimpleDirectoryReader
+from llama_index.core.readers.base import BaseReader, ResourcesReaderMixin
 from typing_extensions import override
 
+from ragamuffin.cli.utils import format_list
 from ragamuffin.libraries.interface import Library
+from ragamuffin.libraries.readers import load_files
+from ragamuffin.settings import get_settings
 
 logger = logging.getLogger(__name__)
 
+# Git checks this many bytes for null bytes to detect binary files
+BINARY_CHECK_SIZE = 8000
+# Maximum number of paths passed to a single git command
+GIT_MAX_PATHS = 500
+# The working tree records the commit it was checked out from, and has its own index
+WORK_TREE_COMMIT_FILENAME = ".ragamuffin_commit"
+WORK_TREE_INDEX_FILENAME = ".ragamuffin_index"
+
 
 class GitLibrary(Library):
-    def __init__(self, git_repo: str, ref: str | None = None):
+    def __init__(  # noqa: PLR0913
+        self,
+        git_repo: str,
+        ref: str | None = None,
+        include: list[str] | None = None,
+        exclude: list[str] | None = None,
+        max_file_size: int | None = None,
+        state_dir: Path | None = None,
+        workers: int = 1,
+    ):
         self.git_repo = git_repo
         self.ref = ref
+        self.include = include
+        self.exclude = exclude
+        self.max_file_size = max_file_size
+        self.workers = workers
 
-        # Create a unique storage directory for the cloned repository
+        # Repositories are cached as bare clones, shared by all agents and refs
         repo_slug = re.sub(r"[^\w\-]", "_", git_repo)
-        repo_slug += f"_{ref}" if ref else ""
-        self.storage_dir = Path(tempfile.gettempdir()) / "ragamuffin" / "git" / repo_slug
+        self.cache_dir = Path(str(get_settings().get("data_dir"))) / "git" / f"{repo_slug}.git"
 
-    def download_repo(self, output_directory: Path, repo_url: str, ref: str | None = None) -> None:
-        """Downloads a Git repository from a given URL and extracts its files to the specified output directory.
+        # Files which are parsed are checked out to a working tree, kept between runs if the library has
+        # a state directory
+        self.state_path = state_dir / "git.json" if state_dir else None
+        if state_dir:
+            self.work_tree_dir = state_dir / "repo"
+        else:
+            repo_slug += f"_{ref}" if ref else ""
+            self.work_tree_dir = Path(tempfile.gettempdir()) / "ragamuffin" / "git" / repo_slug
+        self.commit: str | None = None
 
-        Args:
-            repo_url: The HTTPS or SSH URL of the Git repository.
-            output_directory: The path to the directory where the repository files will be saved.
-            ref: The branch, tag, or commit hash to checkout. Defaults to None (uses default branch).
+    def fetch_repo(self) -> str:
+        """Fetch the requested ref into the repository cache.
 
+        Returns:
+            The hash of the fetched commit.
         """
-        logger.info(f"Cloning Git repository from {repo_url}")
+        if self.cache_dir.exists():
+            repo = Repo(self.cache_dir)
+            repo.remote("origin").set_url(self.git_repo)
+        else:
+            logger.info(f"Cloning Git repository from {self.git_repo}")
+            repo = Repo.init(self.cache_dir, bare=True, mkdir=True)
+            repo.create_remote("origin", self.git_repo)
 
-        if output_directory.exists():
-            shutil.rmtree(output_directory)
-        output_directory.mkdir(parents=True, exist_ok=True)
+        ref = self.ref or "HEAD"
+        logger.info(f"Fetching {ref} from {self.git_repo}")
+        try:
+            repo.git.fetch("origin", ref, depth=1, no_tags=True)
+            return repo.git.rev_parse("FETCH_HEAD^{commit}")
+        except GitCommandError:
+            # If fetching with depth=1 fails (e.g., for commit hash), fetch the full history
+            logger.info("Fetching the full history of the repository...")
+            is_shallow = (self.cache_dir / "shallow").exists()
+            repo.git.fetch("origin", "+refs/heads/*:refs/remotes/origin/*", tags=True, unshallow=is_shallow)
+            return repo.git.rev_parse(f"{ref}^{{commit}}")
 
-        if ref is None:
-            Repo.clone_from(repo_url, output_directory, depth=1)
-        else:
-            try:
-                Repo.clone_from(repo_url, output_directory, depth=1, branch=ref, single_branch=True)
-            except GitCommandError:
-                # If cloning with depth=1 fails (e.g., for commit hash), perform a full clone
-                repo = Repo.clone_from(repo_url, output_directory)
-                repo.git.checkout(ref)
-
-        # Remove the .git directory to exclude repository metadata
-        git_dir = output_directory / ".git"
-        if git_dir.exists():
-            shutil.rmtree(git_dir)
+    def update_working_tree(self, commit: str, paths: list[str]) -> None:
+        """Check out the given files of a commit to the working tree.
+
+        If the working tree was checked out from a commit which is still in the cache, only the files which
+        changed between the two commits or are missing are written, so unchanged files are not rewritten.
+        """
+        repo = Repo(self.cache_dir)
+        commit_path = self.work_tree_dir / WORK_TREE_COMMIT_FILENAME
+        previous_commit = commit_path.read_text() if commit_path.exists() else None
+
+        if previous_commit is not None and self.has_commit(repo, previous_commit):
+            changed_paths, deleted_paths = self.diff_commits(repo, previous_commit, commit)
+            for path in deleted_paths:
+                (self.work_tree_dir / path).unlink(missing_ok=True)
+            changed = set(changed_paths)
+            paths = [path for path in paths if path in changed or not (self.work_tree_dir / path).exists()]
+        elif self.work_tree_dir.exists():
+            shutil.rmtree(self.work_tree_dir)
+
+        # An interrupted update leaves no commit behind, so the next run checks out all files again
+        commit_path.unlink(missing_ok=True)
+        self.work_tree_dir.mkdir(parents=True, exist_ok=True)
+        if paths:
+            logger.info(f"Checking out {len(paths)} files from commit {commit[:12]}...")
+            self.checkout_paths(repo, commit, paths)
+        commit_path.write_text(commit)
+
+    def checkout_paths(self, repo: Repo, commit: str, paths: list[str]) -> None:
+        """Write files from a commit to the working tree, using an index of the working tree."""
+        git = repo.git(work_tree=str(self.work_tree_dir))
+        env = {"GIT_INDEX_FILE": str(self.work_tree_dir / WORK_TREE_INDEX_FILENAME)}
+        for start in range(0, len(paths), GIT_MAX_PATHS):
+            git.checkout(commit, "--", *paths[start : start + GIT_MAX_PATHS], force=True, env=env)
+
+    def log_changes(self, commit: str) -> None:
+        """Report the files which changed since the commit of the previous run."""
+        previous_commit = self.load_sync_state()
+        if previous_commit is None:
+            return
+
+        repo = Repo(self.cache_dir)
+        if previous_commit == commit:
+            logger.info(f"The repository is up to date at commit {commit[:12]}.")
+        elif self.has_commit(repo, previous_commit):
+            changed_paths, deleted_paths = self.diff_commits(repo, previous_commit, commit)
+            logger.info(
+                f"Found {len(changed_paths)} changed and {len(deleted_paths)} deleted files "
+                f"since commit {previous_commit[:12]}."
+            )
+
+    @staticmethod
+    def diff_commits(repo: Repo, old_commit: str, new_commit: str) -> tuple[list[str], list[str]]:
+        """List the files which changed between two commits.
+
+        Returns:
+            The paths of files which were added or modified, and the paths of files which were deleted.
+        """
+        output = repo.git.diff("--name-status", "--no-renames", "-z", old_commit, new_commit)
+        fields = output.split("\0")
+
+        changed_paths, deleted_paths = [], []
+        for status, path in zip(fields[0::2], fields[1::2], strict=False):
+            if status == "D":
+                deleted_paths.append(path)
+            elif status:
+                changed_paths.append(path)
+        return changed_paths, deleted_paths
+
+    @staticmethod
+    def has_commit(repo: Repo, commit: str) -> bool:
+        """Check if a commit is available in the repository."""
+        try:
+            repo.git.cat_file("-e", f"{commit}^{{commit}}")
+        except GitCommandError:
+            return False
+        return True
+
+    def load_sync_state(self) -> str | None:
+        """Load the commit indexed in the previous run."""
+        if self.state_path is None or not self.state_path.exists():
+            return None
+        with self.state_path.open() as f:
+            state = json.load(f)
+        return state.get("commit") if state.get("repo") == self.git_repo else None
+
+    def save_sync_state(self) -> None:
+        """Record the indexed commit, once the index has been generated from it."""
+        if self.state_path is None or self.commit is None:
+            return
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        with self.state_path.open("w") as f:
+            json.dump({"repo": self.git_repo, "commit": self.commit}, f)
 
     @override
     def get_reader(self) -> BaseReader:
         """Get a Llama Index reader for the cloned repository."""
-        self.download_repo(self.storage_dir, self.git_repo, self.ref)
-        return SimpleDirectoryReader(input_dir=self.storage_dir, recursive=True)
+        self.commit = self.fetch_repo()
+        self.log_changes(self.commit)
+        reader = GitTreeReader(
+            self.cache_dir,
+            self.commit,
+            include=self.include,
+            exclude=self.exclude,
+            max_file_size=self.max_file_size,
+            work_tree_dir=self.work_tree_dir,
+            num_workers=self.workers,
+        )
+        self.update_working_tree(self.commit, reader.parsed_paths)
+        return reader
+
+
+class GitTreeReader(BaseReader, ResourcesReaderMixin):
+    """Read the files of a commit from the object database of a Git repository.
+
+    Text files are streamed directly from the pack files as they are loaded. Files which have a parser in
+    `SimpleDirectoryReader`, such as PDFs and notebooks, are parsed from a working tree containing only those
+    files, in a pool of `num_workers` processes. Without a working tree, they are read like text files.
+    Hidden files, binary files, symbolic links and text files larger than `max_file_size` bytes are skipped.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        repo_path: Path,
+        commit: str,
+        include: list[str] | None = None,
+        exclude: list[str] | None = None,
+        max_file_size: int | None = None,
+        work_tree_dir: Path | None = None,
+        num_workers: int = 1,
+    ):
+        self.repo = Repo(repo_path)
+        self.commit = commit
+        self.include = include or []
+        self.exclude = exclude or []
+        self.max_file_size = max_file_size
+        self.work_tree_dir = work_tree_dir
+        self.num_workers = num_workers
+        self.parsed_suffixes = set(SimpleDirectoryReader.supported_suffix_fn()) if work_tree_dir else set()
+        self.failed_files: dict[str, str] = {}
+        self._blobs: dict[str, tuple[str, int]] | None = None
+
+    @property
+    def blobs(self) -> dict[str, tuple[str, int]]:
+        """The hash and size of each selected file in the commit, by path."""
+        if self._blobs is None:
+            self._blobs = dict(self._list_blobs())
+        return self._blobs
+
+    def _list_blobs(self) -> Iterable[tuple[str, tuple[str, int]]]:
+        """List the selected files in the commit, using a single git command."""
+        output = self.repo.git.ls_tree("-r", "-l", "-z", self.commit)
+        skipped_large_files = []
+        for entry in output.split("\0"):
+            if not entry:
+                continue
+            info, path = entry.split("\t", 1)
+            mode, object_type, sha, size = info.split()
+
+            # Skip submodules and symbolic links
+            if object_type != "blob" or mode == "120000" or not self.is_selected(path):
+                continue
+            # Documents which are parsed are not limited in size, like in a directory library
+            if self.max_file_size is not None and int(size) > self.max_file_size and not self.is_parsed(path):
+                skipped_large_files.append(path)
+                continue
+            yield path, (sha, int(size))
+
+        if skipped_large_files:
+            logger.info(
+                f"Skipped {len(skipped_large_files)} text files larger than {self.max_file_size} bytes:\n"
+                f"{format_list(skipped_large_files)}",
+                extra={"markup": True},
+            )
+
+    def is_selected(self, path: str) -> bool:
+        """Check if a file matches the include and exclude patterns and is not hidden."""
+        if any(part.startswith(".") for part in PurePosixPath(path).parts):
+            return False
+        if self.include and not any(fnmatch(path, pattern) for pattern in self.include):
+            return False
+        return not any(fnmatch(path, pattern) for pattern in self.exclude)
+
+    @property
+    def parsed_paths(self) -> list[str]:
+        """The paths of the selected files which are parsed from the working tree."""
+        return [path for path in self.blobs if self.is_parsed(path)]
+
+    def is_parsed(self, path: str) -> bool:
+        """Check if a file is parsed from the working tree, rather than read as text."""
+        return PurePosixPath(path).suffix.lower() in self.parsed_suffixes
+
+    @override
+    def list_resources(self, *args: Any, **kwargs: Any) -> list[str]:
+        """List the paths of the selected files."""
+        return list(self.blobs)
+
+    @override
+    def get_resource_info(self, resource_id: str, *args: Any, **kwargs: Any) -> dict:
+        """Get information about a file, using its blob hash as the content hash."""
+        sha, size = self.blobs[resource_id]
+        return {"file_path": resource_id, "file_size": size, "content_hash": sha}
+
+    @override
+    def load_resource(self, resource_id: str, *args: Any, **kwargs: Any) -> list[Document]:
+        """Load the documents from a file. Returns no documents for binary files and files which fail to parse."""
+        _, documents = next(self.iter_resources([resource_id]), (resource_id, []))
+        return documents
+
+    def iter_resources(self, resource_ids: list[str]) -> Iterator[tuple[str, list[Document]]]:
+        """Load the documents from each file, keeping the order of the files.
+
+        Files which fail to parse are reported and skipped, they are listed in `failed_files`.
+        """
+        self.failed_files = {}
+        parsed_ids = [resource_id for resource_id in resource_ids if self.is_parsed(resource_id)]
+        parsed_results = load_files(
+            [self._work_tree_path(resource_id) for resource_id in parsed_ids],
+            num_workers=self.num_workers,
+            file_extractor={},
+            filename_as_id=True,
+        )
+
+        for resource_id in resource_ids:
+            if not self.is_parsed(resource_id):
+                yield resource_id, self._load_text(resource_id)
+                continue
+
+            documents, error = next(parsed_results)
+            if error is not None:
+                logger.warning(f"Failed to load file {resource_id}: {error}")
+                self.failed_files[resource_id] = error
+                continue
+            for i, document in enumerate(documents):
+                document.id_ = f"{resource_id}_part_{i}"
+            yield resource_id, self._set_metadata(resource_id, documents)
+
+        if self.failed_files:
+            logger.warning(
+                f"Failed to load {len(self.failed_files)} files:\n{format_list(list(self.failed_files))}",
+                extra={"markup": True},
+            )
+
+    def _work_tree_path(self, resource_id: str) -> Path:
+        """Get the path of a parsed file in the working tree."""
+        if self.work_tree_dir is None:
+            raise ValueError("Files can only be parsed from a working tree.")
+        return self.work_tree_dir / resource_id
+
+    def _load_text(self, resource_id: str) -> list[Document]:
+        """Load a text file from the object database as a document."""
+        sha, _ = self.blobs[resource_id]
+        data = self.repo.odb.stream(bytes.fromhex(sha)).read()
+        if b"\0" in data[:BINARY_CHECK_SIZE]:
+            logger.debug(f"Skipping binary file: {resource_id}")
+            return []
+
+        document = Document(doc_id=resource_id, text=data.decode("utf-8", errors="ignore"))
+        return self._set_metadata(resource_id, [document])
+
+    def _set_metadata(self, resource_id: str, documents: list[Document]) -> list[Document]:
+        """Describe the documents by the path of their file in the repository, rather than in the working tree.
+
+        The dates of files in the working tree only show when they were checked out, so they are removed.
+        """
+        _, size = self.blobs[resource_id]
+        metadata = {
+            "file_path": resource_id,
+            "file_name": PurePosixPath(resource_id).name,
+            "file_type": mimetypes.guess_type(resource_id)[0],
+            "file_size": size,
+        }
+        for document in documents:
+            for key in ("creation_date", "last_modified_date", "last_accessed_date"):
+                document.metadata.pop(key, None)
+            document.metadata.update({key: value for key, value in metadata.items() if value is not None})
+            document.excluded_embed_metadata_keys = ["file_name", "file_type", "file_size"]
+            document.excluded_llm_metadata_keys = ["file_name", "file_type", "file_size"]
+        return documents
+
+    @override
+    def lazy_load_data(self, *args: Any, **kwargs: Any) -> Iterable[Document]:
+        """Load the selected files one at a time."""
+        for _, documents in self.iter_resources(self.list_resources()):
+            yield from documents
+
+    @override
+    def load_data(self, *args: Any, **kwargs: Any) -> list[Document]:
+        """Load all selected files."""
+        return list(self.lazy_load_data())
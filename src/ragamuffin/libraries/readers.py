@@ -0,0 +1,136 @@
+import logging
+import multiprocessing
+from collections import deque
+from collections.abc import Generator, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from pathlib import Path
+from typing import Any
+
+from llama_index.core import Document, SimpleDirectoryReader
+from llama_index.core.readers.file.base import default_file_metadata_func
+from typing_extensions import override
+
+from ragamuffin.cli.utils import format_list
+
+logger = logging.getLogger(__name__)
+
+
+class LibraryReader(SimpleDirectoryReader):
+    """A directory reader which can load the library one file at a time.
+
+    Documents are identified by their file path, so the nodes generated from a file
+    can be found and replaced when the file changes.
+
+    Files can be parsed in parallel by a pool of `num_workers` processes.
+    """
+
+    def __init__(self, *args: Any, num_workers: int = 1, **kwargs: Any):
+        kwargs.setdefault("filename_as_id", True)
+        super().__init__(*args, **kwargs)
+        self.num_workers = num_workers
+        self.failed_files: dict[str, str] = {}
+
+    @override
+    def get_resource_info(self, resource_id: str, *args: Any, **kwargs: Any) -> dict:
+        """Get information about a file, including its exact modification time."""
+        info = super().get_resource_info(resource_id, *args, **kwargs)
+        info["mtime"] = Path(resource_id).stat().st_mtime
+        return info
+
+    @override
+    def load_resource(self, resource_id: str, *args: Any, **kwargs: Any) -> list[Document]:
+        """Load the documents from a single file."""
+        documents = SimpleDirectoryReader.load_file(
+            input_file=Path(resource_id),
+            file_metadata=self.file_metadata,
+            file_extractor=self.file_extractor,
+            filename_as_id=self.filename_as_id,
+            encoding=self.encoding,
+            errors=self.errors,
+            raise_on_error=self.raise_on_error,
+            fs=self.fs,
+        )
+        return self._exclude_metadata(documents)
+
+    @override
+    def iter_data(self, show_progress: bool = False) -> Generator[list[Document], Any, Any]:
+        """Load the documents one file at a time."""
+        for _, documents in self.iter_resources(self.list_resources()):
+            if documents:
+                yield documents
+
+    def iter_resources(self, resource_ids: list[str]) -> Iterator[tuple[str, list[Document]]]:
+        """Load the documents from each file, keeping the order of the files.
+
+        Files which fail to load are reported and skipped, they are listed in `failed_files`.
+        """
+        self.failed_files = {}
+        for resource_id, (documents, error) in self._load_files(resource_ids):
+            if error is not None:
+                logger.warning(f"Failed to load file {resource_id}: {error}")
+                self.failed_files[resource_id] = error
+                continue
+
+            # Apply custom file metadata in this process, since it may not be picklable
+            metadata = self.file_metadata(resource_id)
+            for document in documents:
+                document.metadata.update(metadata)
+            yield resource_id, self._exclude_metadata(documents)
+
+        if self.failed_files:
+            logger.warning(
+                f"Failed to load {len(self.failed_files)} files:\n{format_list(list(self.failed_files))}",
+                extra={"markup": True},
+            )
+
+    def _load_files(self, resource_ids: list[str]) -> Iterator[tuple[str, tuple[list[Document], str | None]]]:
+        """Parse files in a pool of worker processes, keeping the order of the files."""
+        results = load_files(
+            [Path(resource_id) for resource_id in resource_ids],
+            num_workers=self.num_workers,
+            file_extractor=self.file_extractor,
+            filename_as_id=self.filename_as_id,
+            encoding=self.encoding,
+            errors=self.errors,
+        )
+        yield from zip(resource_ids, results, strict=True)
+
+
+def load_files(
+    input_files: list[Path], num_workers: int = 1, **kwargs: Any
+) -> Iterator[tuple[list[Document], str | None]]:
+    """Parse files in a pool of worker processes, or in this process if there is only one worker.
+
+    Yields the documents of each file and an error message if it failed, in the order of the files.
+    Only a limited number of files is submitted to the pool ahead of the one being consumed.
+    """
+    if num_workers <= 1:
+        for input_file in input_files:
+            yield _load_file(input_file, **kwargs)
+        return
+
+    mp_context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=num_workers, mp_context=mp_context) as executor:
+        remaining = iter(input_files)
+        pending = deque(
+            executor.submit(_load_file, input_file, **kwargs) for input_file in islice(remaining, num_workers * 2)
+        )
+        while pending:
+            future = pending.popleft()
+            next_input_file = next(remaining, None)
+            if next_input_file is not None:
+                pending.append(executor.submit(_load_file, next_input_file, **kwargs))
+            yield future.result()
+
+
+def _load_file(input_file: Path, **kwargs: Any) -> tuple[list[Document], str | None]:
+    """Load the documents from a file, returning the error message instead of raising if it fails."""
+    try:
+        documents = SimpleDirectoryReader.load_file(
+            input_file, file_metadata=default_file_metadata_func, raise_on_error=True, **kwargs
+        )
+    except Exception as e:  # noqa: BLE001
+        error = e.__cause__ or e
+        return [], f"{type(error).__name__}: {error}"
+    return documents, None
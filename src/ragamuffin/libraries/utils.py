@@ -1,5 +1,10 @@
+import shutil
+from pathlib import Path
+
 import dateutil.parser
 
+from ragamuffin.settings import get_settings
+
 
 def extract_year(date_str: str) -> str | None:
     """Extract the year from a date string."""
@@ -9,3 +14,13 @@ def extract_year(date_str: str) -> str | None:
     except (ValueError, TypeError):
         # Return None if parsing fails
         return None
+
+
+def get_library_state_dir(agent_name: str) -> Path:
+    """Get the directory where the library of an agent keeps its state between runs."""
+    return Path(str(get_settings().get("data_dir"))) / "libraries" / agent_name
+
+
+def delete_library_state(agent_name: str) -> None:
+    """Delete the library state of an agent."""
+    shutil.rmtree(get_library_state_dir(agent_name), ignore_errors=True)
@@ -1,28 +1,61 @@
+import hashlib
+import json
 import logging
 import sys
 import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from typing import Any
 
-from llama_index.core import SimpleDirectoryReader
+import requests
+from llama_index.core import Document
 from llama_index.core.readers.base import BaseReader
 from llama_index.core.readers.file.base import default_file_metadata_func
 from pyzotero.zotero import Zotero
+from requests.adapters import HTTPAdapter
 
 from ragamuffin.cli.utils import format_list, track
 from ragamuffin.libraries.interface import Library
+from ragamuffin.libraries.readers import LibraryReader
 from ragamuffin.libraries.utils import extract_year
 
 logger = logging.getLogger(__name__)
 
+DOWNLOAD_RETRIES = 5
+DOWNLOAD_TIMEOUT = 60
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+ZOTERO_MAX_ITEM_KEYS = 50
+
 
 class ZoteroLibrary(Library):
-    def __init__(self, library_id: str, api_key: str, collections: list[str] | None = None):
+    def __init__(  # noqa: PLR0913
+        self,
+        library_id: str,
+        api_key: str,
+        collections: list[str] | None = None,
+        workers: int = 1,
+        download_workers: int = 4,
+        sync_state_path: Path | None = None,
+        use_fulltext: bool = False,
+    ):
         self.library_id = library_id
         self.api_key = api_key
+        self.workers = workers
+        self.download_workers = download_workers
+        self.use_fulltext = use_fulltext
+        self.fulltext_versions: dict[str, int] = {}
+        # MD5 checksums of the downloaded attachment files, by attachment key
+        self.downloaded_md5s: dict[str, str] = {}
+        self._backoff_until = 0.0
+        self._backoff_lock = threading.Lock()
         self.storage_dir = Path(tempfile.gettempdir()) / "ragamuffin" / "zotero"
         self.storage_dir.mkdir(exist_ok=True, parents=True)
         self.articles: dict[str, dict] = {}
+        self.sync_state_path = sync_state_path
+        self.sync_state: dict[str, Any] | None = None
         self.zot = Zotero(
             library_id=self.library_id,
             library_type="user",
@@ -37,14 +70,161 @@ class ZoteroLibrary(Library):
         if not input_files:
             logger.error("No articles were downloaded.")
             sys.exit(2)
-        return SimpleDirectoryReader(input_files=input_files, file_metadata=self.get_file_metadata)
+        return LibraryReader(
+            input_files=input_files,
+            file_metadata=self.get_file_metadata,
+            file_extractor={".txt": ZoteroFulltextReader()},
+            num_workers=self.workers,
+        )
 
     def download_articles(self) -> None:
-        """Download articles from the Zotero library."""
+        """Download articles from the Zotero library.
+
+        If `use_fulltext` is enabled, the text already extracted by Zotero is used for the articles
+        which have it, and only the remaining PDFs are downloaded.
+        """
         self.storage_dir.mkdir(exist_ok=True)
 
+        articles = self.fetch_articles()
+        if self.use_fulltext:
+            articles = self.download_fulltexts(articles)
+
+        logger.info("Downloading articles...")
+
+        downloads = []
+        for article_metadata in articles.values():
+            name = article_metadata["name"]
+            attachment_key = article_metadata["attachment_key"]
+
+            filename = self.storage_dir / f"{name}.pdf"
+            self.articles[str(filename)] = article_metadata
+
+            if self.is_downloaded(filename, article_metadata):
+                logger.debug(f"Already downloaded: {name}")
+                continue
+
+            downloads.append((attachment_key, filename))
+
+        self.download_files(downloads)
+
+    def is_downloaded(self, filename: Path, article_metadata: dict) -> bool:
+        """Check if the downloaded file of an article matches the checksum of its attachment in Zotero.
+
+        Files downloaded before their checksums were recorded are hashed once. If Zotero has no checksum
+        for the attachment, the file size is compared instead.
+        """
+        if not filename.exists():
+            return False
+        attachment_key = article_metadata["attachment_key"]
+        md5 = article_metadata.get("attachment_md5")
+        if md5 is None:
+            return article_metadata["attachment_size"] == filename.stat().st_size
+        if attachment_key not in self.downloaded_md5s:
+            file_hash = hashlib.md5()  # noqa: S324
+            with filename.open("rb") as f:
+                while chunk := f.read(DOWNLOAD_CHUNK_SIZE):
+                    file_hash.update(chunk)
+            self.downloaded_md5s[attachment_key] = file_hash.hexdigest()
+        return self.downloaded_md5s[attachment_key] == md5
+
+    def download_fulltexts(self, articles: dict[str, dict]) -> dict[str, dict]:
+        """Save the full text indexed by Zotero for the articles which have it.
+
+        Texts are cached between runs and only downloaded again when their version changes in Zotero.
+
+        Returns:
+            The articles without a complete full text, whose PDFs need to be downloaded.
+        """
+        logger.info("Retrieving full texts indexed by Zotero...")
+        available_versions = self.zot.new_fulltext(since=0)
+        previous_versions = self.fulltext_versions
+        self.fulltext_versions = {}
+
+        remaining_articles = {}
+        for key, article_metadata in track(articles.items(), description="Downloading full texts..."):
+            attachment_key = article_metadata["attachment_key"]
+            version = available_versions.get(attachment_key)
+            filename = self.storage_dir / f"{article_metadata['name']}.txt"
+
+            is_cached = filename.exists() and previous_versions.get(attachment_key) == version
+            if version is not None and not is_cached:
+                fulltext = self.zot.fulltext_item(attachment_key)
+                if fulltext.get("indexedPages") != fulltext.get("totalPages"):
+                    logger.debug(f"Zotero indexed only part of the article: {article_metadata['name']}")
+                    version = None
+                else:
+                    tmp_filename = filename.with_name(f"{filename.name}.part")
+                    tmp_filename.write_text(fulltext["content"], encoding="utf-8")
+                    tmp_filename.replace(filename)
+
+            if version is None:
+                remaining_articles[key] = article_metadata
+                continue
+
+            self.fulltext_versions[attachment_key] = version
+            self.articles[str(filename)] = article_metadata
+
+        logger.info(f"Using full texts for {len(self.fulltext_versions)} articles.")
+        return remaining_articles
+
+    def fetch_articles(self) -> dict[str, dict]:
+        """Fetch the metadata of articles with PDF attachments, indexed by their Zotero item key.
+
+        If the library was synchronized before, only items changed since then are fetched from Zotero.
+        """
         logger.info("Retrieving your Zotero library. This may take a few minutes...")
+        library_version = self.zot.last_modified_version()
+        sync_state = self.load_sync_state()
+
+        self.fulltext_versions = sync_state.get("fulltext_versions", {}) if sync_state else {}
+        self.downloaded_md5s = sync_state.get("downloaded_md5s", {}) if sync_state else {}
+        if sync_state is None:
+            articles: dict[str, dict] = {}
+            items = self.fetch_all_items()
+            attachments = self.fetch_attachments()
+            removed_keys: set[str] = set()
+        else:
+            articles = sync_state["articles"]
+            attachments = self.fetch_attachments(since=sync_state["version"])
+            items, removed_keys = self.fetch_changed_items(since=sync_state["version"], attachments=attachments)
+            logger.info(f"Found {len(items)} changed and {len(removed_keys)} removed items since the last run.")
 
+        for key in removed_keys:
+            articles.pop(key, None)
+
+        # Checksums of the attachments which did not change are kept from the last run
+        attachment_md5s = {
+            article["attachment_key"]: article.get("attachment_md5")
+            for article in articles.values()
+            if article.get("attachment_md5")
+        }
+        attachment_md5s.update(
+            {
+                attachment["key"]: attachment["data"]["md5"]
+                for attachment in attachments
+                if attachment["data"].get("md5")
+            }
+        )
+
+        for item in items:
+            article_metadata = self.parse_article_data(item)
+            if not article_metadata["attachment_key"]:
+                logger.warning(f"Skipping, no PDF attachment found: {article_metadata['name']}")
+                logger.info(f"Zotero URL: {article_metadata['url']}")
+                articles.pop(item["key"], None)
+                continue
+            article_metadata["attachment_md5"] = attachment_md5s.get(article_metadata["attachment_key"])
+            articles[item["key"]] = article_metadata
+
+        self.sync_state = {
+            "version": library_version,
+            "collections": sorted(self.collections) if self.collections else None,
+            "articles": articles,
+        }
+        return articles
+
+    def fetch_all_items(self) -> list[dict]:
+        """Fetch all top-level items from the library or the selected collections."""
         if self.collections:
             items = []
             for collection_key in self.collections:
@@ -54,33 +234,144 @@ class ZoteroLibrary(Library):
         else:
             items = self.zot.everything(self.zot.top())
             logger.info(f"Total items: {len(items)}")
+        return items
 
-        logger.info("Downloading articles...")
+    def fetch_attachments(self, since: int = 0) -> list[dict]:
+        """Fetch the attachment items modified since the given library version, with their MD5 checksums."""
+        return self.zot.everything(self.zot.items(since=since, itemType="attachment", includeTrashed=1))
 
-        for item in track(items, description="Downloading..."):
-            # Parse the article data
-            article_metadata = self.parse_article_data(item)
-            name = article_metadata["name"]
-            attachment_key = article_metadata["attachment_key"]
-            attachment_size = article_metadata["attachment_size"]
-            url = article_metadata["url"]
+    def fetch_changed_items(self, since: int, attachments: list[dict] | None = None) -> tuple[list[dict], set[str]]:
+        """Fetch top-level items modified since the given library version.
 
-            if not attachment_key:
-                logger.warning(f"Skipping, no PDF attachment found: {name}")
-                logger.info(f"Zotero URL: {url}")
-                continue
+        Args:
+            since: The library version of the last run.
+            attachments: The attachment items modified since that version, which are fetched if not given.
 
-            filename = self.storage_dir / f"{name}.pdf"
-            self.articles[str(filename)] = article_metadata
+        Returns:
+            The changed items and the keys of items which were deleted, trashed or removed from the selected
+            collections.
+        """
+        items = self.zot.everything(self.zot.top(since=since, includeTrashed=1))
 
-            if filename.exists() and attachment_size == filename.stat().st_size:
-                logger.info(f"Already downloaded: {name}")
-                continue
+        # A replaced PDF changes the attachment, but not its parent item
+        changed_keys = {item["key"] for item in items}
+        if attachments is None:
+            attachments = self.fetch_attachments(since=since)
+        parent_keys = sorted(
+            {attachment["data"].get("parentItem") for attachment in attachments} - changed_keys - {None}
+        )
+        for start in range(0, len(parent_keys), ZOTERO_MAX_ITEM_KEYS):
+            batch_keys = parent_keys[start : start + ZOTERO_MAX_ITEM_KEYS]
+            items.extend(self.zot.items(itemKey=",".join(batch_keys), includeTrashed=1))
+
+        removed_keys = set(self.zot.deleted(since=since)["items"])
+        changed_items = []
+        for item in items:
+            in_selection = not self.collections or set(item["data"].get("collections", [])) & set(self.collections)
+            if item["data"].get("deleted") or not in_selection:
+                removed_keys.add(item["key"])
+            else:
+                changed_items.append(item)
+        return changed_items, removed_keys
+
+    def load_sync_state(self) -> dict[str, Any] | None:
+        """Load the state of the last synchronization, if it applies to the current selection of collections."""
+        if self.sync_state_path is None or not self.sync_state_path.exists():
+            return None
+
+        with self.sync_state_path.open() as f:
+            sync_state = json.load(f)
+
+        selected_collections = sorted(self.collections) if self.collections else None
+        if sync_state["collections"] != selected_collections:
+            logger.info("Selected collections have changed, retrieving the whole library.")
+            return None
+        return sync_state
+
+    def save_sync_state(self) -> None:
+        """Save the library version and articles, so the next run only needs to fetch changes.
+
+        This should be called once the articles are indexed.
+        """
+        if self.sync_state_path is None or self.sync_state is None:
+            return
+
+        self.sync_state["fulltext_versions"] = self.fulltext_versions
+        self.sync_state["downloaded_md5s"] = self.downloaded_md5s
+        self.sync_state_path.parent.mkdir(parents=True, exist_ok=True)
+        with self.sync_state_path.open("w") as f:
+            json.dump(self.sync_state, f)
 
-            # Download the file
-            with filename.open("wb") as f:
-                f.write(self.zot.file(attachment_key))
-            logger.info(f"Downloaded: {name}")
+    def download_files(self, downloads: list[tuple[str, Path]]) -> None:
+        """Download attachment files concurrently, using a pool of `download_workers` threads.
+
+        Files which could not be downloaded are removed from the list of articles.
+        """
+        if not downloads:
+            return
+
+        with requests.Session() as session, ThreadPoolExecutor(max_workers=self.download_workers) as executor:
+            adapter = HTTPAdapter(pool_maxsize=self.download_workers)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update(self.zot.default_headers())
+
+            futures = {
+                executor.submit(self.download_file, session, attachment_key, filename): (attachment_key, filename)
+                for attachment_key, filename in downloads
+            }
+            for future in track(as_completed(futures), total=len(futures), description="Downloading..."):
+                attachment_key, filename = futures[future]
+                self.downloaded_md5s.pop(attachment_key, None)
+                try:
+                    future.result()
+                except requests.RequestException as e:
+                    logger.error(f"Failed to download {filename.stem}: {e}")
+                    self.articles.pop(str(filename), None)
+                    continue
+                logger.info(f"Downloaded: {filename.stem}")
+                if md5 := self.articles.get(str(filename), {}).get("attachment_md5"):
+                    self.downloaded_md5s[attachment_key] = md5
+
+    def download_file(self, session: requests.Session, attachment_key: str, filename: Path) -> None:
+        """Download an attachment file, retrying with a backoff if the Zotero API is rate limiting requests.
+
+        The file is first written to a temporary file, which is renamed once the download is complete.
+        """
+        url = f"{self.zot.endpoint}/{self.zot.library_type}/{self.zot.library_id}/items/{attachment_key}/file"
+
+        for attempt in range(DOWNLOAD_RETRIES + 1):
+            self._wait_for_backoff()
+            with session.get(url, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+                if response.status_code in RETRY_STATUS_CODES and attempt < DOWNLOAD_RETRIES:
+                    delay = _parse_delay(response.headers.get("Retry-After")) or 2**attempt
+                    logger.debug(f"Rate limited by Zotero, retrying in {delay} seconds.")
+                    self._set_backoff(delay)
+                    continue
+                response.raise_for_status()
+
+                tmp_filename = filename.with_name(f"{filename.name}.part")
+                with tmp_filename.open("wb") as f:
+                    for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                        f.write(chunk)
+                tmp_filename.replace(filename)
+
+                # Zotero asks clients to slow down using the Backoff header
+                if backoff := _parse_delay(response.headers.get("Backoff")):
+                    self._set_backoff(backoff)
+                return
+
+    def _set_backoff(self, delay: float) -> None:
+        """Pause all downloads for the given number of seconds."""
+        with self._backoff_lock:
+            self._backoff_until = max(self._backoff_until, time.monotonic() + delay)
+
+    def _wait_for_backoff(self) -> None:
+        """Wait until the current backoff period is over."""
+        with self._backoff_lock:
+            remaining = self._backoff_until - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
 
     @staticmethod
     def get_pdf_attachment(zotero_item: dict[str, Any]) -> dict[str, Any] | None:
@@ -163,3 +454,30 @@ class ZoteroLibrary(Library):
         collections = self.zot.all_collections()
         logger.info(f"Found {len(collections)} collections.")
         return {collection["key"]: collection["data"]["name"] for collection in collections}
+
+
+class ZoteroFulltextReader(BaseReader):
+    """Read text extracted by Zotero, with a document for each page like the PDF reader creates."""
+
+    def load_data(self, file: Path, extra_info: dict | None = None) -> list[Document]:
+        """Load the documents from a full text file."""
+        # Zotero separates the pages of PDF full texts with form feeds
+        pages = file.read_text(encoding="utf-8").split("\f")
+
+        documents = []
+        for page_number, page_text in enumerate(pages, start=1):
+            if not page_text.strip():
+                continue
+            metadata = {"page_label": str(page_number)} if len(pages) > 1 else {}
+            metadata["file_name"] = file.name
+            metadata.update(extra_info or {})
+            documents.append(Document(text=page_text, extra_info=metadata))
+        return documents
+
+
+def _parse_delay(header_value: str | None) -> float | None:
+    """Parse a delay in seconds from a Retry-After or Backoff header."""
+    try:
+        return float(header_value) if header_value else None
+    except ValueError:
+        return None
@@ -0,0 +1,229 @@
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import cast
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from pydantic import PrivateAttr
+from typing_extensions import override
+
+from ragamuffin.models.text_hash import text_digest
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_CACHE_FILENAME = "embedding_cache.sqlite"
+# Number of texts looked up at a time, below the SQLite limit of 999 query parameters
+LOOKUP_BATCH_SIZE = 500
+
+
+class EmbeddingCache:
+    """A persistent cache of text embeddings, shared by all agents.
+
+    Embeddings are stored as float32 vectors in an SQLite database, keyed by the embedding model name,
+    the embedding dimension and the SHA-256 hash of the text. When the stored embeddings exceed `max_size`
+    bytes, the least recently used ones are evicted.
+    """
+
+    def __init__(self, db_path: Path, max_size: int):
+        self.db_path = db_path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    model TEXT NOT NULL,
+                    dimension INTEGER NOT NULL,
+                    text_hash TEXT NOT NULL,
+                    embedding BLOB NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (model, dimension, text_hash)
+                )
+                """
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+
+            # The total size of the embeddings is kept up to date by triggers, so it is not summed on every write
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache_size (id INTEGER PRIMARY KEY CHECK (id = 0), size INTEGER NOT NULL)"
+            )
+            self._connection.execute(
+                "INSERT OR IGNORE INTO cache_size "
+                "VALUES (0, (SELECT COALESCE(SUM(LENGTH(embedding)), 0) FROM embeddings))"
+            )
+            self._connection.execute(
+                """
+                CREATE TRIGGER IF NOT EXISTS embeddings_insert AFTER INSERT ON embeddings BEGIN
+                    UPDATE cache_size SET size = size + LENGTH(NEW.embedding);
+                END
+                """
+            )
+            self._connection.execute(
+                """
+                CREATE TRIGGER IF NOT EXISTS embeddings_update AFTER UPDATE OF embedding ON embeddings BEGIN
+                    UPDATE cache_size SET size = size + LENGTH(NEW.embedding) - LENGTH(OLD.embedding);
+                END
+                """
+            )
+            self._connection.execute(
+                """
+                CREATE TRIGGER IF NOT EXISTS embeddings_delete AFTER DELETE ON embeddings BEGIN
+                    UPDATE cache_size SET size = size - LENGTH(OLD.embedding);
+                END
+                """
+            )
+
+    @staticmethod
+    def hash_text(text: str) -> str:
+        """Calculate the key of a text in the cache."""
+        return text_digest(text)
+
+    def get_many(self, model: str, dimension: int, texts: list[str]) -> list[Embedding | None]:
+        """Look up the embeddings of the texts. Returns None for texts which are not in the cache."""
+        hashes = [self.hash_text(text) for text in texts]
+        rows = []
+        now = time.time()
+        with self._lock, self._connection:
+            for start in range(0, len(hashes), LOOKUP_BATCH_SIZE):
+                batch = hashes[start : start + LOOKUP_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows += self._connection.execute(
+                    f"SELECT text_hash, embedding FROM embeddings "  # noqa: S608
+                    f"WHERE model = ? AND dimension = ? AND text_hash IN ({placeholders})",
+                    [model, dimension, *batch],
+                ).fetchall()
+                self._connection.execute(
+                    f"UPDATE embeddings SET last_used = ? "  # noqa: S608
+                    f"WHERE model = ? AND dimension = ? AND text_hash IN ({placeholders})",
+                    [now, model, dimension, *batch],
+                )
+
+        found = {text_hash: np.frombuffer(blob, dtype=np.float32).tolist() for text_hash, blob in rows}
+        embeddings = [found.get(text_hash) for text_hash in hashes]
+        hit_count = sum(embedding is not None for embedding in embeddings)
+        self.hits += hit_count
+        self.misses += len(embeddings) - hit_count
+        return embeddings
+
+    def put_many(self, model: str, dimension: int, texts: list[str], embeddings: list[Embedding]) -> None:
+        """Store the embeddings of the texts and evict old embeddings if the cache is too large."""
+        now = time.time()
+        rows = [
+            (model, dimension, self.hash_text(text), np.asarray(embedding, dtype=np.float32).tobytes(), now)
+            for text, embedding in zip(texts, embeddings, strict=True)
+        ]
+        with self._lock, self._connection:
+            # An upsert rather than a replace, since replacing a row does not fire the delete trigger
+            self._connection.executemany(
+                """
+                INSERT INTO embeddings VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (model, dimension, text_hash)
+                DO UPDATE SET embedding = excluded.embedding, last_used = excluded.last_used
+                """,
+                rows,
+            )
+            self._evict()
+
+    def _evict(self) -> None:
+        """Delete the least recently used embeddings which do not fit in the maximum cache size."""
+        (size,) = self._connection.execute("SELECT size FROM cache_size").fetchone()
+        excess = size - self.max_size
+        if excess <= 0:
+            return
+
+        evicted_rows = []
+        cursor = self._connection.execute("SELECT rowid, LENGTH(embedding) FROM embeddings ORDER BY last_used, rowid")
+        for rowid, length in cursor:
+            if excess <= 0:
+                break
+            evicted_rows.append((rowid,))
+            excess -= length
+        cursor.close()
+        self._connection.executemany("DELETE FROM embeddings WHERE rowid = ?", evicted_rows)
+
+    def get_size(self) -> int:
+        """Get the total size of the stored embeddings in bytes."""
+        with self._lock:
+            (size,) = self._connection.execute("SELECT size FROM cache_size").fetchone()
+        return size
+
+    def log_stats(self) -> None:
+        """Report the cache hit rate since the cache was opened."""
+        total = self.hits + self.misses
+        if total == 0:
+            return
+        logger.info(
+            f"Embedding cache: {self.hits} hits, {self.misses} misses ({self.hits / total:.1%} hit rate), "
+            f"{self.get_size() / 1024 / 1024:.1f} MiB stored."
+        )
+
+
+class CachedEmbedding(BaseEmbedding):
+    """An embedding model which looks up text embeddings in an `EmbeddingCache` before computing them.
+
+    Query embeddings are not cached.
+    """
+
+    _embed_model: BaseEmbedding = PrivateAttr()
+    _embedding_dimension: int = PrivateAttr()
+    _cache: EmbeddingCache = PrivateAttr()
+
+    def __init__(self, embed_model: BaseEmbedding, model_name: str, embedding_dimension: int, cache: EmbeddingCache):
+        super().__init__(model_name=model_name, embed_batch_size=embed_model.embed_batch_size)
+        self._embed_model = embed_model
+        self._embedding_dimension = embedding_dimension
+        self._cache = cache
+
+    @property
+    def embed_model(self) -> BaseEmbedding:
+        """The embedding model used for cache misses."""
+        return self._embed_model
+
+    @property
+    def cache(self) -> EmbeddingCache:
+        """The embedding cache."""
+        return self._cache
+
+    @classmethod
+    @override
+    def class_name(cls: type["CachedEmbedding"]) -> str:
+        return "CachedEmbedding"
+
+    @override
+    def _get_query_embedding(self, query: str) -> Embedding:
+        return self.embed_model.get_query_embedding(query)
+
+    @override
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        return await self.embed_model.aget_query_embedding(query)
+
+    @override
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embeddings([text])[0]
+
+    @override
+    def _get_text_embeddings(self, texts: list[str]) -> list[Embedding]:
+        embeddings = self._cache.get_many(self.model_name, self._embedding_dimension, texts)
+        missing_indices = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing_indices:
+            missing_texts = [texts[i] for i in missing_indices]
+            new_embeddings = self.embed_model.get_text_embedding_batch(missing_texts)
+            self._cache.put_many(self.model_name, self._embedding_dimension, missing_texts, new_embeddings)
+
+            # Return embeddings with the precision of the cache, so the results do not depend on cache hits
+            for i, embedding in zip(missing_indices, new_embeddings, strict=True):
+                embeddings[i] = np.asarray(embedding, dtype=np.float32).tolist()
+        return cast(list[Embedding], embeddings)
+
+    @override
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embedding(text)
@@ -0,0 +1,110 @@
+import logging
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any
+
+import torch
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from pydantic import PrivateAttr
+from typing_extensions import override
+
+from ragamuffin.error_handling import ensure_int
+from ragamuffin.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+# The model loaded in each worker process
+_worker_model: BaseEmbedding | None = None
+
+
+class EmbeddingPool(BaseEmbedding):
+    """Compute embeddings with a local model in a pool of worker processes.
+
+    Each worker loads its own copy of the model. Batches of texts are split into one shard per worker
+    and the embeddings are returned in the order of the texts.
+    """
+
+    _num_workers: int = PrivateAttr()
+    _executor: ProcessPoolExecutor | None = PrivateAttr(default=None)
+
+    def __init__(self, model_name: str, num_workers: int, **kwargs: Any):
+        # Let each call receive a whole batch of texts, so it can be split between the workers
+        kwargs.setdefault("embed_batch_size", 2048)
+        super().__init__(model_name=model_name, **kwargs)
+        self._num_workers = num_workers
+
+    @classmethod
+    @override
+    def class_name(cls: type["EmbeddingPool"]) -> str:
+        return "EmbeddingPool"
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        """The worker processes, started when they are first needed."""
+        if self._executor is None:
+            logger.info(f"Starting {self._num_workers} embedding worker processes...")
+            self._executor = ProcessPoolExecutor(
+                max_workers=self._num_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.model_name, self._num_workers),
+            )
+        return self._executor
+
+    def close(self) -> None:
+        """Stop the worker processes."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    @override
+    def _get_query_embedding(self, query: str) -> Embedding:
+        return self.executor.submit(_embed_query, query).result()
+
+    @override
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        return self._get_query_embedding(query)
+
+    @override
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embeddings([text])[0]
+
+    @override
+    def _get_text_embeddings(self, texts: list[str]) -> list[Embedding]:
+        if not texts:
+            return []
+        shard_size = math.ceil(len(texts) / self._num_workers)
+        shards = [texts[start : start + shard_size] for start in range(0, len(texts), shard_size)]
+        return [embedding for shard in self.executor.map(_embed_texts, shards) for embedding in shard]
+
+
+def _init_worker(model_name: str, num_workers: int) -> None:
+    """Load the embedding model in a worker process."""
+    global _worker_model  # noqa: PLW0603
+    # Imported here, since the model picker depends on this module
+    from ragamuffin.models.model_picker import get_embedding_model_by_name
+
+    # Share the CPU cores between the workers, in PyTorch and in ONNX Runtime unless its threads are set
+    threads = max(1, (os.cpu_count() or 1) // num_workers)
+    torch.set_num_threads(threads)
+    if ensure_int(get_settings().get("onnx_threads")) == 0:
+        os.environ["RAGAMUFFIN_ONNX_THREADS"] = str(threads)
+    _worker_model = get_embedding_model_by_name(model_name)
+
+
+def _get_worker_model() -> BaseEmbedding:
+    if _worker_model is None:
+        raise RuntimeError("The embedding model was not loaded in the worker process.")
+    return _worker_model
+
+
+def _embed_texts(texts: list[str]) -> list[Embedding]:
+    """Compute the embeddings of texts in a worker process."""
+    return _get_worker_model().get_text_embedding_batch(texts)
+
+
+def _embed_query(query: str) -> Embedding:
+    """Compute the embedding of a query in a worker process."""
+    return _get_worker_model().get_query_embedding(query)
@@ -1,76 +1,221 @@
+import html
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+
 import nltk
 import numpy as np
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-from nltk.tokenize import sent_tokenize
-from sklearn.metrics.pairwise import cosine_similarity
+from nltk.tokenize import PunktTokenizer
+
+from ragamuffin.error_handling import ensure_int
+from ragamuffin.models.model_picker import get_highlight_embedding_model
+from ragamuffin.models.text_hash import text_digest, text_hash64
+from ragamuffin.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SentenceEmbeddings:
+    """The sentences of a text, as character spans, with their unit-length embeddings."""
+
+    spans: np.ndarray
+    embeddings: np.ndarray
+
+
+class SentenceStore(ABC):
+    """Sentence embeddings of the nodes of an agent, computed when the agent was generated."""
+
+    model_name: str
+
+    @abstractmethod
+    def get(self, node_id: str) -> SentenceEmbeddings | None:
+        """Get the sentence embeddings of a node, if they were computed."""
+
+    @abstractmethod
+    def get_unchanged(self, node_id: str, text_hash: int) -> SentenceEmbeddings | None:
+        """Get the sentence embeddings of a node, if they were computed for a text with the given hash."""
+
+    @staticmethod
+    def hash_text(text: str) -> int:
+        """Get a 64-bit hash of a text, which is stable between runs."""
+        return text_hash64(text)
+
+
+class SentenceCache:
+    """An LRU cache of the sentences and sentence embeddings of recently highlighted texts.
+
+    Entries are keyed by the hash of the text, so a chunk which is a source of many answers
+    is only split and embedded once.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, SentenceEmbeddings] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, text: str) -> SentenceEmbeddings | None:
+        """Get the sentences of a text, if they are in the cache."""
+        key = text_digest(text)
+        with self._lock:
+            sentences = self._entries.get(key)
+            if sentences is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return sentences
+
+    def put(self, text: str, sentences: SentenceEmbeddings) -> None:
+        """Add the sentences of a text, evicting the least recently used texts beyond `max_entries`."""
+        with self._lock:
+            self._entries[text_digest(text)] = sentences
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def log_stats(self) -> None:
+        """Report the cache hit rate since the cache was created, at debug level."""
+        total = self.hits + self.misses
+        if total == 0:
+            return
+        logger.debug(
+            f"Sentence cache: {self.hits} hits, {self.misses} misses ({self.hits / total:.1%} hit rate), "
+            f"{len(self._entries)} texts cached."
+        )
 
 
 class SemanticHighlighter:
-    def __init__(self):
-        # Load the embedding model
-        model_name = "all-mpnet-base-v2"
-        self.model = HuggingFaceEmbedding(model_name=model_name, embed_batch_size=32)
+    def __init__(self, sentence_store: SentenceStore | None = None):
+        """Load the embedding model and the sentence tokenizer.
+
+        The model is set by `RAGAMUFFIN_HIGHLIGHT_MODEL`, and can be the retrieval embedding model.
+
+        Args:
+            sentence_store: Precomputed sentence embeddings, used for the nodes they contain.
+        """
+        self.model_name, self.model, self.is_retrieval_model = get_highlight_embedding_model()
+        cache_size = ensure_int(get_settings().get("highlight_cache_size"))
+        self.sentence_cache = SentenceCache(cache_size) if cache_size > 0 else None
         # Download the NLTK tokenizer
         nltk.download("punkt_tab", quiet=True)
+        self.tokenizer = PunktTokenizer("english")
 
-    def highlight_multiple(self, query: str, sources: list[str], max_length: int = 500) -> list[str]:
+        self.sentence_store = sentence_store
+        if sentence_store is not None and sentence_store.model_name != self.model_name:
+            logger.warning(
+                f"Stored sentence embeddings were computed with {sentence_store.model_name} "
+                f"instead of {self.model_name}, they are not used for highlighting."
+            )
+            self.sentence_store = None
+
+    def highlight_multiple(
+        self,
+        query: str,
+        sources: list[str],
+        max_length: int = 500,
+        node_ids: list[str] | None = None,
+        query_embedding: list[float] | None = None,
+    ) -> list[str]:
         """Highlight sentences in multiple source texts based on their similarity to the query.
 
+        Sentence embeddings of nodes in the sentence store and of recently highlighted texts are not
+        computed again, so only the query and the sentences of other sources are embedded.
+
         Args:
             query: The search query string.
             sources: List of source texts to highlight.
             max_length: Maximum length of the returned highlighted text for each source.
+            node_ids: IDs of the nodes of the source texts, used to look up their stored sentence embeddings.
+            query_embedding: The embedding of the query computed during retrieval. It is only used when
+                the highlighter uses the retrieval embedding model.
 
         Returns:
             List of HTML strings with highlighted sentences for each source.
         """
-        # Split sentences from all sources and keep track of indices
-        all_sentences = []
-        source_sentence_indices = []
-        start_idx = 0
-
-        for source in sources:
-            sentences = self._split_sentences(source)
-            all_sentences.extend(sentences)
-            end_idx = start_idx + len(sentences)
-            source_sentence_indices.append((start_idx, end_idx))
-            start_idx = end_idx
+        sentence_embeddings = [
+            self._get_stored_sentences(source, node_ids[i] if node_ids else None) for i, source in enumerate(sources)
+        ]
+        if self.sentence_cache is not None:
+            sentence_embeddings = [
+                sentences if sentences is not None else self.sentence_cache.get(source)
+                for source, sentences in zip(sources, sentence_embeddings, strict=True)
+            ]
 
-        if not all_sentences:
-            return []
+        if query_embedding is None or not self.is_retrieval_model:
+            query_embedding = self.model.get_query_embedding(query)
+        query_vector = self._normalize(np.array([query_embedding], dtype=np.float32))[0]
 
-        # Encode query and all sentences together
-        all_texts = [query, *all_sentences]
-        embeddings = self._generate_text_embeddings(all_texts)
-        query_embedding = embeddings[0]
-        sentence_embeddings = embeddings[1:]
-        similarities = cosine_similarity([query_embedding], sentence_embeddings).flatten()
+        # Encode the sentences of the sources which are not stored or cached
+        missing = [i for i, embeddings in enumerate(sentence_embeddings) if embeddings is None]
+        for i, sentences in zip(missing, self.embed_sentences([sources[i] for i in missing]), strict=True):
+            sentence_embeddings[i] = sentences
+            if self.sentence_cache is not None:
+                self.sentence_cache.put(sources[i], sentences)
+        if self.sentence_cache is not None:
+            self.sentence_cache.log_stats()
 
         # Process each source separately
         results = []
-        for start, end in source_sentence_indices:
-            sentences_slice = all_sentences[start:end]
-            similarities_slice = similarities[start:end]
+        for source, source_sentences in zip(sources, sentence_embeddings, strict=True):
+            if source_sentences is None or len(source_sentences.spans) == 0:
+                results.append("")
+                continue
+            sentences_slice = [source[start:end] for start, end in source_sentences.spans]
+            similarities_slice = source_sentences.embeddings.astype(np.float32) @ query_vector
             selected_indices = self._select_trimmed_sentences(sentences_slice, similarities_slice, max_length)
             result = self._apply_markup(sentences_slice, similarities_slice, selected_indices)
             results.append(result)
 
         return results
 
-    def _generate_text_embeddings(self, texts: list[str]) -> list[list[float]]:
-        """Generate embeddings for the input texts."""
-        return self.model.get_text_embedding_batch(texts)
+    def embed_sentences(self, texts: list[str]) -> list[SentenceEmbeddings]:
+        """Split texts into sentences and compute the unit-length embeddings of the sentences."""
+        spans = [self._split_sentences(text) for text in texts]
+        sentences = [
+            text[start:end] for text, text_spans in zip(texts, spans, strict=True) for start, end in text_spans
+        ]
+        embeddings = self._generate_text_embeddings(sentences)
+
+        results = []
+        start_idx = 0
+        for text_spans in spans:
+            end_idx = start_idx + len(text_spans)
+            results.append(SentenceEmbeddings(text_spans, embeddings[start_idx:end_idx]))
+            start_idx = end_idx
+        return results
+
+    def _get_stored_sentences(self, text: str, node_id: str | None) -> SentenceEmbeddings | None:
+        """Get the stored sentence embeddings of a node, if they were computed for its text."""
+        if self.sentence_store is None or node_id is None:
+            return None
+        return self.sentence_store.get_unchanged(node_id, self.sentence_store.hash_text(text))
+
+    def _generate_text_embeddings(self, texts: list[str]) -> np.ndarray:
+        """Generate unit-length embeddings for the input texts."""
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        return self._normalize(np.array(self.model.get_text_embedding_batch(texts), dtype=np.float32))
+
+    @staticmethod
+    def _normalize(embeddings: np.ndarray) -> np.ndarray:
+        """Scale embeddings to unit length."""
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return np.divide(embeddings, norms, out=np.zeros_like(embeddings), where=norms > 0)
 
-    def _split_sentences(self, text: str) -> list[str]:
+    def _split_sentences(self, text: str) -> np.ndarray:
         """Tokenize the input text into sentences.
 
         Args:
             text: The text to split into sentences.
 
         Returns:
-            A list of sentences.
+            The start and end offsets of the sentences in the text.
         """
-        return sent_tokenize(text)
+        return np.array(list(self.tokenizer.span_tokenize(text)), dtype=np.int64).reshape(-1, 2)
 
     def _select_trimmed_sentences(self, sentences: list[str], similarities: np.ndarray, max_length: int) -> list[int]:
         """Select indices of sentences around the highest similarity sentence while respecting max_length.
@@ -138,7 +283,7 @@ class SemanticHighlighter:
             sentence = sentences[idx]
             similarity = similarities[idx]
             similarity_class = int(min(similarity * 10, 9))
-            marked_up_sentences.append(f'<span class="similarity-{similarity_class}">{sentence}</span>')
+            marked_up_sentences.append(f'<span class="similarity-{similarity_class}">{html.escape(sentence)}</span>')
 
         marked_text = " ".join(marked_up_sentences)
 
@@ -1,13 +1,24 @@
+from pathlib import Path
+
 from llama_index.core import Settings
 from llama_index.core.base.embeddings.base import BaseEmbedding
 from llama_index.core.llms.llm import LLM
 from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-from llama_index.embeddings.openai import OpenAIEmbedding
 from llama_index.llms.openai import OpenAI
 
-from ragamuffin.error_handling import ConfigurationError
+from ragamuffin.error_handling import ConfigurationError, ensure_int
+from ragamuffin.models.embedding_cache import EMBEDDING_CACHE_FILENAME, CachedEmbedding, EmbeddingCache
+from ragamuffin.models.embedding_pool import EmbeddingPool
+from ragamuffin.models.onnx_embedding import get_onnx_embedding_model
+from ragamuffin.models.openai_embedding import ScheduledOpenAIEmbedding
 from ragamuffin.settings import get_settings
 
+# Embedding providers which compute embeddings on this machine
+LOCAL_EMBEDDING_PROVIDERS = ("huggingface.co/", "onnx/")
+
+# The pool of worker processes computing the embeddings configured for LlamaIndex, if there is one
+_embedding_pool: EmbeddingPool | None = None
+
 
 def get_llm_by_name(name: str) -> LLM:
     """Get the LLM model by name."""
@@ -31,17 +42,87 @@ def get_embedding_model_by_name(name: str) -> BaseEmbedding:
     if provider == "huggingface.co":
         return HuggingFaceEmbedding(model_name=model_name)
 
+    if provider == "onnx":
+        settings = get_settings()
+        return get_onnx_embedding_model(
+            model_name,
+            threads=ensure_int(settings.get("onnx_threads")),
+            batch_size=ensure_int(settings.get("onnx_batch_size")),
+        )
+
     if provider == "openai":
-        return OpenAIEmbedding(model=model_name)
+        settings = get_settings()
+        return ScheduledOpenAIEmbedding(
+            model=model_name,
+            max_batch_tokens=ensure_int(settings.get("openai_embed_batch_tokens")),
+            max_concurrency=ensure_int(settings.get("openai_embed_concurrency")),
+        )
 
     raise ConfigurationError(f"Unsupported embedding provider: {provider}")
 
 
-def configure_llamaindex_embedding_model() -> None:
-    """Configure the LlamaIndex embeddings for RAG."""
+def get_highlight_embedding_model() -> tuple[str, BaseEmbedding, bool]:
+    """Get the embedding model which highlights the sources of answers.
+
+    When `RAGAMUFFIN_HIGHLIGHT_MODEL` is "retrieval" or the retrieval embedding model, the model configured
+    with `configure_llamaindex_embedding_model` is shared, so it is only loaded once.
+
+    Returns:
+        The name of the model, the model, and whether it is the retrieval embedding model.
+    """
+    settings = get_settings()
+    model_name = str(settings.get("highlight_model"))
+    retrieval_model_name = str(settings.get("embedding_model"))
+    if model_name.lower() in ("retrieval", retrieval_model_name.lower()):
+        return retrieval_model_name, Settings.embed_model, True
+
+    embed_model = get_embedding_model_by_name(model_name)
+    if settings.get("highlight_disk_cache"):
+        # The dimension is part of the cache key, so it is measured once
+        embedding_dimension = len(embed_model.get_text_embedding("dimension"))
+        embed_model = get_cached_embedding_model(embed_model, model_name, embedding_dimension)
+    return model_name, embed_model, False
+
+
+def get_cached_embedding_model(embed_model: BaseEmbedding, model_name: str, embedding_dimension: int) -> BaseEmbedding:
+    """Look up the text embeddings of the model in the cache shared by all agents, if the cache is enabled."""
+    settings = get_settings()
+    cache_size = ensure_int(settings.get("embedding_cache_size"))
+    if cache_size <= 0:
+        return embed_model
+    cache_path = Path(str(settings.get("data_dir"))) / EMBEDDING_CACHE_FILENAME
+    cache = EmbeddingCache(cache_path, max_size=cache_size * 1024 * 1024)
+    return CachedEmbedding(embed_model, model_name, embedding_dimension, cache)
+
+
+def configure_llamaindex_embedding_model(embed_workers: int = 1) -> None:
+    """Configure the LlamaIndex embeddings for RAG.
+
+    Args:
+        embed_workers: Number of processes used to compute embeddings with a local model.
+            Stop them with `close_embedding_pool` when the embeddings are computed.
+    """
+    global _embedding_pool  # noqa: PLW0603
+    close_embedding_pool()
+
     settings = get_settings()
     # Configure chunking settings
     Settings.chunk_size = 256
     Settings.chunk_overlap = 48
     # Set the embedding model
-    Settings.embed_model = get_embedding_model_by_name(str(settings.get("embedding_model")))
+    model_name = str(settings.get("embedding_model"))
+    embed_model: BaseEmbedding
+    if embed_workers > 1 and model_name.lower().startswith(LOCAL_EMBEDDING_PROVIDERS):
+        embed_model = _embedding_pool = EmbeddingPool(model_name, num_workers=embed_workers)
+    else:
+        embed_model = get_embedding_model_by_name(model_name)
+
+    # Look up previously computed embeddings in the cache shared by all agents
+    embedding_dimension = ensure_int(settings.get("embedding_dimension"))
+    Settings.embed_model = get_cached_embedding_model(embed_model, model_name, embedding_dimension)
+
+
+def close_embedding_pool() -> None:
+    """Stop the worker processes of the embedding model configured for LlamaIndex, if it has any."""
+    if _embedding_pool is not None:
+        _embedding_pool.close()
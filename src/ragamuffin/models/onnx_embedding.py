@@ -0,0 +1,111 @@
+import logging
+import platform
+import re
+import shutil
+from pathlib import Path
+
+import numpy as np
+from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+from llama_index.embeddings.huggingface.utils import (
+    get_query_instruct_for_model_name,
+    get_text_instruct_for_model_name,
+)
+from sentence_transformers import SentenceTransformer
+
+from ragamuffin.error_handling import ConfigurationError, MuffinError
+from ragamuffin.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+QUANTIZED_MODEL_FILE = "onnx/model_qint8.onnx"
+
+# Minimum cosine similarity between the embeddings of the quantized and the fp32 model
+MIN_QUANTIZED_SIMILARITY = 0.95
+SAMPLE_TEXTS = [
+    "All human beings are born free and equal in dignity and rights.",
+    "The quick brown fox jumps over the lazy dog.",
+    "def get_settings() -> dict: return settings",
+    "Retrieval-augmented generation combines a language model with a search index.",
+]
+
+
+def get_onnx_embedding_model(model_name: str, threads: int = 0, batch_size: int = 32) -> HuggingFaceEmbedding:
+    """Get a Hugging Face embedding model running in ONNX Runtime with dynamic int8 quantization.
+
+    The model is exported and quantized the first time it is used, and stored in the data directory.
+
+    Args:
+        model_name: The name of the model on the Hugging Face Hub.
+        threads: The number of threads used by ONNX Runtime. Uses all cores if 0.
+        batch_size: The number of texts embedded together.
+    """
+    try:
+        import onnxruntime
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+    except ImportError as e:
+        raise ConfigurationError(
+            "The ONNX embedding backend requires ONNX Runtime. Install it with: pip install 'optimum[onnxruntime]'"
+        ) from e
+
+    model_slug = re.sub(r"[^\w\-]", "_", model_name)
+    export_dir = Path(str(get_settings().get("data_dir"))) / "onnx" / model_slug
+    if not (export_dir / QUANTIZED_MODEL_FILE).exists():
+        logger.info(f"Exporting {model_name} to ONNX with int8 quantization...")
+        tmp_dir = export_dir.with_name(f"{export_dir.name}.tmp")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        onnx_model = SentenceTransformer(model_name, device="cpu", backend="onnx")
+        onnx_model.save(str(tmp_dir))
+        quantization_config = "arm64" if platform.machine().lower() in ("arm64", "aarch64") else "avx2"
+        export_dynamic_quantized_onnx_model(onnx_model, quantization_config, str(tmp_dir), file_suffix="qint8")
+
+        check_quantized_model(SentenceTransformer(model_name, device="cpu"), load_quantized_model(tmp_dir))
+        shutil.rmtree(export_dir, ignore_errors=True)
+        tmp_dir.replace(export_dir)
+
+    session_options = onnxruntime.SessionOptions()
+    session_options.intra_op_num_threads = threads
+
+    return HuggingFaceEmbedding(
+        model_name=str(export_dir),
+        # Instructions are looked up by the original model name
+        query_instruction=get_query_instruct_for_model_name(model_name),
+        text_instruction=get_text_instruct_for_model_name(model_name),
+        embed_batch_size=batch_size,
+        device="cpu",
+        backend="onnx",
+        model_kwargs={
+            "file_name": QUANTIZED_MODEL_FILE,
+            "provider": "CPUExecutionProvider",
+            "session_options": session_options,
+        },
+    )
+
+
+def load_quantized_model(model_dir: Path) -> SentenceTransformer:
+    """Load an exported, quantized model."""
+    return SentenceTransformer(
+        str(model_dir), device="cpu", backend="onnx", model_kwargs={"file_name": QUANTIZED_MODEL_FILE}
+    )
+
+
+def check_quantized_model(fp32_model: SentenceTransformer, quantized_model: SentenceTransformer) -> float:
+    """Check that the quantized model produces embeddings close to the fp32 model.
+
+    Returns:
+        The lowest cosine similarity between the embeddings of the two models for the sample texts.
+
+    Raises:
+        MuffinError: If the embeddings of the quantized model are too far from the fp32 model.
+    """
+    fp32_embeddings = fp32_model.encode(SAMPLE_TEXTS, normalize_embeddings=True)
+    quantized_embeddings = quantized_model.encode(SAMPLE_TEXTS, normalize_embeddings=True)
+    similarity = float(np.min(np.sum(fp32_embeddings * quantized_embeddings, axis=1)))
+
+    if similarity < MIN_QUANTIZED_SIMILARITY:
+        raise MuffinError(
+            f"The quantized model differs too much from the fp32 model (cosine similarity {similarity:.4f}). "
+            "Please use the huggingface.co provider for this model."
+        )
+    logger.info(f"Quantized model checked against the fp32 model (cosine similarity {similarity:.4f}).")
+    return similarity
@@ -0,0 +1,236 @@
+import asyncio
+import logging
+import re
+import threading
+import time
+from typing import Any
+
+import httpx
+import openai
+from llama_index.core.base.embeddings.base import Embedding
+from llama_index.core.utils import get_tokenizer
+from llama_index.embeddings.openai import OpenAIEmbedding
+from openai import AsyncOpenAI
+from pydantic import Field, PrivateAttr
+from typing_extensions import override
+
+logger = logging.getLogger(__name__)
+
+# The OpenAI API accepts at most this many inputs in a single request
+OPENAI_MAX_BATCH_SIZE = 2048
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class ScheduledOpenAIEmbedding(OpenAIEmbedding):
+    """OpenAI embeddings which are requested concurrently, in batches packed by token count.
+
+    The number of concurrent requests is halved when the API responds with 429 (Too Many Requests)
+    and grows again as requests succeed. When the rate limit headers show that the remaining tokens
+    or requests are used up, new requests wait until the limit is reset.
+
+    All requests are sent from one event loop in a background thread, so the client and the concurrency
+    limit are kept between calls.
+    """
+
+    max_batch_tokens: int = Field(default=16384, description="Maximum number of tokens in a request.", gt=0)
+    max_concurrency: int = Field(default=8, description="Maximum number of concurrent requests.", gt=0)
+
+    _loop: asyncio.AbstractEventLoop | None = PrivateAttr(default=None)
+    _loop_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _request_client: AsyncOpenAI | None = PrivateAttr(default=None)
+    _limiter: "AdaptiveConcurrencyLimiter | None" = PrivateAttr(default=None)
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        kwargs.setdefault("embed_batch_size", OPENAI_MAX_BATCH_SIZE)
+        super().__init__(*args, **kwargs)
+
+    @classmethod
+    @override
+    def class_name(cls: type["ScheduledOpenAIEmbedding"]) -> str:
+        return "ScheduledOpenAIEmbedding"
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """The event loop which sends the requests, started on first use."""
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="openai-embedding", daemon=True).start()
+            return self._loop
+
+    def close(self) -> None:
+        """Close the client and stop the event loop."""
+        with self._loop_lock:
+            if self._loop is None:
+                return
+            if self._request_client is not None:
+                asyncio.run_coroutine_threadsafe(self._request_client.close(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop = None
+            self._request_client = None
+            self._limiter = None
+
+    @override
+    def _get_text_embeddings(self, texts: list[str]) -> list[Embedding]:
+        return asyncio.run_coroutine_threadsafe(self._embed_texts(texts), self.loop).result()
+
+    @override
+    async def _aget_text_embeddings(self, texts: list[str]) -> list[Embedding]:
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(self._embed_texts(texts), self.loop))
+
+    async def _embed_texts(self, texts: list[str]) -> list[Embedding]:
+        """Request the embeddings of the texts concurrently, running in the event loop of the model."""
+        if self._request_client is None or self._limiter is None:
+            # Retries are handled by the scheduler, so they can adapt the concurrency
+            credentials = {**self._get_credential_kwargs(is_async=True), "max_retries": 0}
+            self._request_client = AsyncOpenAI(**credentials)
+            self._limiter = AdaptiveConcurrencyLimiter(self.max_concurrency)
+        client, limiter = self._request_client, self._limiter
+
+        texts = [text.replace("\n", " ") for text in texts]
+        batches = self.pack_batches(texts)
+        embeddings: list[Embedding] = [[] for _ in texts]
+        batch_embeddings = await asyncio.gather(
+            *(self._embed_batch(client, limiter, [texts[i] for i in batch]) for batch in batches)
+        )
+
+        for batch, batch_result in zip(batches, batch_embeddings, strict=True):
+            for i, embedding in zip(batch, batch_result, strict=True):
+                embeddings[i] = embedding
+        return embeddings
+
+    def pack_batches(self, texts: list[str]) -> list[list[int]]:
+        """Group the texts into batches which fit in `max_batch_tokens`.
+
+        Returns:
+            The indices of the texts in each batch.
+        """
+        tokenizer = get_tokenizer()
+        batches: list[list[int]] = []
+        batch_tokens = 0
+        for i, text in enumerate(texts):
+            tokens = len(tokenizer(text))
+            if (
+                not batches
+                or batch_tokens + tokens > self.max_batch_tokens
+                or len(batches[-1]) >= OPENAI_MAX_BATCH_SIZE
+            ):
+                batches.append([])
+                batch_tokens = 0
+            batches[-1].append(i)
+            batch_tokens += tokens
+        return batches
+
+    async def _embed_batch(
+        self, client: AsyncOpenAI, limiter: "AdaptiveConcurrencyLimiter", texts: list[str]
+    ) -> list[Embedding]:
+        """Request the embeddings of a batch of texts, retrying if the request fails."""
+        for attempt in range(self.max_retries + 1):
+            await limiter.acquire()
+            try:
+                response = await client.embeddings.with_raw_response.create(
+                    input=texts, model=self._text_engine, **self.additional_kwargs
+                )
+            except (openai.APIStatusError, openai.APIConnectionError) as e:
+                is_rate_limited = isinstance(e, openai.RateLimitError)
+                await limiter.release(is_rate_limited=is_rate_limited)
+                is_retryable = not isinstance(e, openai.APIStatusError) or e.status_code in RETRY_STATUS_CODES
+                if not is_retryable or attempt == self.max_retries:
+                    raise
+
+                headers = e.response.headers if isinstance(e, openai.APIStatusError) else httpx.Headers()
+                delay = _parse_retry_after(headers) or 2**attempt
+                logger.debug(f"Embedding request failed ({e}), retrying in {delay:.1f} seconds...")
+                if is_rate_limited:
+                    limiter.pause(delay)
+                else:
+                    await asyncio.sleep(delay)
+                continue
+
+            await limiter.release(is_rate_limited=False)
+            limiter.pause(_get_rate_limit_delay(response.headers, self.max_batch_tokens))
+            data = sorted(response.parse().data, key=lambda item: item.index)
+            return [item.embedding for item in data]
+
+        raise AssertionError("Unreachable")
+
+
+class AdaptiveConcurrencyLimiter:
+    """Limit the number of concurrent requests, decreasing the limit when requests are rate limited.
+
+    The limit is halved after each rate limited request and increased by one after a full limit's worth
+    of consecutive successful requests.
+    """
+
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max_concurrency
+        self.limit = max_concurrency
+        self.in_flight = 0
+        self._successes = 0
+        self._resume_at = 0.0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self) -> None:
+        """Wait until a request can be sent."""
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+
+        while (delay := self._resume_at - time.monotonic()) > 0:
+            await asyncio.sleep(delay)
+
+    async def release(self, is_rate_limited: bool) -> None:
+        """Record the result of a request and let the next request through."""
+        async with self._condition:
+            self.in_flight -= 1
+            if is_rate_limited:
+                self.limit = max(1, self.limit // 2)
+                self._successes = 0
+                logger.debug(f"Rate limited, reducing embedding request concurrency to {self.limit}.")
+            else:
+                self._successes += 1
+                if self._successes >= self.limit and self.limit < self.max_concurrency:
+                    self.limit += 1
+                    self._successes = 0
+            self._condition.notify_all()
+
+    def pause(self, delay: float) -> None:
+        """Delay all new requests by the given number of seconds."""
+        if delay > 0:
+            self._resume_at = max(self._resume_at, time.monotonic() + delay)
+
+
+def _parse_retry_after(headers: httpx.Headers) -> float | None:
+    """Get the delay requested by the server in the headers of a rate limited response."""
+    if "retry-after-ms" in headers:
+        return float(headers["retry-after-ms"]) / 1000
+    if "retry-after" in headers:
+        try:
+            return float(headers["retry-after"])
+        except ValueError:
+            return None
+    return _parse_duration(headers.get("x-ratelimit-reset-tokens"))
+
+
+def _get_rate_limit_delay(headers: httpx.Headers, batch_tokens: int) -> float:
+    """Get the time to wait before the next request, if the rate limit is about to be reached."""
+    delay = 0.0
+    remaining_requests = headers.get("x-ratelimit-remaining-requests")
+    if remaining_requests is not None and int(remaining_requests) <= 0:
+        delay = max(delay, _parse_duration(headers.get("x-ratelimit-reset-requests")) or 0.0)
+
+    remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+    if remaining_tokens is not None and int(remaining_tokens) < batch_tokens:
+        delay = max(delay, _parse_duration(headers.get("x-ratelimit-reset-tokens")) or 0.0)
+    return delay
+
+
+def _parse_duration(value: str | None) -> float | None:
+    """Parse a duration such as '1m30s' or '250ms', used by the rate limit headers, into seconds."""
+    if not value:
+        return None
+    units = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+    if not parts:
+        return None
+    return sum(float(number) * units[unit] for number, unit in parts)
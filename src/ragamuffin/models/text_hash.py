@@ -0,0 +1,11 @@
+import hashlib
+
+
+def text_digest(text: str) -> str:
+    """Get the SHA-256 hex digest of a text, used as the key of cached embeddings."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def text_hash64(text: str) -> int:
+    """Get a 64-bit hash of a text, which is stable between runs."""
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "little")
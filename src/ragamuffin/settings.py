@@ -12,22 +12,98 @@ def get_settings() -> dict[str, str | int | bool | None]:
         # Local model: "huggingface.co/BAAI/bge-m3", uses 1024-dimensional embeddings
         "embedding_model": os.environ.get("RAGAMUFFIN_EMBEDDING_MODEL", "openai/text-embedding-ada-002"),
         "embedding_dimension": os.environ.get("RAGAMUFFIN_EMBEDDING_DIMENSION", 1536),
+        # Precision of the embeddings stored by the file storage: "float32" or "float16"
+        "vector_dtype": os.environ.get("RAGAMUFFIN_VECTOR_DTYPE", "float32"),
+        # Number of document chunks kept in memory by each agent in the file storage
+        "docstore_cache_size": os.environ.get("RAGAMUFFIN_DOCSTORE_CACHE_SIZE", 1024),
+        # Agents with at least this many embeddings in the file storage are searched with an approximate
+        # nearest-neighbour index. Disabled by default (0), so all agents use exact search.
+        # Raising nprobe improves its recall at the cost of latency.
+        "ann_min_vectors": os.environ.get("RAGAMUFFIN_ANN_MIN_VECTORS", 0),
+        "ann_nprobe": os.environ.get("RAGAMUFFIN_ANN_NPROBE", 16),
+        # Fuse keyword (BM25) and embedding search results when chatting, using this many candidates from each
+        "hybrid_search": os.environ.get("RAGAMUFFIN_HYBRID_SEARCH", True),
+        "hybrid_candidates": os.environ.get("RAGAMUFFIN_HYBRID_CANDIDATES", 20),
+        # Embedding model which highlights the sentences of the sources most similar to the question. "retrieval"
+        # shares the embedding model of the agent, which saves memory and reuses the embedding of the question.
+        "highlight_model": os.environ.get(
+            "RAGAMUFFIN_HIGHLIGHT_MODEL", "huggingface.co/sentence-transformers/all-mpnet-base-v2"
+        ),
+        # Number of sources whose sentence embeddings the highlighter keeps in memory, 0 disables the cache.
+        # The sentence embeddings of the highlight model can also be stored in the embedding cache.
+        "highlight_cache_size": os.environ.get("RAGAMUFFIN_HIGHLIGHT_CACHE_SIZE", 512),
+        "highlight_disk_cache": os.environ.get("RAGAMUFFIN_HIGHLIGHT_DISK_CACHE", False),
+        # Split the chunks of agents in the file storage into sentences and embed them when the agent is generated,
+        # so that highlighting the sources of an answer only embeds the query
+        "precompute_highlights": os.environ.get("RAGAMUFFIN_PRECOMPUTE_HIGHLIGHTS", False),
+        # Number of documents loaded, chunked and embedded together during ingestion
+        "ingest_batch_size": os.environ.get("RAGAMUFFIN_INGEST_BATCH_SIZE", 64),
+        # Minimum number of seconds between checkpoints of an agent in the file storage, 0 disables checkpoints
+        "checkpoint_interval": os.environ.get("RAGAMUFFIN_CHECKPOINT_INTERVAL", 300),
+        # Threads (0 uses all cores) and batch size of local models in ONNX Runtime, e.g. "onnx/BAAI/bge-m3"
+        "onnx_threads": os.environ.get("RAGAMUFFIN_ONNX_THREADS", 0),
+        "onnx_batch_size": os.environ.get("RAGAMUFFIN_ONNX_BATCH_SIZE", 32),
+        # Batching and concurrency of requests to the OpenAI embeddings API
+        "openai_embed_batch_tokens": os.environ.get("RAGAMUFFIN_OPENAI_EMBED_BATCH_TOKENS", 16384),
+        "openai_embed_concurrency": os.environ.get("RAGAMUFFIN_OPENAI_EMBED_CONCURRENCY", 8),
+        # Maximum size of the embedding cache shared by all agents in MiB, 0 disables the cache
+        "embedding_cache_size": os.environ.get("RAGAMUFFIN_EMBEDDING_CACHE_SIZE", 1024),
         "debug_mode": os.environ.get("RAGAMUFFIN_DEBUG", False),
+        # Database file of the "sqlite" storage type, defaults to storage.sqlite in the data directory
+        "sqlite_path": os.environ.get("RAGAMUFFIN_SQLITE_PATH"),
+        # Comma-separated contact points of the Cassandra cluster, e.g. "10.0.0.1,10.0.0.2"
         "cassandra_cluster_ip": os.environ.get("CASSANDRA_CLUSTER", "127.0.0.1"),
+        "cassandra_port": os.environ.get("CASSANDRA_PORT", 9042),
         "cassandra_keyspace": os.environ.get("CASSANDRA_KEYSPACE", "ragamuffin"),
+        # Data center of the nodes which are queried first, defaults to the data center of the first contact point
+        "cassandra_local_dc": os.environ.get("CASSANDRA_LOCAL_DC"),
+        # Native protocol version, 0 negotiates the highest version supported by the cluster
+        "cassandra_protocol_version": os.environ.get("CASSANDRA_PROTOCOL_VERSION", 0),
+        # Timeouts in seconds for opening connections and for requests
+        "cassandra_connect_timeout": os.environ.get("CASSANDRA_CONNECT_TIMEOUT", 5),
+        "cassandra_request_timeout": os.environ.get("CASSANDRA_REQUEST_TIMEOUT", 10),
+        # Threads of the driver which process responses and manage the connection pool
+        "cassandra_executor_threads": os.environ.get("CASSANDRA_EXECUTOR_THREADS", 2),
+        # Number of rows fetched per page by queries
+        "cassandra_fetch_size": os.environ.get("CASSANDRA_FETCH_SIZE", 100),
+        # Number of concurrent write requests and maximum size of a batch in KiB when generating an agent
+        "cassandra_write_concurrency": os.environ.get("CASSANDRA_WRITE_CONCURRENCY", 64),
+        "cassandra_batch_size_kb": os.environ.get("CASSANDRA_BATCH_SIZE_KB", 40),
         "zotero_library_id": os.environ.get("ZOTERO_LIBRARY_ID"),
         "zotero_api_key": os.environ.get("ZOTERO_API_KEY"),
         "openai_api_key": os.environ.get("OPENAI_API_KEY"),
     }
 
     # Handle boolean values
-    for key in ["debug_mode"]:
+    for key in ["hybrid_search", "highlight_disk_cache", "precompute_highlights", "debug_mode"]:
         value = settings[key]
         if isinstance(value, str):
             settings[key] = value.lower() in ["true", "1", "yes"]
 
     # Handle integer values
-    for key in ["embedding_dimension"]:
+    for key in [
+        "embedding_dimension",
+        "docstore_cache_size",
+        "ann_min_vectors",
+        "ann_nprobe",
+        "hybrid_candidates",
+        "highlight_cache_size",
+        "ingest_batch_size",
+        "checkpoint_interval",
+        "onnx_threads",
+        "onnx_batch_size",
+        "openai_embed_batch_tokens",
+        "openai_embed_concurrency",
+        "embedding_cache_size",
+        "cassandra_port",
+        "cassandra_protocol_version",
+        "cassandra_connect_timeout",
+        "cassandra_request_timeout",
+        "cassandra_executor_threads",
+        "cassandra_fetch_size",
+        "cassandra_write_concurrency",
+        "cassandra_batch_size_kb",
+    ]:
         value = settings[key]
         if isinstance(value, str):
             settings[key] = int(value)
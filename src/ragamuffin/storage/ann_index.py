@@ -0,0 +1,122 @@
+import math
+from pathlib import Path
+
+import numpy as np
+
+# Number of embeddings assigned to clusters at a time
+ASSIGN_CHUNK_SIZE = 65536
+# Number of embeddings sampled per cluster to train the centroids
+TRAINING_SAMPLES_PER_LIST = 64
+
+
+class IVFIndex:
+    """An inverted file index, which groups embeddings into lists around k-means centroids.
+
+    A query is compared only with the embeddings in the `nprobe` lists whose centroids are closest
+    to it, instead of every embedding in the store. Raising `nprobe` improves recall at the cost of latency.
+    """
+
+    def __init__(self, centroids: np.ndarray, list_offsets: np.ndarray, list_rows: np.ndarray):
+        """Create the index.
+
+        Args:
+            centroids: Unit-length centroids of the lists, one row per list.
+            list_offsets: The start of each list in `list_rows`, followed by the number of rows.
+            list_rows: Row numbers of the embeddings, grouped by list.
+        """
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_rows = list_rows
+
+    @property
+    def num_lists(self) -> int:
+        """The number of lists in the index."""
+        return len(self.centroids)
+
+    @property
+    def num_rows(self) -> int:
+        """The number of embeddings in the index."""
+        return len(self.list_rows)
+
+    @classmethod
+    def build(
+        cls: type["IVFIndex"],
+        embeddings: np.ndarray,
+        num_lists: int | None = None,
+        centroids: np.ndarray | None = None,
+        iterations: int = 10,
+        seed: int = 0,
+    ) -> "IVFIndex":
+        """Cluster the embeddings with spherical k-means and build the lists.
+
+        Args:
+            embeddings: The embeddings to index, one row per node.
+            num_lists: The number of lists. Defaults to the square root of the number of embeddings.
+            centroids: Centroids of a previous index to reuse, skipping the k-means training.
+            iterations: The number of k-means iterations.
+            seed: The seed used to sample the training embeddings.
+        """
+        if centroids is None:
+            num_lists = num_lists or max(1, round(math.sqrt(len(embeddings))))
+            centroids = train_centroids(embeddings, min(num_lists, len(embeddings)), iterations, seed)
+
+        assignments = np.concatenate(
+            [
+                assign_lists(embeddings[start : start + ASSIGN_CHUNK_SIZE], centroids)
+                for start in range(0, len(embeddings), ASSIGN_CHUNK_SIZE)
+            ]
+        )
+        list_rows = np.argsort(assignments, kind="stable")
+        list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=len(centroids)))])
+        return cls(centroids, list_offsets, list_rows)
+
+    @classmethod
+    def load(cls: type["IVFIndex"], path: Path) -> "IVFIndex":
+        """Load the index from a NumPy archive."""
+        with np.load(path) as data:
+            return cls(data["centroids"], data["list_offsets"], data["list_rows"])
+
+    def save(self, path: Path) -> None:
+        """Save the index to a NumPy archive."""
+        with path.open("wb") as f:
+            np.savez(f, centroids=self.centroids, list_offsets=self.list_offsets, list_rows=self.list_rows)
+
+    def probe(self, query_vector: np.ndarray, nprobe: int) -> np.ndarray:
+        """Get the sorted row numbers of the embeddings in the lists closest to the query."""
+        nprobe = min(nprobe, self.num_lists)
+        scores = self.centroids @ query_vector
+        lists = np.argpartition(-scores, nprobe - 1)[:nprobe]
+        rows = np.concatenate([self.list_rows[self.list_offsets[i] : self.list_offsets[i + 1]] for i in lists])
+        # Sorted rows are read from the embeddings file in order
+        return np.sort(rows)
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Scale vectors to unit length, leaving zero vectors unchanged."""
+    vectors = vectors.astype(np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+def assign_lists(embeddings: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Get the number of the closest centroid for each embedding."""
+    return np.argmax(normalize(embeddings) @ centroids.T, axis=1)
+
+
+def train_centroids(embeddings: np.ndarray, num_lists: int, iterations: int, seed: int) -> np.ndarray:
+    """Find unit-length centroids of a sample of the embeddings with spherical k-means."""
+    rng = np.random.default_rng(seed)
+    num_samples = min(len(embeddings), num_lists * TRAINING_SAMPLES_PER_LIST)
+    samples = normalize(embeddings[np.sort(rng.choice(len(embeddings), num_samples, replace=False))])
+    centroids = samples[rng.choice(num_samples, num_lists, replace=False)]
+
+    for _ in range(iterations):
+        assignments = np.argmax(samples @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, samples)
+        # Move the centroids of empty lists to random samples
+        empty = np.bincount(assignments, minlength=num_lists) == 0
+        sums[empty] = samples[rng.choice(num_samples, int(empty.sum()))]
+        centroids = normalize(sums)
+
+    return centroids
@@ -0,0 +1,280 @@
+import io
+import re
+from collections import Counter
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+BM25_INDEX_FILENAME = "bm25_index.npz"
+
+# BM25 term frequency saturation and document length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Longer tokens, e.g. encoded data, are not indexed
+MAX_TOKEN_LENGTH = 64
+# Number of the highest-weighted postings of each term read by a query
+MAX_POSTINGS_PER_TERM = 8192
+
+WORD_PATTERN = re.compile(r"\w+")
+# Parts of snake_case, camelCase and PascalCase identifiers
+IDENTIFIER_PART_PATTERN = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+
+
+def tokenize(text: str) -> list[str]:
+    """Split text into lowercase words.
+
+    Identifiers are indexed whole and by their parts, so `GitLibrary` matches queries
+    for `gitlibrary`, `git` and `library`.
+    """
+    tokens = []
+    for word in WORD_PATTERN.findall(text):
+        if len(word) > MAX_TOKEN_LENGTH:
+            continue
+        lower_word = word.lower()
+        tokens.append(lower_word)
+        # Only snake_case words and words with inner capitals can have several parts
+        if "_" in word or (word != lower_word and not word.istitle()):
+            parts = IDENTIFIER_PART_PATTERN.findall(word)
+            if len(parts) > 1:
+                tokens.extend(part.lower() for part in parts)
+    return tokens
+
+
+class BM25Index:
+    """A sparse inverted index of node text, which ranks nodes by their BM25 score.
+
+    The postings of each term are stored with their BM25 weight, so a query only sums
+    the weights of the postings of its terms. Postings are sorted by weight and a query reads
+    at most `MAX_POSTINGS_PER_TERM` postings of each term, so terms which occur in most nodes
+    do not slow down queries.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        terms: np.ndarray,
+        term_offsets: np.ndarray,
+        postings: np.ndarray,
+        weights: np.ndarray,
+        node_ids: np.ndarray,
+        ref_doc_ids: np.ndarray,
+        counts: np.ndarray | None = None,
+        lengths: np.ndarray | None = None,
+    ):
+        """Create the index.
+
+        Args:
+            terms: The indexed terms.
+            term_offsets: The start of the postings of each term, followed by the number of postings.
+            postings: Row numbers of the nodes which contain each term, grouped by term, highest weight first.
+            weights: The BM25 weight of each posting.
+            node_ids: The ID of the node in each row.
+            ref_doc_ids: The ID of the source document of the node in each row.
+            counts: The number of occurrences of the term of each posting in its node.
+            lengths: The number of terms of the node in each row.
+                Indexes saved before the counts and lengths were stored can only be built again.
+        """
+        self.terms = terms
+        self.term_offsets = term_offsets
+        self.postings = postings
+        self.weights = weights
+        self.node_ids = node_ids
+        self.ref_doc_ids = ref_doc_ids
+        self.counts = counts
+        self.lengths = lengths
+        self._term_ids = {str(term): term_id for term_id, term in enumerate(terms)}
+
+    @property
+    def num_rows(self) -> int:
+        """The number of nodes in the index."""
+        return len(self.node_ids)
+
+    @property
+    def is_updatable(self) -> bool:
+        """Check if the index stores the term counts needed to add and remove nodes."""
+        return self.counts is not None and self.lengths is not None
+
+    @classmethod
+    def build(cls: type["BM25Index"], nodes: Iterable[tuple[str, str, str]]) -> "BM25Index":
+        """Tokenize the text of the nodes and build the index.
+
+        Args:
+            nodes: Tuples of the node ID, the source document ID and the text of each node.
+        """
+        term_ids: dict[str, int] = {}
+        return cls._from_postings(term_ids, _TokenizedNodes.tokenize(nodes, term_ids))
+
+    def update(
+        self, node_ids: Iterable[str], load_nodes: Callable[[list[str]], Iterable[tuple[str, str, str]]]
+    ) -> "BM25Index":
+        """Get an index of the given nodes, tokenizing only the nodes which are not in this index.
+
+        The postings of the other nodes are kept, and the weights of all postings are computed again.
+
+        Args:
+            node_ids: The IDs of the nodes of the new index.
+            load_nodes: Loads the node ID, the source document ID and the text of each of the given new nodes.
+        """
+        if self.counts is None or self.lengths is None:
+            raise ValueError("The keyword index does not store term counts, it must be built again.")
+
+        node_ids = list(node_ids)
+        kept_rows = np.isin(self.node_ids, np.array(node_ids, dtype=np.str_))
+        known_node_ids = set(self.node_ids[kept_rows].tolist())
+        new_node_ids = [node_id for node_id in node_ids if node_id not in known_node_ids]
+
+        term_ids = dict(self._term_ids)
+        new_nodes = _TokenizedNodes.tokenize(load_nodes(new_node_ids), term_ids)
+
+        # Renumber the kept rows, followed by the rows of the new nodes
+        row_numbers = np.cumsum(kept_rows) - 1
+        kept_postings = kept_rows[self.postings]
+        posting_terms = np.repeat(np.arange(len(self.terms), dtype=np.int64), np.diff(self.term_offsets))
+        num_kept_rows = int(kept_rows.sum())
+        nodes = _TokenizedNodes(
+            node_ids=self.node_ids[kept_rows].tolist() + new_nodes.node_ids,
+            ref_doc_ids=self.ref_doc_ids[kept_rows].tolist() + new_nodes.ref_doc_ids,
+            lengths=np.concatenate([self.lengths[kept_rows], new_nodes.lengths]),
+            term_numbers=np.concatenate([posting_terms[kept_postings], new_nodes.term_numbers]),
+            rows=np.concatenate([row_numbers[self.postings[kept_postings]], new_nodes.rows + num_kept_rows]),
+            counts=np.concatenate([self.counts[kept_postings], new_nodes.counts]),
+        )
+        return self._from_postings(term_ids, nodes)
+
+    @classmethod
+    def _from_postings(cls: type["BM25Index"], term_ids: dict[str, int], nodes: "_TokenizedNodes") -> "BM25Index":
+        """Compute the BM25 weights of the postings and group them by term."""
+        term_numbers, counts, rows, lengths = nodes.term_numbers, nodes.counts, nodes.rows, nodes.lengths
+        terms = np.array(list(term_ids), dtype=np.str_)
+        document_frequencies = np.bincount(term_numbers, minlength=len(term_ids))
+
+        # Drop the terms of removed nodes which no other node contains
+        used_terms = document_frequencies > 0
+        if not used_terms.all():
+            term_numbers = (np.cumsum(used_terms) - 1)[term_numbers]
+            terms, document_frequencies = terms[used_terms], document_frequencies[used_terms]
+
+        idf = np.log1p((len(nodes.node_ids) - document_frequencies + 0.5) / (document_frequencies + 0.5))
+        average_length = max(float(lengths.mean()) if len(lengths) else 0.0, 1.0)
+        length_norms = 1 - BM25_B + BM25_B * lengths / average_length
+        weights = (idf[term_numbers] * counts * (BM25_K1 + 1) / (counts + BM25_K1 * length_norms[rows])).astype(
+            np.float32
+        )
+
+        # Group the postings by term, with the highest weights first
+        order = np.lexsort((-weights, term_numbers))
+        return cls(
+            terms=terms,
+            term_offsets=np.concatenate([[0], np.cumsum(document_frequencies)]).astype(np.int64),
+            postings=rows[order],
+            weights=weights[order],
+            node_ids=np.array(nodes.node_ids, dtype=np.str_),
+            ref_doc_ids=np.array(nodes.ref_doc_ids, dtype=np.str_),
+            counts=counts[order],
+            lengths=lengths,
+        )
+
+    @classmethod
+    def load(cls: type["BM25Index"], path: Path) -> "BM25Index":
+        """Load the index from a NumPy archive."""
+        with path.open("rb") as f:
+            return cls.from_bytes(f.read())
+
+    @classmethod
+    def from_bytes(cls: type["BM25Index"], data: bytes) -> "BM25Index":
+        """Load the index from the contents of a NumPy archive."""
+        with np.load(io.BytesIO(data), allow_pickle=False) as arrays:
+            return cls(
+                arrays["terms"],
+                arrays["term_offsets"],
+                arrays["postings"],
+                arrays["weights"],
+                arrays["node_ids"],
+                arrays["ref_doc_ids"],
+                arrays.get("counts"),
+                arrays.get("lengths"),
+            )
+
+    def save(self, path: Path) -> None:
+        """Save the index to a NumPy archive."""
+        path.write_bytes(self.to_bytes())
+
+    def to_bytes(self) -> bytes:
+        """Get the contents of a NumPy archive of the index."""
+        arrays = {
+            "terms": self.terms,
+            "term_offsets": self.term_offsets,
+            "postings": self.postings,
+            "weights": self.weights,
+            "node_ids": self.node_ids,
+            "ref_doc_ids": self.ref_doc_ids,
+        }
+        if self.counts is not None and self.lengths is not None:
+            arrays.update(counts=self.counts, lengths=self.lengths)
+        buffer = io.BytesIO()
+        np.savez(buffer, **arrays)
+        return buffer.getvalue()
+
+    def search(self, query: str, top_k: int) -> list[tuple[int, float]]:
+        """Find the rows of the nodes with the highest BM25 scores for the query.
+
+        Returns:
+            Tuples of the row number and the score of the best matches, best first.
+        """
+        term_ids = {self._term_ids[token] for token in tokenize(query) if token in self._term_ids}
+        if not term_ids or top_k <= 0:
+            return []
+
+        slices = [
+            slice(
+                self.term_offsets[term_id],
+                min(self.term_offsets[term_id + 1], self.term_offsets[term_id] + MAX_POSTINGS_PER_TERM),
+            )
+            for term_id in term_ids
+        ]
+        rows = np.concatenate([self.postings[postings] for postings in slices])
+        weights = np.concatenate([self.weights[postings] for postings in slices])
+        scores = np.bincount(rows, weights=weights, minlength=self.num_rows)
+
+        matches = np.flatnonzero(scores)
+        top_k = min(top_k, len(matches))
+        top_rows = matches[np.argpartition(-scores[matches], top_k - 1)[:top_k]]
+        top_rows = top_rows[np.argsort(-scores[top_rows], kind="stable")]
+        return [(int(row), float(scores[row])) for row in top_rows]
+
+
+@dataclass
+class _TokenizedNodes:
+    """The term counts of nodes, with one entry per distinct term of each node."""
+
+    node_ids: list[str]
+    ref_doc_ids: list[str]
+    lengths: np.ndarray
+    term_numbers: np.ndarray
+    rows: np.ndarray
+    counts: np.ndarray
+
+    @classmethod
+    def tokenize(
+        cls: type["_TokenizedNodes"], nodes: Iterable[tuple[str, str, str]], term_ids: dict[str, int]
+    ) -> "_TokenizedNodes":
+        """Count the terms of each node, adding new terms to `term_ids`."""
+        node_ids, ref_doc_ids, doc_lengths = [], [], []
+        node_terms, node_counts = [], []
+        for node_id, ref_doc_id, text in nodes:
+            term_counts = Counter(tokenize(text))
+            node_ids.append(node_id)
+            ref_doc_ids.append(ref_doc_id)
+            doc_lengths.append(term_counts.total())
+            node_terms.append(np.fromiter((term_ids.setdefault(term, len(term_ids)) for term in term_counts), np.int64))
+            node_counts.append(np.fromiter(term_counts.values(), np.float32))
+
+        return cls(
+            node_ids=node_ids,
+            ref_doc_ids=ref_doc_ids,
+            lengths=np.array(doc_lengths, dtype=np.float32),
+            term_numbers=np.concatenate(node_terms) if node_terms else np.zeros(0, np.int64),
+            rows=np.repeat(np.arange(len(node_ids), dtype=np.int32), [len(terms) for terms in node_terms]),
+            counts=np.concatenate(node_counts) if node_counts else np.zeros(0, np.float32),
+        )
@@ -1,29 +1,101 @@
 import logging
 import re
 import sys
+from dataclasses import dataclass
 
 import cassio
-from cassandra.cluster import Cluster
+from cassandra.cluster import EXEC_PROFILE_DEFAULT, Cluster, ExecutionProfile, Session
+from cassandra.concurrent import execute_concurrent_with_args
+from cassandra.policies import DCAwareRoundRobinPolicy, TokenAwarePolicy
+from cassandra.query import SimpleStatement
 from llama_index.core import StorageContext, VectorStoreIndex
+from llama_index.core.base.base_retriever import BaseRetriever
 from llama_index.core.indices.base import BaseIndex
 from llama_index.core.readers.base import BaseReader
-from llama_index.vector_stores.cassandra import CassandraVectorStore
 
 from ragamuffin.error_handling import ensure_int
 from ragamuffin.models.model_picker import configure_llamaindex_embedding_model
 from ragamuffin.settings import get_settings
+from ragamuffin.storage.bm25_index import BM25Index
+from ragamuffin.storage.cassandra_vector_store import ConcurrentCassandraVectorStore
+from ragamuffin.storage.hybrid_retriever import BM25Retriever, HybridRetriever
+from ragamuffin.storage.ingest import insert_documents, iter_documents
 from ragamuffin.storage.interface import Storage
 
 logger = logging.getLogger(__name__)
 
+# Table of the keyword indexes of all agents, stored in chunks
+SPARSE_INDEX_TABLE = "ragamuffin_sparse_index"
+SPARSE_INDEX_CHUNK_SIZE = 1024 * 1024
+# Number of keyword index chunks fetched per page
+SPARSE_INDEX_FETCH_SIZE = 8
+
+
+@dataclass
+class CassandraSessionOptions:
+    """Connection settings of the Cassandra session.
+
+    Attributes:
+        port: The native protocol port of the contact points.
+        local_dc: The data center whose nodes are queried first. Defaults to the data center of a contact point.
+        protocol_version: The native protocol version, or 0 to negotiate the highest version supported by the cluster.
+        connect_timeout: Seconds to wait for a connection to open.
+        request_timeout: Seconds to wait for a response to a request.
+        executor_threads: Threads of the driver which process responses and manage the connection pool.
+        fetch_size: Number of rows fetched per page by queries.
+    """
+
+    port: int = 9042
+    local_dc: str | None = None
+    protocol_version: int = 0
+    connect_timeout: int = 5
+    request_timeout: int = 10
+    executor_threads: int = 2
+    fetch_size: int = 100
+
 
 class CassandraStorage(Storage):
-    def __init__(self, cluster_ip: str, keyspace: str):
-        self.cluster_ip = cluster_ip
+    """Store agents in tables of a Cassandra keyspace.
+
+    The session is opened the first time the cluster is used, so commands which do not read or write agents
+    do not wait for a connection.
+    """
+
+    def __init__(self, contact_points: list[str], keyspace: str, options: CassandraSessionOptions | None = None):
+        self.contact_points = contact_points
         self.keyspace = keyspace
-        self.cluster = Cluster([self.cluster_ip])
-        self.session = self.cluster.connect()
-        cassio.init(session=self.session, keyspace=keyspace)
+        self.options = options or CassandraSessionOptions()
+        self._cluster: Cluster | None = None
+        self._session: Session | None = None
+        # Vector stores of loaded agents, which keep their prepared queries
+        self._vector_stores: dict[str, ConcurrentCassandraVectorStore] = {}
+
+    @property
+    def session(self) -> Session:
+        """The session of the Cassandra cluster, connected on first use."""
+        if self._session is None:
+            logger.info("Connecting to the Cassandra cluster...")
+            # Send each request directly to a replica of its partition, preferring the local data center
+            profile = ExecutionProfile(
+                load_balancing_policy=TokenAwarePolicy(DCAwareRoundRobinPolicy(local_dc=self.options.local_dc)),
+                request_timeout=self.options.request_timeout,
+            )
+            cluster_kwargs = (
+                {"protocol_version": self.options.protocol_version} if self.options.protocol_version else {}
+            )
+            self._cluster = Cluster(
+                self.contact_points,
+                port=self.options.port,
+                execution_profiles={EXEC_PROFILE_DEFAULT: profile},
+                connect_timeout=self.options.connect_timeout,
+                executor_threads=self.options.executor_threads,
+                **cluster_kwargs,
+            )
+            session = self._cluster.connect()
+            session.default_fetch_size = self.options.fetch_size
+            cassio.init(session=session, keyspace=self.keyspace)
+            self._session = session
+        return self._session
 
     def _validate_agent_name(self, agent_name: str) -> None:
         if not bool(re.match(r"^[a-z_][a-z0-9_]{0,47}$", agent_name)):
@@ -33,48 +105,126 @@ class CassandraStorage(Storage):
                 "lowercase characters and underscores, and be 1-48 characters long."
             )
             sys.exit(4)
+        if agent_name == SPARSE_INDEX_TABLE:
+            logger.error(f"The agent name '{agent_name}' is reserved.")
+            sys.exit(4)
 
-    def generate_index(self, agent_name: str, reader: BaseReader) -> BaseIndex:
+    def generate_index(
+        self, agent_name: str, reader: BaseReader, embed_workers: int = 1, resume: bool = False
+    ) -> BaseIndex:
         """Load the documents and create a RAG index."""
+        if resume:
+            logger.warning("Resuming is not supported by the Cassandra storage, generating the agent normally.")
         self._validate_agent_name(agent_name)
-        logger.info("Loading documents...")
-        documents = reader.load_data()
-
-        logger.info("Generating RAG embeddings...")
-        settings = get_settings()
-        embed_dim = ensure_int(settings.get("embedding_dimension"))
-        vector_store = CassandraVectorStore(table=agent_name, embedding_dimension=embed_dim)
+        batch_size = ensure_int(get_settings().get("ingest_batch_size"))
+        vector_store = self._create_vector_store(agent_name)
+        self._vector_stores.pop(agent_name, None)
         storage_context = StorageContext.from_defaults(vector_store=vector_store)
-        configure_llamaindex_embedding_model()
+        configure_llamaindex_embedding_model(embed_workers=embed_workers)
 
-        logger.info("Storing the index in Cassandra...")
-        index = VectorStoreIndex.from_documents(documents, storage_context=storage_context)
+        logger.info("Loading documents, generating RAG embeddings and storing them in Cassandra...")
+        index = VectorStoreIndex(nodes=[], storage_context=storage_context)
+        insert_documents(index, iter_documents(reader), batch_size)
         index.storage_context.persist()
+        vector_store.log_stats()
+
+        logger.info("Building the keyword index...")
+        self._save_sparse_index(agent_name, BM25Index.build(vector_store.iter_node_texts()))
         return index
 
+    def _create_vector_store(self, agent_name: str) -> ConcurrentCassandraVectorStore:
+        """Create the vector store of the agent's table."""
+        settings = get_settings()
+        return ConcurrentCassandraVectorStore(
+            table=agent_name,
+            embedding_dimension=ensure_int(settings.get("embedding_dimension")),
+            write_concurrency=ensure_int(settings.get("cassandra_write_concurrency")),
+            max_batch_bytes=ensure_int(settings.get("cassandra_batch_size_kb")) * 1024,
+            session=self.session,
+            keyspace=self.keyspace,
+        )
+
     def load_index(self, agent_name: str) -> BaseIndex:
-        """Load the index from storage."""
+        """Load the index from storage.
+
+        The vector store of the agent is reused by later calls, so its prepared ANN query is not prepared again.
+        """
+        if agent_name not in self._vector_stores:
+            self._vector_stores[agent_name] = self._create_vector_store(agent_name)
+        return VectorStoreIndex.from_vector_store(self._vector_stores[agent_name])
+
+    def load_retriever(self, agent_name: str, similarity_top_k: int) -> BaseRetriever:
+        """Load a retriever which fuses the results of embedding and keyword search.
+
+        Agents generated without a keyword index only use embedding search.
+        """
         settings = get_settings()
-        embed_dim = ensure_int(settings.get("embedding_dimension"))
-        vector_store = CassandraVectorStore(table=agent_name, embedding_dimension=embed_dim)
-        return VectorStoreIndex.from_vector_store(vector_store)
+        index = self.load_index(agent_name)
+        bm25_index = self._load_sparse_index(agent_name) if settings.get("hybrid_search") else None
+        if bm25_index is None:
+            return index.as_retriever(similarity_top_k=similarity_top_k)
+
+        candidates = max(similarity_top_k, ensure_int(settings.get("hybrid_candidates")))
+        sparse_retriever = BM25Retriever(bm25_index, self._vector_stores[agent_name].get_nodes_by_key, candidates)
+        return HybridRetriever([index.as_retriever(similarity_top_k=candidates), sparse_retriever], similarity_top_k)
+
+    def _save_sparse_index(self, agent_name: str, bm25_index: BM25Index) -> None:
+        """Store the keyword index of the agent in chunks, replacing the previous index."""
+        self.session.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.keyspace}.{SPARSE_INDEX_TABLE} "
+            "(agent text, chunk int, data blob, PRIMARY KEY (agent, chunk))"
+        )
+        self.session.execute(f"DELETE FROM {self.keyspace}.{SPARSE_INDEX_TABLE} WHERE agent = %s", (agent_name,))  # noqa: S608
+
+        data = bm25_index.to_bytes()
+        chunks = [
+            (agent_name, number, data[start : start + SPARSE_INDEX_CHUNK_SIZE])
+            for number, start in enumerate(range(0, len(data), SPARSE_INDEX_CHUNK_SIZE))
+        ]
+        insert = self.session.prepare(
+            f"INSERT INTO {self.keyspace}.{SPARSE_INDEX_TABLE} (agent, chunk, data) VALUES (?, ?, ?)"  # noqa: S608
+        )
+        execute_concurrent_with_args(
+            self.session,
+            insert,
+            chunks,
+            concurrency=ensure_int(get_settings().get("cassandra_write_concurrency")),
+            raise_on_first_error=True,
+        )
+
+    def _load_sparse_index(self, agent_name: str) -> BM25Index | None:
+        """Load the keyword index of the agent, if it was stored."""
+        if not self._table_exists(SPARSE_INDEX_TABLE):
+            return None
+        statement = SimpleStatement(
+            f"SELECT data FROM {self.keyspace}.{SPARSE_INDEX_TABLE} WHERE agent = %s",  # noqa: S608
+            fetch_size=SPARSE_INDEX_FETCH_SIZE,
+        )
+        chunks = [row.data for row in self.session.execute(statement, (agent_name,))]
+        return BM25Index.from_bytes(b"".join(chunks)) if chunks else None
+
+    def _table_exists(self, table_name: str) -> bool:
+        """Check if a table exists in the keyspace."""
+        query = "SELECT table_name FROM system_schema.tables WHERE keyspace_name = %s AND table_name = %s"
+        return self.session.execute(query, (self.keyspace, table_name)).one() is not None
 
     def list_agents(self) -> list[str]:
         """Get the list of agents."""
         query = "SELECT table_name FROM system_schema.tables WHERE keyspace_name = %s"
         rows = self.session.execute(query, [self.keyspace])
-        return [row.table_name for row in rows]
+        return [row.table_name for row in rows if row.table_name != SPARSE_INDEX_TABLE]
 
     def delete_agent(self, agent_name: str) -> None:
         """Delete the agent table from Cassandra keyspace."""
         self._validate_agent_name(agent_name)
 
-        query = "SELECT table_name FROM system_schema.tables WHERE keyspace_name = %s AND table_name = %s"
-        result = self.session.execute(query, (self.keyspace, agent_name))
-        if not result.one():
+        if not self._table_exists(agent_name):
             logger.warning(f"Agent '{agent_name}' does not exist.")
             return
 
         query = f"DROP TABLE {self.keyspace}.{agent_name}"
         self.session.execute(query)
+        if self._table_exists(SPARSE_INDEX_TABLE):
+            self.session.execute(f"DELETE FROM {self.keyspace}.{SPARSE_INDEX_TABLE} WHERE agent = %s", (agent_name,))  # noqa: S608
+        self._vector_stores.pop(agent_name, None)
         logger.info(f"Deleted agent '{agent_name}'.")
@@ -0,0 +1,184 @@
+import json
+import logging
+import time
+from collections.abc import Iterator, Sequence
+from typing import Any, TypeVar
+
+from cassandra.concurrent import execute_concurrent, execute_concurrent_with_args
+from cassandra.query import BatchStatement, BatchType, PreparedStatement, SimpleStatement
+from llama_index.core.schema import BaseNode, MetadataMode
+from llama_index.core.vector_stores.utils import metadata_dict_to_node, node_to_metadata_dict
+from llama_index.vector_stores.cassandra import CassandraVectorStore
+from pydantic import PrivateAttr
+from typing_extensions import override
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Seconds between progress reports while nodes are written
+PROGRESS_INTERVAL = 10.0
+# Number of rows fetched per page when all nodes of a table are read
+SCAN_FETCH_SIZE = 1000
+
+
+def group_by_partition(rows: Sequence[tuple[str, int, T]], max_batch_bytes: int) -> list[list[T]]:
+    """Group rows into batches which each write to a single partition.
+
+    Args:
+        rows: Tuples of the partition key, the approximate size in bytes and the row.
+        max_batch_bytes: The maximum approximate size of a batch. Larger rows are written in batches of their own.
+    """
+    batches: list[list[T]] = []
+    batch_partition = None
+    batch_bytes = 0
+    for partition, size, row in sorted(rows, key=lambda row: row[0]):
+        if not batches or partition != batch_partition or batch_bytes + size > max_batch_bytes:
+            batches.append([])
+            batch_partition = partition
+            batch_bytes = 0
+        batches[-1].append(row)
+        batch_bytes += size
+    return batches
+
+
+class ConcurrentCassandraVectorStore(CassandraVectorStore):
+    """A Cassandra vector store which writes nodes with many concurrent requests.
+
+    Nodes are partitioned by their source document. The nodes of each document are written in unlogged
+    single-partition batches of prepared statements, and up to `write_concurrency` batches are in flight
+    at a time.
+    """
+
+    _write_concurrency: int = PrivateAttr()
+    _max_batch_bytes: int = PrivateAttr()
+    _insert_statements: dict[tuple[str, ...], PreparedStatement] = PrivateAttr(default_factory=dict)
+    _select_statement: PreparedStatement | None = PrivateAttr(default=None)
+    _rows_written: int = PrivateAttr(default=0)
+    _write_seconds: float = PrivateAttr(default=0.0)
+    _last_progress_time: float = PrivateAttr(default_factory=time.monotonic)
+
+    def __init__(
+        self, table: str, embedding_dimension: int, write_concurrency: int, max_batch_bytes: int, **kwargs: Any
+    ):
+        super().__init__(table=table, embedding_dimension=embedding_dimension, **kwargs)
+        self._write_concurrency = write_concurrency
+        self._max_batch_bytes = max_batch_bytes
+
+    @classmethod
+    @override
+    def class_name(cls: type["ConcurrentCassandraVectorStore"]) -> str:
+        return "ConcurrentCassandraVectorStore"
+
+    @override
+    def add(self, nodes: Sequence[BaseNode], **add_kwargs: Any) -> list[str]:
+        if not nodes:
+            return []
+
+        rows = []
+        for node in nodes:
+            metadata = node_to_metadata_dict(node, remove_text=True, flat_metadata=self.flat_metadata)
+            text = node.get_content(metadata_mode=MetadataMode.NONE)
+            embedding = node.get_embedding()
+            columns = self._get_columns(node.node_id, text, embedding, metadata)
+            size = len(text.encode("utf-8")) + 4 * len(embedding) + len(json.dumps(metadata))
+            rows.append((metadata["ref_doc_id"], size, columns))
+
+        statements = [(self._build_batch(batch), ()) for batch in group_by_partition(rows, self._max_batch_bytes)]
+        start_time = time.monotonic()
+        execute_concurrent(
+            self._vector_table.session,
+            statements,
+            concurrency=self._write_concurrency,
+            raise_on_first_error=True,
+        )
+        self._record_write(len(rows), time.monotonic() - start_time)
+        return [node.node_id for node in nodes]
+
+    def get_nodes_by_key(self, node_ids: list[str], ref_doc_ids: list[str]) -> list[BaseNode]:
+        """Load nodes with concurrent single-partition reads, given their IDs and the IDs of their source documents.
+
+        Nodes which are not in the table are left out.
+        """
+        table = self._vector_table
+        if self._select_statement is None:
+            self._select_statement = table.session.prepare(
+                f"SELECT * FROM {table.keyspace}.{table.table} WHERE partition_id = ? AND row_id = ?"  # noqa: S608
+            )
+        results = execute_concurrent_with_args(
+            table.session,
+            self._select_statement,
+            list(zip(ref_doc_ids, node_ids, strict=True)),
+            concurrency=self._write_concurrency,
+            raise_on_first_error=True,
+        )
+        nodes = []
+        for _, rows in results:
+            row = rows.one()
+            if row is not None:
+                match = table._normalize_row(row)  # noqa: SLF001
+                node = metadata_dict_to_node(match["metadata"])
+                node.set_content(match["body_blob"])
+                nodes.append(node)
+        return nodes
+
+    def iter_node_texts(self) -> Iterator[tuple[str, str, str]]:
+        """Read the ID, the source document ID and the text of every node in the table."""
+        table = self._vector_table
+        statement = SimpleStatement(
+            f"SELECT row_id, partition_id, body_blob FROM {table.keyspace}.{table.table}",  # noqa: S608
+            fetch_size=SCAN_FETCH_SIZE,
+        )
+        for row in table.session.execute(statement):
+            yield row.row_id, row.partition_id, row.body_blob
+
+    def log_stats(self) -> None:
+        """Log the number of rows written and the write throughput."""
+        if self._rows_written:
+            logger.info(
+                f"Wrote {self._rows_written} rows to Cassandra in {self._write_seconds:.1f} s "
+                f"({self._rows_written / max(self._write_seconds, 1e-9):.0f} rows/s)."
+            )
+
+    def _get_columns(self, node_id: str, text: str, embedding: list[float], metadata: dict) -> dict[str, Any]:
+        """Get the column values of a node's row, split into indexed metadata and attributes by cassio."""
+        table = self._vector_table
+        values = table._normalize_kwargs(  # noqa: SLF001
+            {
+                "row_id": node_id,
+                "body_blob": text,
+                "vector": embedding,
+                "metadata": metadata,
+                "partition_id": metadata["ref_doc_id"],
+            },
+            is_write=True,
+        )
+        column_names = table._schema_colnameset()  # noqa: SLF001
+        return {name: value for name, value in values.items() if name in column_names}
+
+    def _build_batch(self, rows: list[dict[str, Any]]) -> BatchStatement:
+        """Build an unlogged batch of inserts into a single partition."""
+        batch = BatchStatement(batch_type=BatchType.UNLOGGED)
+        for columns in rows:
+            column_names = tuple(sorted(columns))
+            batch.add(self._get_insert_statement(column_names), [columns[name] for name in column_names])
+        return batch
+
+    def _get_insert_statement(self, column_names: tuple[str, ...]) -> PreparedStatement:
+        """Prepare the insert statement for a set of columns once."""
+        if column_names not in self._insert_statements:
+            table = self._vector_table
+            self._insert_statements[column_names] = table.session.prepare(
+                f"INSERT INTO {table.keyspace}.{table.table} ({', '.join(column_names)}) "  # noqa: S608
+                f"VALUES ({', '.join('?' * len(column_names))})"
+            )
+        return self._insert_statements[column_names]
+
+    def _record_write(self, row_count: int, seconds: float) -> None:
+        """Update the write statistics and report progress periodically."""
+        self._rows_written += row_count
+        self._write_seconds += seconds
+        logger.debug(f"Wrote {row_count} rows to Cassandra in {seconds:.2f} s.")
+        if time.monotonic() - self._last_progress_time >= PROGRESS_INTERVAL:
+            self._last_progress_time = time.monotonic()
+            self.log_stats()
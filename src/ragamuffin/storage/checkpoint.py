@@ -0,0 +1,62 @@
+import logging
+import time
+from collections.abc import Callable
+
+from llama_index.core import Document
+from llama_index.core.indices.base import BaseIndex
+
+from ragamuffin.storage.manifest import Manifest
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_FILENAME = "checkpoint.json"
+
+
+class Checkpointer:
+    """Periodically store the progress of an agent's ingestion, so that an interrupted run can be resumed.
+
+    After each inserted batch of documents, the `save` callback is called at most once per `interval`
+    seconds with a manifest of the files whose documents are all in the index.
+    """
+
+    def __init__(self, save: Callable[[Manifest], None], manifest: Manifest, changed_paths: list[str], interval: int):
+        """Create the checkpointer.
+
+        Args:
+            save: Stores the index and the checkpoint manifest.
+            manifest: The manifest of the run, which receives the document IDs of each file as it is loaded.
+            changed_paths: The files indexed by the run. The other files of the manifest are already in the index.
+            interval: The minimum number of seconds between checkpoints, 0 disables checkpoints.
+        """
+        self.save = save
+        self.manifest = manifest
+        self.changed_paths = set(changed_paths)
+        self.interval = interval
+        self.inserted_doc_ids: set[str] = set()
+        self._last_checkpoint_time = time.monotonic()
+
+    def on_batch(self, documents: list[Document]) -> None:
+        """Record an inserted batch of documents and store a checkpoint if one is due."""
+        self.inserted_doc_ids.update(document.doc_id for document in documents)
+        if self.interval > 0 and time.monotonic() - self._last_checkpoint_time >= self.interval:
+            logger.info("Storing a checkpoint...")
+            self.save(self.get_completed_manifest())
+            self._last_checkpoint_time = time.monotonic()
+
+    def get_completed_manifest(self) -> Manifest:
+        """Get a manifest of the files whose documents are all in the index."""
+        return Manifest(
+            {
+                path: entry
+                for path, entry in self.manifest.entries.items()
+                if path not in self.changed_paths or (entry.doc_ids and self.inserted_doc_ids.issuperset(entry.doc_ids))
+            }
+        )
+
+
+def remove_uncheckpointed_documents(index: BaseIndex, checkpoint: Manifest) -> None:
+    """Remove documents which were stored after the checkpoint, e.g. of files which were only partly indexed."""
+    checkpointed_doc_ids = set(checkpoint.get_doc_ids(list(checkpoint.entries)))
+    stored_doc_ids = set(index.docstore.get_all_ref_doc_info() or {})
+    for doc_id in stored_doc_ids - checkpointed_doc_ids:
+        index.delete_ref_doc(doc_id, delete_from_docstore=True)
@@ -0,0 +1,212 @@
+import json
+import sqlite3
+import threading
+import zlib
+from collections import OrderedDict
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+from typing import Any
+
+from llama_index.core.schema import BaseNode
+from llama_index.core.storage.docstore.keyval_docstore import KVDocumentStore
+from llama_index.core.storage.docstore.utils import json_to_doc
+from llama_index.core.storage.kvstore.types import DEFAULT_BATCH_SIZE, DEFAULT_COLLECTION, BaseKVStore
+from typing_extensions import override
+
+DOCSTORE_FILENAME = "docstore.sqlite"
+# The file where StorageContext.persist saves the default docstore
+LEGACY_DOCSTORE_FILENAME = "docstore.json"
+# Number of records read at a time when iterating over a collection
+ITER_PAGE_SIZE = 1000
+# Number of keys looked up at a time, below the SQLite limit of 999 query parameters
+LOOKUP_BATCH_SIZE = 500
+
+
+class SQLiteKVStore(BaseKVStore):
+    """A key-value store in an SQLite file, with compressed records which are read on demand.
+
+    Records are JSON, compressed with zlib. Recently read records are kept in an LRU cache of
+    `cache_size` entries, so memory use follows the records which are used rather than the size of the store.
+
+    Changes are made in a transaction which is committed by `persist`, so the stored records stay unchanged
+    if an update is interrupted.
+    """
+
+    def __init__(self, db_path: Path, cache_size: int):
+        self.db_path = db_path
+        self.cache_size = cache_size
+
+        self._cache: OrderedDict[tuple[str, str], bytes | None] = OrderedDict()
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS records (
+                    collection TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value BLOB NOT NULL,
+                    PRIMARY KEY (collection, key)
+                ) WITHOUT ROWID
+                """
+            )
+
+    @staticmethod
+    def _encode(val: dict) -> bytes:
+        return zlib.compress(json.dumps(val).encode("utf-8"))
+
+    @override
+    def put(self, key: str, val: dict, collection: str = DEFAULT_COLLECTION) -> None:
+        self.put_all([(key, val)], collection=collection)
+
+    @override
+    async def aput(self, key: str, val: dict, collection: str = DEFAULT_COLLECTION) -> None:
+        self.put(key, val, collection=collection)
+
+    @override
+    def put_all(
+        self,
+        kv_pairs: list[tuple[str, dict]],
+        collection: str = DEFAULT_COLLECTION,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ) -> None:
+        rows = [(collection, key, self._encode(val)) for key, val in kv_pairs]
+        with self._lock:
+            self._connection.executemany("INSERT OR REPLACE INTO records VALUES (?, ?, ?)", rows)
+            for key, _ in kv_pairs:
+                self._cache.pop((collection, key), None)
+
+    @override
+    async def aput_all(
+        self,
+        kv_pairs: list[tuple[str, dict]],
+        collection: str = DEFAULT_COLLECTION,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ) -> None:
+        self.put_all(kv_pairs, collection=collection, batch_size=batch_size)
+
+    @override
+    def get(self, key: str, collection: str = DEFAULT_COLLECTION) -> dict | None:
+        cache_key = (collection, key)
+        with self._lock:
+            if cache_key in self._cache:
+                self._cache.move_to_end(cache_key)
+                record = self._cache[cache_key]
+            else:
+                row = self._connection.execute(
+                    "SELECT value FROM records WHERE collection = ? AND key = ?", (collection, key)
+                ).fetchone()
+                # Cache the decompressed JSON, so callers cannot change cached records
+                record = zlib.decompress(row[0]) if row is not None else None
+                self._cache[cache_key] = record
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return json.loads(record) if record is not None else None
+
+    @override
+    async def aget(self, key: str, collection: str = DEFAULT_COLLECTION) -> dict | None:
+        return self.get(key, collection=collection)
+
+    @override
+    def get_all(self, collection: str = DEFAULT_COLLECTION) -> dict[str, dict]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT key, value FROM records WHERE collection = ?", (collection,)
+            ).fetchall()
+        return {key: json.loads(zlib.decompress(value)) for key, value in rows}
+
+    def iter_all(self, collection: str = DEFAULT_COLLECTION) -> Iterator[tuple[str, dict]]:
+        """Read the records of a collection in pages, without caching them."""
+        last_key = ""
+        while True:
+            with self._lock:
+                rows = self._connection.execute(
+                    "SELECT key, value FROM records WHERE collection = ? AND key > ? ORDER BY key LIMIT ?",
+                    (collection, last_key, ITER_PAGE_SIZE),
+                ).fetchall()
+            if not rows:
+                return
+            for key, value in rows:
+                yield key, json.loads(zlib.decompress(value))
+            last_key = rows[-1][0]
+
+    def get_keys(self, collection: str = DEFAULT_COLLECTION) -> list[str]:
+        """Get the keys of the records of a collection, without reading the records."""
+        with self._lock:
+            rows = self._connection.execute("SELECT key FROM records WHERE collection = ?", (collection,)).fetchall()
+        return [key for (key,) in rows]
+
+    def iter_many(self, keys: Iterable[str], collection: str = DEFAULT_COLLECTION) -> Iterator[tuple[str, dict]]:
+        """Read the records with the given keys in batches, without caching them. Missing keys are skipped."""
+        keys = list(keys)
+        for start in range(0, len(keys), LOOKUP_BATCH_SIZE):
+            batch = keys[start : start + LOOKUP_BATCH_SIZE]
+            placeholders = ", ".join("?" * len(batch))
+            with self._lock:
+                rows = self._connection.execute(
+                    f"SELECT key, value FROM records WHERE collection = ? AND key IN ({placeholders})",  # noqa: S608
+                    (collection, *batch),
+                ).fetchall()
+            for key, value in rows:
+                yield key, json.loads(zlib.decompress(value))
+
+    @override
+    async def aget_all(self, collection: str = DEFAULT_COLLECTION) -> dict[str, dict]:
+        return self.get_all(collection=collection)
+
+    @override
+    def delete(self, key: str, collection: str = DEFAULT_COLLECTION) -> bool:
+        with self._lock:
+            cursor = self._connection.execute("DELETE FROM records WHERE collection = ? AND key = ?", (collection, key))
+            self._cache.pop((collection, key), None)
+        return cursor.rowcount > 0
+
+    @override
+    async def adelete(self, key: str, collection: str = DEFAULT_COLLECTION) -> bool:
+        return self.delete(key, collection=collection)
+
+    def clear(self) -> None:
+        """Delete all records."""
+        with self._lock:
+            self._connection.execute("DELETE FROM records")
+            self._cache.clear()
+
+    def persist(self) -> None:
+        """Commit the changes made since the last call."""
+        with self._lock:
+            self._connection.commit()
+
+
+class SQLiteDocumentStore(KVDocumentStore):
+    """A document store which keeps nodes in a compressed SQLite file and loads them when they are used."""
+
+    def __init__(self, db_path: Path, cache_size: int):
+        self._sqlite_kvstore = SQLiteKVStore(db_path, cache_size)
+        super().__init__(self._sqlite_kvstore)
+
+    @override
+    def persist(self, persist_path: str = "", fs: Any = None) -> None:
+        """Commit the changes to the database file. The persist path is ignored."""
+        self._sqlite_kvstore.persist()
+
+    def get_node_ids(self) -> list[str]:
+        """Get the IDs of the stored nodes, without reading the nodes."""
+        return self._sqlite_kvstore.get_keys(collection=self._node_collection)
+
+    def iter_nodes(self, node_ids: Iterable[str] | None = None) -> Iterator[BaseNode]:
+        """Read the stored nodes one at a time.
+
+        Args:
+            node_ids: Read only the nodes with these IDs, instead of all nodes.
+        """
+        if node_ids is None:
+            records = self._sqlite_kvstore.iter_all(collection=self._node_collection)
+        else:
+            records = self._sqlite_kvstore.iter_many(node_ids, collection=self._node_collection)
+        for _, record in records:
+            yield json_to_doc(record)
+
+    def clear(self) -> None:
+        """Remove all nodes from the store. The change is stored when the store is persisted."""
+        self._sqlite_kvstore.clear()
@@ -1,17 +1,33 @@
 import logging
 import shutil
+from collections.abc import Iterator
 from pathlib import Path
 
 from llama_index.core import StorageContext, VectorStoreIndex, load_index_from_storage
+from llama_index.core.base.base_retriever import BaseRetriever
 from llama_index.core.indices.base import BaseIndex
-from llama_index.core.readers.base import BaseReader
+from llama_index.core.readers.base import BaseReader, ResourcesReaderMixin
+from llama_index.core.schema import BaseNode, MetadataMode
 
+from ragamuffin.error_handling import ensure_int
+from ragamuffin.models.highlighter import SemanticHighlighter, SentenceStore
 from ragamuffin.models.model_picker import configure_llamaindex_embedding_model
 from ragamuffin.settings import get_settings
+from ragamuffin.storage.bm25_index import BM25_INDEX_FILENAME, BM25Index
+from ragamuffin.storage.checkpoint import CHECKPOINT_FILENAME, Checkpointer, remove_uncheckpointed_documents
+from ragamuffin.storage.docstore import DOCSTORE_FILENAME, LEGACY_DOCSTORE_FILENAME, SQLiteDocumentStore
+from ragamuffin.storage.hybrid_retriever import BM25Retriever, HybridRetriever
+from ragamuffin.storage.ingest import insert_documents, iter_changed_documents, iter_documents
 from ragamuffin.storage.interface import Storage
+from ragamuffin.storage.manifest import MANIFEST_FILENAME, Manifest
+from ragamuffin.storage.sentence_store import MmapSentenceStore
+from ragamuffin.storage.vector_store import VECTOR_STORE_FILENAME, MmapVectorStore
 
 logger = logging.getLogger(__name__)
 
+# Recall@10 of the ANN index against exact search below which a warning is shown
+MIN_ANN_RECALL = 0.9
+
 
 class FileStorage(Storage):
     def __init__(self):
@@ -27,27 +43,254 @@ class FileStorage(Storage):
         persist_dir.mkdir(parents=True, exist_ok=True)
         return persist_dir
 
-    def generate_index(self, agent_name: str, reader: BaseReader) -> BaseIndex:
-        """Load the documents and create a RAG index."""
-        logger.info("Loading documents...")
-        documents = reader.load_data()
+    def generate_index(
+        self, agent_name: str, reader: BaseReader, embed_workers: int = 1, resume: bool = False
+    ) -> BaseIndex:
+        """Load the documents and create a RAG index.
+
+        If the agent was generated before, only new and changed files are indexed
+        and documents generated from deleted files are removed from the index.
+
+        The index is stored in checkpoints while documents are indexed. If `resume` is set,
+        files which were indexed before the last checkpoint of an interrupted run are skipped.
+        """
+        # The embedding model is also needed by the returned index when the agent is up to date
+        configure_llamaindex_embedding_model(embed_workers=embed_workers)
+        if not isinstance(reader, ResourcesReaderMixin):
+            if resume:
+                logger.warning("Resuming is only supported for libraries of files, generating the whole agent.")
+            return self._generate_full_index(agent_name, reader)
+
+        agent_dir = self.get_agent_storage_dir(agent_name)
+        manifest_path = agent_dir / MANIFEST_FILENAME
+        checkpoint_path = agent_dir / CHECKPOINT_FILENAME
+        is_resumed = resume and checkpoint_path.exists()
+        previous_manifest, is_update = self._load_previous_manifest(agent_dir, resume)
+
+        logger.info("Checking library files for changes...")
+        manifest = previous_manifest.scan(reader)
+        diff = (previous_manifest if is_update else Manifest()).diff(manifest)
+
+        if is_update and diff.is_empty() and not is_resumed:
+            logger.info("The index is up to date.")
+            return self.load_index(agent_name)
+
+        settings = get_settings()
+        batch_size = ensure_int(settings.get("ingest_batch_size"))
+
+        if is_update:
+            logger.info(
+                f"Found {len(diff.added)} new, {len(diff.modified)} modified and {len(diff.removed)} deleted files."
+            )
+            index = self.load_index(agent_name)
+            if is_resumed:
+                remove_uncheckpointed_documents(index, previous_manifest)
+            logger.info("Removing outdated documents from the index...")
+            for doc_id in previous_manifest.get_doc_ids(diff.stale):
+                index.delete_ref_doc(doc_id, delete_from_docstore=True)
+        else:
+            index = self._create_index(agent_dir)
+
+        def save_checkpoint(checkpoint: Manifest) -> None:
+            # The stored index no longer matches the manifest of the previous run
+            manifest_path.unlink(missing_ok=True)
+            # The vector store only appends the embeddings added since the previous checkpoint
+            index.storage_context.persist(persist_dir=agent_dir)
+            checkpoint.save(checkpoint_path)
+
+        checkpointer = Checkpointer(
+            save_checkpoint, manifest, diff.changed, interval=ensure_int(settings.get("checkpoint_interval"))
+        )
 
+        logger.info("Loading documents and generating RAG embeddings...")
+        documents = iter_changed_documents(reader, diff.changed, manifest)
+        insert_documents(index, documents, batch_size, on_batch=checkpointer.on_batch)
+
+        self._persist_index(index, agent_dir, is_update=is_update)
+        manifest.save(manifest_path)
+        checkpoint_path.unlink(missing_ok=True)
+        return index
+
+    def _load_previous_manifest(self, agent_dir: Path, resume: bool) -> tuple[Manifest, bool]:
+        """Load the manifest of the stored index, or the checkpoint of an interrupted run if it is resumed.
+
+        Returns:
+            The manifest, and whether the stored index can be updated.
+        """
+        manifest_path = agent_dir / MANIFEST_FILENAME
+        checkpoint_path = agent_dir / CHECKPOINT_FILENAME
+        if resume and checkpoint_path.exists():
+            logger.info("Resuming from the last checkpoint...")
+            return Manifest.load(checkpoint_path), True
+
+        if resume:
+            logger.info("No checkpoint found, the agent is generated normally.")
+        elif checkpoint_path.exists():
+            logger.info("A previous run was interrupted. Use --resume to continue it.")
+        # Agents stored in legacy JSON formats are generated again
+        return Manifest.load(manifest_path), manifest_path.exists() and self._is_current_format(agent_dir)
+
+    def _generate_full_index(self, agent_name: str, reader: BaseReader) -> BaseIndex:
+        """Load all documents from the reader and create a new RAG index."""
         # Configure chunking settings
-        configure_llamaindex_embedding_model()
+        batch_size = ensure_int(get_settings().get("ingest_batch_size"))
 
         # Build the index from documents and persist to disk
-        logger.info("Generating RAG embeddings...")
-        index = VectorStoreIndex.from_documents(documents)
-        logger.info("Storing the index in the file system...")
-        index.storage_context.persist(persist_dir=self.get_agent_storage_dir(agent_name))
+        logger.info("Loading documents and generating RAG embeddings...")
+        agent_dir = self.get_agent_storage_dir(agent_name)
+        index = self._create_index(agent_dir)
+        insert_documents(index, iter_documents(reader), batch_size)
+
+        self._persist_index(index, agent_dir)
+        (agent_dir / MANIFEST_FILENAME).unlink(missing_ok=True)
+        (agent_dir / CHECKPOINT_FILENAME).unlink(missing_ok=True)
         return index
 
+    @staticmethod
+    def _persist_index(index: BaseIndex, agent_dir: Path, is_update: bool = False) -> None:
+        """Update the ANN, keyword and sentence indexes of the agent and store the index in the agent directory.
+
+        Args:
+            index: The index of the agent.
+            agent_dir: The agent directory.
+            is_update: Whether a stored agent was updated, so the keyword and sentence indexes only need
+                the nodes which were added since they were built.
+        """
+        vector_store = index.storage_context.vector_store
+        if isinstance(vector_store, MmapVectorStore):
+            min_vectors = ensure_int(get_settings().get("ann_min_vectors"))
+            if 0 < min_vectors <= len(vector_store.embeddings):
+                logger.info("Building the approximate nearest-neighbour index...")
+                vector_store.build_ann_index()
+                recall = vector_store.measure_recall(k=10)
+                logger.info(f"Recall@10 of the ANN index with nprobe={vector_store.nprobe}: {recall:.3f}")
+                if recall < MIN_ANN_RECALL:
+                    logger.warning("The ANN index has low recall. Consider raising RAGAMUFFIN_ANN_NPROBE.")
+            else:
+                vector_store.drop_ann_index()
+
+        docstore = index.storage_context.docstore
+        if isinstance(docstore, SQLiteDocumentStore):
+            # When an agent is updated, only the added nodes are read, and the rows of the others are kept
+            node_ids = docstore.get_node_ids() if is_update else None
+            FileStorage._persist_keyword_index(docstore, agent_dir, node_ids)
+            FileStorage._persist_sentence_store(docstore, agent_dir, node_ids)
+
+        logger.info("Storing the index in the file system...")
+        index.storage_context.persist(persist_dir=agent_dir)
+        (agent_dir / LEGACY_DOCSTORE_FILENAME).unlink(missing_ok=True)
+
+    @staticmethod
+    def _persist_keyword_index(docstore: SQLiteDocumentStore, agent_dir: Path, node_ids: list[str] | None) -> None:
+        """Build the keyword index of the agent, or update it to the given nodes if it is stored."""
+
+        def load_nodes(node_ids: list[str] | None = None) -> Iterator[tuple[str, str, str]]:
+            for node in docstore.iter_nodes(node_ids):
+                yield node.node_id, node.ref_doc_id or "", node.get_content(metadata_mode=MetadataMode.NONE)
+
+        bm25_path = agent_dir / BM25_INDEX_FILENAME
+        previous = BM25Index.load(bm25_path) if node_ids is not None and bm25_path.exists() else None
+        # Keyword indexes saved without term counts are built again
+        if node_ids is not None and previous is not None and previous.is_updatable:
+            logger.info("Updating the keyword index...")
+            bm25_index = previous.update(node_ids, load_nodes)
+        else:
+            logger.info("Building the keyword index...")
+            bm25_index = BM25Index.build(load_nodes())
+        bm25_index.save(bm25_path)
+
+    @staticmethod
+    def _persist_sentence_store(docstore: SQLiteDocumentStore, agent_dir: Path, node_ids: list[str] | None) -> None:
+        """Build the sentence store of the agent, or update it to the given nodes, if highlights are precomputed."""
+        if not get_settings().get("precompute_highlights"):
+            MmapSentenceStore.delete(agent_dir)
+            return
+
+        def load_nodes(node_ids: list[str] | None = None) -> Iterator[tuple[str, str]]:
+            for node in docstore.iter_nodes(node_ids):
+                yield node.node_id, node.get_content()
+
+        logger.info("Computing sentence embeddings for highlighting...")
+        if node_ids is not None:
+            MmapSentenceStore.update(agent_dir, node_ids, load_nodes, SemanticHighlighter())
+        else:
+            MmapSentenceStore.build(agent_dir, load_nodes(), SemanticHighlighter())
+
+    @staticmethod
+    def _is_current_format(agent_dir: Path) -> bool:
+        """Check if the agent's nodes and embeddings are stored in the current formats."""
+        return (agent_dir / DOCSTORE_FILENAME).exists() and MmapVectorStore.is_persisted(
+            agent_dir / VECTOR_STORE_FILENAME
+        )
+
+    @staticmethod
+    def _create_index(agent_dir: Path) -> VectorStoreIndex:
+        """Create an empty index, replacing the stored nodes of the agent when it is persisted."""
+        settings = get_settings()
+        docstore = SQLiteDocumentStore(
+            agent_dir / DOCSTORE_FILENAME, cache_size=ensure_int(settings.get("docstore_cache_size"))
+        )
+        docstore.clear()
+        vector_store = MmapVectorStore(
+            dtype=str(settings.get("vector_dtype")), nprobe=ensure_int(settings.get("ann_nprobe"))
+        )
+        storage_context = StorageContext.from_defaults(docstore=docstore, vector_store=vector_store)
+        return VectorStoreIndex(nodes=[], storage_context=storage_context)
+
     def load_index(self, agent_name: str) -> BaseIndex:
-        """Load the index from storage."""
-        persist_dir = str(self.get_agent_storage_dir(agent_name))
-        storage_context = StorageContext.from_defaults(persist_dir=persist_dir)
+        """Load the index from storage.
+
+        Nodes are read from the docstore file when they are retrieved, and embeddings are memory-mapped.
+        Agents stored in legacy JSON formats are loaded into memory.
+        """
+        settings = get_settings()
+        persist_dir = self.get_agent_storage_dir(agent_name)
+
+        docstore = None
+        docstore_path = persist_dir / DOCSTORE_FILENAME
+        if docstore_path.exists():
+            docstore = SQLiteDocumentStore(docstore_path, cache_size=ensure_int(settings.get("docstore_cache_size")))
+
+        vector_store = None
+        vector_store_path = persist_dir / VECTOR_STORE_FILENAME
+        if MmapVectorStore.is_persisted(vector_store_path):
+            nprobe = ensure_int(settings.get("ann_nprobe"))
+            vector_store = MmapVectorStore.from_persist_path(vector_store_path, nprobe=nprobe)
+
+        storage_context = StorageContext.from_defaults(
+            persist_dir=str(persist_dir), docstore=docstore, vector_store=vector_store
+        )
         return load_index_from_storage(storage_context)
 
+    def load_retriever(self, agent_name: str, similarity_top_k: int) -> BaseRetriever:
+        """Load a retriever which fuses the results of embedding and keyword search.
+
+        Agents generated without a keyword index only use embedding search.
+        """
+        settings = get_settings()
+        index = self.load_index(agent_name)
+        bm25_path = self.get_agent_storage_dir(agent_name) / BM25_INDEX_FILENAME
+        if not settings.get("hybrid_search") or not bm25_path.exists():
+            return index.as_retriever(similarity_top_k=similarity_top_k)
+
+        def get_nodes(node_ids: list[str], _: list[str]) -> list[BaseNode]:
+            nodes = [index.docstore.get_node(node_id, raise_error=False) for node_id in node_ids]
+            return [node for node in nodes if node is not None]
+
+        candidates = max(similarity_top_k, ensure_int(settings.get("hybrid_candidates")))
+        return HybridRetriever(
+            [
+                index.as_retriever(similarity_top_k=candidates),
+                BM25Retriever(BM25Index.load(bm25_path), get_nodes, candidates),
+            ],
+            similarity_top_k,
+        )
+
+    def load_sentence_store(self, agent_name: str) -> SentenceStore | None:
+        """Load the sentence embeddings computed for highlighting when the agent was generated, if any."""
+        agent_dir = self.get_agent_storage_dir(agent_name)
+        return MmapSentenceStore.load(agent_dir) if MmapSentenceStore.is_persisted(agent_dir) else None
+
     def list_agents(self) -> list[str]:
         """Get the list of agents."""
         return [path.name for path in self.persist_dir.iterdir() if path.is_dir()]
@@ -0,0 +1,124 @@
+from collections.abc import Callable
+
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.schema import BaseNode, NodeWithScore, QueryBundle
+from llama_index.core.vector_stores.types import BasePydanticVectorStore, VectorStoreQuery, VectorStoreQueryMode
+from typing_extensions import override
+
+from ragamuffin.storage.bm25_index import BM25Index
+
+# Rank offset of reciprocal-rank fusion, which damps the weight of the first few ranks
+RRF_K = 60
+
+
+def reciprocal_rank_fusion(rankings: list[list[NodeWithScore]], top_k: int, k: int = RRF_K) -> list[NodeWithScore]:
+    """Merge ranked lists of nodes by the sum of the reciprocal ranks of each node.
+
+    Scores are scaled so that a node ranked first in every list has a score of 1.
+
+    Args:
+        rankings: Lists of nodes, best first.
+        top_k: The number of nodes to return.
+        k: The rank offset.
+    """
+    scores: dict[str, float] = {}
+    nodes: dict[str, NodeWithScore] = {}
+    for ranking in rankings:
+        for rank, node in enumerate(ranking, start=1):
+            scores[node.node.node_id] = scores.get(node.node.node_id, 0.0) + 1 / (k + rank)
+            nodes.setdefault(node.node.node_id, node)
+
+    max_score = len(rankings) / (k + 1)
+    best_ids = sorted(scores, key=lambda node_id: scores[node_id], reverse=True)[:top_k]
+    return [NodeWithScore(node=nodes[node_id].node, score=scores[node_id] / max_score) for node_id in best_ids]
+
+
+class HybridRetriever(BaseRetriever):
+    """Retrieve nodes with several retrievers, e.g. dense and keyword search, and fuse their rankings."""
+
+    def __init__(self, retrievers: list[BaseRetriever], similarity_top_k: int):
+        super().__init__()
+        self.retrievers = retrievers
+        self.similarity_top_k = similarity_top_k
+
+    @override
+    def _retrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        rankings = [retriever.retrieve(query_bundle) for retriever in self.retrievers]
+        return reciprocal_rank_fusion(rankings, self.similarity_top_k)
+
+
+class BM25Retriever(BaseRetriever):
+    """Retrieve the nodes with the highest BM25 scores from a sparse index."""
+
+    def __init__(
+        self,
+        bm25_index: BM25Index,
+        get_nodes: Callable[[list[str], list[str]], list[BaseNode]],
+        similarity_top_k: int,
+    ):
+        """Create the retriever.
+
+        Args:
+            bm25_index: The sparse index of the agent.
+            get_nodes: Loads nodes from storage, given their IDs and the IDs of their source documents.
+                Nodes which are no longer stored can be left out.
+            similarity_top_k: The number of nodes to retrieve.
+        """
+        super().__init__()
+        self.bm25_index = bm25_index
+        self.get_nodes = get_nodes
+        self.similarity_top_k = similarity_top_k
+
+    @override
+    def _retrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        matches = self.bm25_index.search(query_bundle.query_str, self.similarity_top_k)
+        if not matches:
+            return []
+        node_ids = [str(self.bm25_index.node_ids[row]) for row, _ in matches]
+        ref_doc_ids = [str(self.bm25_index.ref_doc_ids[row]) for row, _ in matches]
+        nodes = {node.node_id: node for node in self.get_nodes(node_ids, ref_doc_ids)}
+        return [
+            NodeWithScore(node=nodes[node_id], score=score)
+            for node_id, (_, score) in zip(node_ids, matches, strict=True)
+            if node_id in nodes
+        ]
+
+
+class TextSearchRetriever(BaseRetriever):
+    """Retrieve nodes with the keyword search of a vector store, without embedding the query."""
+
+    def __init__(self, vector_store: BasePydanticVectorStore, similarity_top_k: int):
+        super().__init__()
+        self.vector_store = vector_store
+        self.similarity_top_k = similarity_top_k
+
+    @override
+    def _retrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        query = VectorStoreQuery(
+            query_str=query_bundle.query_str,
+            similarity_top_k=self.similarity_top_k,
+            mode=VectorStoreQueryMode.TEXT_SEARCH,
+        )
+        result = self.vector_store.query(query)
+        return [
+            NodeWithScore(node=node, score=score)
+            for node, score in zip(result.nodes or [], result.similarities or [], strict=True)
+        ]
+
+
+class QueryRecordingRetriever(BaseRetriever):
+    """Retrieve nodes with another retriever and keep the last query, with the embedding computed for it.
+
+    The source highlighter uses the recorded embedding instead of embedding the query again.
+    """
+
+    def __init__(self, retriever: BaseRetriever):
+        super().__init__()
+        self.retriever = retriever
+        self.last_query: QueryBundle | None = None
+
+    @override
+    def _retrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        nodes = self.retriever.retrieve(query_bundle)
+        self.last_query = query_bundle
+        return nodes
@@ -0,0 +1,101 @@
+import logging
+from collections.abc import Callable, Iterable, Iterator
+from itertools import islice
+from typing import TypeVar
+
+from llama_index.core import Document, Settings, SimpleDirectoryReader
+from llama_index.core.indices.base import BaseIndex
+from llama_index.core.ingestion import run_transformations
+from llama_index.core.readers.base import BaseReader, ResourcesReaderMixin
+
+from ragamuffin.cli.utils import track
+from ragamuffin.libraries.git_repo import GitTreeReader
+from ragamuffin.libraries.readers import LibraryReader
+from ragamuffin.models.embedding_cache import CachedEmbedding
+from ragamuffin.storage.manifest import Manifest
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def batched(items: Iterable[T], batch_size: int) -> Iterator[list[T]]:
+    """Split an iterable into lists of at most `batch_size` items."""
+    iterator = iter(items)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
+
+
+def iter_documents(reader: BaseReader) -> Iterator[Document]:
+    """Load documents from the reader one at a time, if the reader supports it."""
+    if isinstance(reader, SimpleDirectoryReader):
+        for file_documents in reader.iter_data():
+            yield from file_documents
+        return
+
+    try:
+        documents = reader.lazy_load_data()
+    except NotImplementedError:
+        documents = reader.load_data()
+    yield from documents
+
+
+def iter_resource_documents(
+    reader: ResourcesReaderMixin, resource_ids: list[str]
+) -> Iterator[tuple[str, list[Document]]]:
+    """Load the documents from each of the given resources, in order."""
+    if isinstance(reader, LibraryReader | GitTreeReader):
+        yield from reader.iter_resources(resource_ids)
+        return
+
+    for resource_id in resource_ids:
+        yield resource_id, reader.load_resource(resource_id)
+
+
+def iter_changed_documents(reader: ResourcesReaderMixin, paths: list[str], manifest: Manifest) -> Iterator[Document]:
+    """Load documents from the changed files one file at a time and record their IDs in the manifest.
+
+    Files which could not be loaded are left out of the manifest, so they are retried on the next run.
+    """
+    loaded_paths = set()
+    for path, file_documents in track(
+        iter_resource_documents(reader, paths), total=len(paths), description="Indexing..."
+    ):
+        manifest.entries[path].doc_ids = [document.doc_id for document in file_documents]
+        loaded_paths.add(path)
+        yield from file_documents
+
+    for path in paths:
+        if path not in loaded_paths:
+            del manifest.entries[path]
+
+
+def insert_documents(
+    index: BaseIndex,
+    documents: Iterable[Document],
+    batch_size: int,
+    on_batch: Callable[[list[Document]], None] | None = None,
+) -> int:
+    """Chunk, embed and store documents in the index in fixed-size batches.
+
+    Only one batch of documents and their nodes is held in memory at a time.
+    The `on_batch` callback is called with each batch after it was inserted.
+
+    Returns:
+        The number of inserted documents.
+    """
+    document_count = 0
+    for batch in batched(documents, batch_size):
+        nodes = run_transformations(batch, Settings.transformations)
+        index.insert_nodes(nodes)
+        for document in batch:
+            index.docstore.set_document_hash(document.doc_id, document.hash)
+        if on_batch is not None:
+            on_batch(batch)
+
+        document_count += len(batch)
+        logger.debug(f"Inserted a batch of {len(batch)} documents ({len(nodes)} nodes).")
+
+    if isinstance(Settings.embed_model, CachedEmbedding):
+        Settings.embed_model.cache.log_stats()
+    return document_count
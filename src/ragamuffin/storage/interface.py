@@ -1,18 +1,37 @@
 from abc import ABC, abstractmethod
 
+from llama_index.core.base.base_retriever import BaseRetriever
 from llama_index.core.indices.base import BaseIndex
 from llama_index.core.readers.base import BaseReader
 
+from ragamuffin.models.highlighter import SentenceStore
+
 
 class Storage(ABC):
     @abstractmethod
-    def generate_index(self, agent_name: str, reader: BaseReader) -> BaseIndex:
-        """Load the documents and create a RAG index."""
+    def generate_index(
+        self, agent_name: str, reader: BaseReader, embed_workers: int = 1, resume: bool = False
+    ) -> BaseIndex:
+        """Load the documents and create a RAG index.
+
+        If `resume` is set, an interrupted run is continued from its last checkpoint, if the storage supports it.
+        """
 
     @abstractmethod
     def load_index(self, agent_name: str) -> BaseIndex:
         """Load the index from storage."""
 
+    def load_retriever(self, agent_name: str, similarity_top_k: int) -> BaseRetriever:
+        """Load a retriever of the agent's nodes.
+
+        Storages which keep a keyword index of the agent fuse its results with the embedding search results.
+        """
+        return self.load_index(agent_name).as_retriever(similarity_top_k=similarity_top_k)
+
+    def load_sentence_store(self, agent_name: str) -> SentenceStore | None:
+        """Load the sentence embeddings computed for highlighting when the agent was generated, if any."""
+        return None
+
     @abstractmethod
     def list_agents(self) -> list[str]:
         """Get the list of agents."""
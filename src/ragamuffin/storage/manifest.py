@@ -0,0 +1,124 @@
+import hashlib
+import json
+import logging
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+from llama_index.core.readers.base import ResourcesReaderMixin
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = "manifest.json"
+
+
+@dataclass
+class ManifestEntry:
+    size: int | None
+    mtime: float | None
+    content_hash: str
+    doc_ids: list[str] = field(default_factory=list)
+
+
+@dataclass
+class ManifestDiff:
+    added: list[str] = field(default_factory=list)
+    modified: list[str] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)
+
+    @property
+    def changed(self) -> list[str]:
+        """Files which need to be (re)indexed."""
+        return self.added + self.modified
+
+    @property
+    def stale(self) -> list[str]:
+        """Files whose documents need to be removed from the index."""
+        return self.modified + self.removed
+
+    def is_empty(self) -> bool:
+        """Check if there are no changes."""
+        return not (self.added or self.modified or self.removed)
+
+
+class Manifest:
+    """A record of the files in an agent's index and the documents generated from each of them."""
+
+    def __init__(self, entries: dict[str, ManifestEntry] | None = None):
+        self.entries = entries or {}
+
+    @classmethod
+    def from_dict(cls: type["Manifest"], data: dict[str, dict]) -> "Manifest":
+        """Create a manifest from its JSON-serializable form."""
+        return cls({path: ManifestEntry(**entry) for path, entry in data.items()})
+
+    def to_dict(self) -> dict[str, dict]:
+        """Get the JSON-serializable form of the manifest."""
+        return {path: asdict(entry) for path, entry in self.entries.items()}
+
+    @classmethod
+    def load(cls: type["Manifest"], manifest_path: Path) -> "Manifest":
+        """Load a manifest from a JSON file. Returns an empty manifest if the file does not exist."""
+        if not manifest_path.exists():
+            return cls()
+        with manifest_path.open() as f:
+            return cls.from_dict(json.load(f))
+
+    def save(self, manifest_path: Path) -> None:
+        """Save the manifest to a JSON file."""
+        tmp_path = manifest_path.with_suffix(".tmp")
+        with tmp_path.open("w") as f:
+            json.dump(self.to_dict(), f)
+        tmp_path.replace(manifest_path)
+
+    def scan(self, reader: ResourcesReaderMixin) -> "Manifest":
+        """Create a manifest of the files currently available to the reader.
+
+        Content hashes are taken from the reader if it provides them. Otherwise, hashes from this manifest are
+        reused for files whose size and modification time did not change.
+        """
+        entries = {}
+        for resource_id in reader.list_resources():
+            info = reader.get_resource_info(resource_id)
+            size = info.get("file_size")
+            mtime = info.get("mtime")
+
+            previous = self.entries.get(resource_id)
+            content_hash = info.get("content_hash")
+            if content_hash is None:
+                if previous and previous.size == size and previous.mtime == mtime:
+                    content_hash = previous.content_hash
+                else:
+                    content_hash = hash_file(Path(resource_id))
+
+            entries[resource_id] = ManifestEntry(size=size, mtime=mtime, content_hash=content_hash)
+        return Manifest(entries)
+
+    def diff(self, current: "Manifest") -> ManifestDiff:
+        """Compare this manifest with a more recent one.
+
+        Document IDs of unchanged files are carried over to the current manifest.
+        """
+        diff = ManifestDiff()
+        for path, entry in current.entries.items():
+            previous = self.entries.get(path)
+            if previous is None:
+                diff.added.append(path)
+            elif previous.content_hash != entry.content_hash:
+                diff.modified.append(path)
+            else:
+                entry.doc_ids = previous.doc_ids
+        diff.removed = [path for path in self.entries if path not in current.entries]
+        return diff
+
+    def get_doc_ids(self, paths: list[str]) -> list[str]:
+        """Get the IDs of documents generated from the given files."""
+        return [doc_id for path in paths if path in self.entries for doc_id in self.entries[path].doc_ids]
+
+
+def hash_file(file_path: Path, chunk_size: int = 1024 * 1024) -> str:
+    """Calculate the SHA-256 hash of a file's contents."""
+    file_hash = hashlib.sha256()
+    with file_path.open("rb") as f:
+        while chunk := f.read(chunk_size):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
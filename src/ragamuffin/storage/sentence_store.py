@@ -0,0 +1,231 @@
+import logging
+from collections.abc import Callable, Iterable
+from pathlib import Path
+
+import numpy as np
+
+from ragamuffin.models.highlighter import SemanticHighlighter, SentenceEmbeddings, SentenceStore
+
+logger = logging.getLogger(__name__)
+
+SENTENCE_INDEX_FILENAME = "sentence_index.npz"
+SENTENCE_EMBEDDINGS_FILENAME = "sentence_embeddings.npy"
+
+# Number of sentences embedded at a time when the store is built
+EMBED_BATCH_SENTENCES = 1024
+
+
+class MmapSentenceStore(SentenceStore):
+    """Sentence spans and embeddings of the nodes of an agent, stored in the agent directory.
+
+    The embeddings of all sentences are kept as unit-length float16 vectors in a binary NumPy file,
+    memory-mapped when the store is loaded, so highlighting a source only reads its own rows.
+    A NumPy archive holds the node IDs, the first row of each node and the character spans of the sentences.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        model_name: str,
+        node_ids: np.ndarray,
+        text_hashes: np.ndarray,
+        node_offsets: np.ndarray,
+        spans: np.ndarray,
+        embeddings: np.ndarray,
+    ):
+        """Create the store.
+
+        Args:
+            model_name: The model which computed the embeddings.
+            node_ids: The ID of each node.
+            text_hashes: A hash of the text of each node, which shows if the sentences must be computed again.
+            node_offsets: The first row of each node, followed by the number of rows.
+            spans: The start and end offset of each sentence in the text of its node.
+            embeddings: The unit-length embedding of each sentence.
+        """
+        self.model_name = model_name
+        self.node_ids = node_ids
+        self.text_hashes = text_hashes
+        self.node_offsets = node_offsets
+        self.spans = spans
+        self.embeddings = embeddings
+        self._node_rows = {str(node_id): i for i, node_id in enumerate(node_ids)}
+
+    def get(self, node_id: str) -> SentenceEmbeddings | None:
+        """Get the sentence embeddings of a node, if they were computed."""
+        i = self._node_rows.get(node_id)
+        if i is None:
+            return None
+        rows = slice(self.node_offsets[i], self.node_offsets[i + 1])
+        return SentenceEmbeddings(self.spans[rows], self.embeddings[rows])
+
+    def get_text_hash(self, node_id: str) -> int:
+        """Get the hash of the text whose sentences are stored for a node."""
+        return int(self.text_hashes[self._node_rows[node_id]])
+
+    def get_unchanged(self, node_id: str, text_hash: int) -> SentenceEmbeddings | None:
+        """Get the sentence embeddings of a node, if they were computed for a text with the given hash."""
+        i = self._node_rows.get(node_id)
+        if i is None or int(self.text_hashes[i]) != text_hash:
+            return None
+        return self.get(node_id)
+
+    @staticmethod
+    def is_persisted(agent_dir: Path) -> bool:
+        """Check if the agent directory contains a sentence store."""
+        return (agent_dir / SENTENCE_INDEX_FILENAME).exists() and (agent_dir / SENTENCE_EMBEDDINGS_FILENAME).exists()
+
+    @classmethod
+    def load(cls: type["MmapSentenceStore"], agent_dir: Path) -> "MmapSentenceStore":
+        """Load the store from the agent directory, memory-mapping the embeddings."""
+        with np.load(agent_dir / SENTENCE_INDEX_FILENAME, allow_pickle=False) as arrays:
+            return cls(
+                str(arrays["model_name"]),
+                arrays["node_ids"],
+                arrays["text_hashes"],
+                arrays["node_offsets"],
+                arrays["spans"],
+                np.load(agent_dir / SENTENCE_EMBEDDINGS_FILENAME, mmap_mode="r"),
+            )
+
+    @staticmethod
+    def delete(agent_dir: Path) -> None:
+        """Delete the store from the agent directory."""
+        (agent_dir / SENTENCE_INDEX_FILENAME).unlink(missing_ok=True)
+        (agent_dir / SENTENCE_EMBEDDINGS_FILENAME).unlink(missing_ok=True)
+
+    @classmethod
+    def build(
+        cls: type["MmapSentenceStore"],
+        agent_dir: Path,
+        nodes: Iterable[tuple[str, str]],
+        highlighter: SemanticHighlighter,
+    ) -> None:
+        """Split the text of the nodes into sentences, embed them and save the store in the agent directory.
+
+        Args:
+            agent_dir: The agent directory.
+            nodes: Tuples of the ID and the text of each node.
+            highlighter: The highlighter which splits and embeds the sentences.
+        """
+        writer = _SentenceStoreWriter(agent_dir, highlighter)
+        for node_id, text in nodes:
+            writer.add(node_id, cls.hash_text(text), text)
+        writer.close()
+        logger.info(f"Stored {writer.num_rows} sentence embeddings.")
+
+    @classmethod
+    def update(
+        cls: type["MmapSentenceStore"],
+        agent_dir: Path,
+        node_ids: Iterable[str],
+        load_nodes: Callable[[list[str]], Iterable[tuple[str, str]]],
+        highlighter: SemanticHighlighter,
+    ) -> None:
+        """Update the store of the agent to hold the given nodes, embedding only the nodes which are not in it.
+
+        The rows of the other nodes are copied from the previous store. The store is built again if it is
+        missing or was computed by another model.
+
+        Args:
+            agent_dir: The agent directory.
+            node_ids: The IDs of the nodes of the updated store.
+            load_nodes: Loads the ID and the text of each of the given new nodes.
+            highlighter: The highlighter which splits and embeds the sentences.
+        """
+        previous = cls.load(agent_dir) if cls.is_persisted(agent_dir) else None
+        if previous is None or previous.model_name != highlighter.model_name:
+            cls.build(agent_dir, load_nodes(list(node_ids)), highlighter)
+            return
+
+        writer = _SentenceStoreWriter(agent_dir, highlighter)
+        new_node_ids = []
+        for node_id in node_ids:
+            sentences = previous.get(node_id)
+            if sentences is None:
+                new_node_ids.append(node_id)
+            else:
+                writer.write(node_id, previous.get_text_hash(node_id), sentences)
+        del previous
+        for node_id, text in load_nodes(new_node_ids):
+            writer.add(node_id, cls.hash_text(text), text)
+        writer.close()
+        logger.info(f"Stored {writer.num_rows} sentence embeddings, {writer.num_embedded} of them new.")
+
+
+class _SentenceStoreWriter:
+    """Write the rows of a sentence store to temporary files, embedding new sentences in batches."""
+
+    def __init__(self, agent_dir: Path, highlighter: SemanticHighlighter):
+        self.agent_dir = agent_dir
+        self.highlighter = highlighter
+        self.node_ids: list[str] = []
+        self.text_hashes: list[int] = []
+        self.node_offsets = [0]
+        self.spans: list[np.ndarray] = []
+        self.num_embedded = 0
+        self._pending: list[tuple[str, int, str]] = []
+        self._pending_length = 0
+        self._dimension: int | None = None
+        self._rows_path = agent_dir / f"{SENTENCE_EMBEDDINGS_FILENAME}.rows.tmp"
+        self._rows_file = self._rows_path.open("wb")
+
+    @property
+    def num_rows(self) -> int:
+        """The number of sentences written."""
+        return self.node_offsets[-1]
+
+    def add(self, node_id: str, text_hash: int, text: str) -> None:
+        """Queue a node whose sentences are embedded with the next batch."""
+        self._pending.append((node_id, text_hash, text))
+        # Roughly one sentence per hundred characters
+        self._pending_length += len(text) // 100 + 1
+        if self._pending_length >= EMBED_BATCH_SENTENCES:
+            self._flush()
+
+    def write(self, node_id: str, text_hash: int, sentences: SentenceEmbeddings) -> None:
+        """Write the sentences of a node."""
+        self.node_ids.append(node_id)
+        self.text_hashes.append(text_hash)
+        self.node_offsets.append(self.node_offsets[-1] + len(sentences.spans))
+        self.spans.append(sentences.spans)
+        if len(sentences.spans):
+            self._dimension = sentences.embeddings.shape[1]
+            self._rows_file.write(np.ascontiguousarray(sentences.embeddings, dtype=np.float16).tobytes())
+
+    def close(self) -> None:
+        """Embed the remaining sentences and replace the store of the agent."""
+        self._flush()
+        self._rows_file.close()
+
+        index_path = self.agent_dir / f"{SENTENCE_INDEX_FILENAME}.tmp.npz"
+        embeddings_path = self.agent_dir / f"{SENTENCE_EMBEDDINGS_FILENAME}.tmp.npy"
+        rows: np.ndarray
+        if self.num_rows:
+            rows = np.memmap(self._rows_path, dtype=np.float16, mode="r", shape=(self.num_rows, self._dimension or 0))
+        else:
+            rows = np.zeros((0, 0), dtype=np.float16)
+        np.save(embeddings_path, rows)
+        del rows
+        np.savez(
+            index_path,
+            model_name=np.array(self.highlighter.model_name),
+            node_ids=np.array(self.node_ids, dtype=np.str_),
+            text_hashes=np.array(self.text_hashes, dtype=np.uint64),
+            node_offsets=np.array(self.node_offsets, dtype=np.int64),
+            spans=np.concatenate(self.spans) if self.spans else np.zeros((0, 2), dtype=np.int64),
+        )
+        self._rows_path.unlink()
+        embeddings_path.replace(self.agent_dir / SENTENCE_EMBEDDINGS_FILENAME)
+        index_path.replace(self.agent_dir / SENTENCE_INDEX_FILENAME)
+
+    def _flush(self) -> None:
+        """Embed the sentences of the queued nodes and write them."""
+        if not self._pending:
+            return
+        node_ids, text_hashes, texts = zip(*self._pending, strict=True)
+        embedded = self.highlighter.embed_sentences(list(texts))
+        for node_id, text_hash, sentences in zip(node_ids, text_hashes, embedded, strict=True):
+            self.write(node_id, text_hash, sentences)
+            self.num_embedded += len(sentences.spans)
+        self._pending = []
+        self._pending_length = 0
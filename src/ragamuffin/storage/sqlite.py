@@ -0,0 +1,137 @@
+import json
+import logging
+from pathlib import Path
+
+from llama_index.core import VectorStoreIndex
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.indices.base import BaseIndex
+from llama_index.core.readers.base import BaseReader, ResourcesReaderMixin
+
+from ragamuffin.error_handling import ensure_int
+from ragamuffin.models.model_picker import configure_llamaindex_embedding_model
+from ragamuffin.settings import get_settings
+from ragamuffin.storage.hybrid_retriever import HybridRetriever, TextSearchRetriever
+from ragamuffin.storage.ingest import insert_documents, iter_changed_documents, iter_documents
+from ragamuffin.storage.interface import Storage
+from ragamuffin.storage.manifest import Manifest
+from ragamuffin.storage.sqlite_vector_store import SQLiteVectorStore, connect, savepoint
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteStorage(Storage):
+    """Storage of all agents in a single SQLite database file."""
+
+    def __init__(self, db_path: Path):
+        self.db_path = db_path
+        self.connection = connect(db_path)
+
+    def generate_index(
+        self, agent_name: str, reader: BaseReader, embed_workers: int = 1, resume: bool = False
+    ) -> BaseIndex:
+        """Load the documents and create a RAG index.
+
+        If the agent was generated before, only new and changed files are indexed
+        and documents generated from deleted files are removed from the index.
+        """
+        if resume:
+            logger.warning("Resuming is not supported by the SQLite storage, generating the agent normally.")
+        # The embedding model is also needed by the returned index when the agent is up to date
+        configure_llamaindex_embedding_model(embed_workers=embed_workers)
+        if not isinstance(reader, ResourcesReaderMixin):
+            return self._generate_full_index(agent_name, reader)
+
+        vector_store = SQLiteVectorStore(self.db_path, agent_name, connection=self.connection)
+        index = VectorStoreIndex.from_vector_store(vector_store)
+        previous_manifest = self._load_manifest(agent_name)
+        is_update = previous_manifest is not None
+
+        logger.info("Checking library files for changes...")
+        previous_manifest = previous_manifest or Manifest()
+        manifest = previous_manifest.scan(reader)
+        diff = previous_manifest.diff(manifest)
+
+        if is_update and diff.is_empty():
+            logger.info("The index is up to date.")
+            return index
+
+        batch_size = ensure_int(get_settings().get("ingest_batch_size"))
+        # The nodes and the manifest are changed in one transaction, so an interrupted update leaves the agent
+        # as it was
+        with savepoint(self.connection):
+            if is_update:
+                logger.info(
+                    f"Found {len(diff.added)} new, {len(diff.modified)} modified and {len(diff.removed)} deleted files."
+                )
+                logger.info("Removing outdated documents from the index...")
+                for doc_id in previous_manifest.get_doc_ids(diff.stale):
+                    vector_store.delete(doc_id)
+            else:
+                vector_store.clear()
+
+            logger.info("Loading documents, generating RAG embeddings and storing them in SQLite...")
+            insert_documents(index, iter_changed_documents(reader, diff.changed, manifest), batch_size)
+            self._save_manifest(agent_name, manifest)
+        return index
+
+    def _generate_full_index(self, agent_name: str, reader: BaseReader) -> BaseIndex:
+        """Load all documents from the reader and replace the nodes of the agent."""
+        batch_size = ensure_int(get_settings().get("ingest_batch_size"))
+
+        logger.info("Loading documents, generating RAG embeddings and storing them in SQLite...")
+        vector_store = SQLiteVectorStore(self.db_path, agent_name, connection=self.connection)
+        index = VectorStoreIndex.from_vector_store(vector_store)
+        with savepoint(self.connection):
+            self._save_manifest(agent_name, None)
+            vector_store.clear()
+            insert_documents(index, iter_documents(reader), batch_size)
+        return index
+
+    def load_index(self, agent_name: str) -> BaseIndex:
+        """Load the index from storage."""
+        return VectorStoreIndex.from_vector_store(SQLiteVectorStore(self.db_path, agent_name))
+
+    def load_retriever(self, agent_name: str, similarity_top_k: int) -> BaseRetriever:
+        """Load a retriever which fuses the results of embedding search and the full-text index."""
+        settings = get_settings()
+        vector_store = SQLiteVectorStore(self.db_path, agent_name)
+        index = VectorStoreIndex.from_vector_store(vector_store)
+        if not settings.get("hybrid_search"):
+            return index.as_retriever(similarity_top_k=similarity_top_k)
+
+        candidates = max(similarity_top_k, ensure_int(settings.get("hybrid_candidates")))
+        return HybridRetriever(
+            [index.as_retriever(similarity_top_k=candidates), TextSearchRetriever(vector_store, candidates)],
+            similarity_top_k,
+        )
+
+    def list_agents(self) -> list[str]:
+        """Get the list of agents."""
+        rows = self.connection.execute("SELECT name FROM agents ORDER BY name").fetchall()
+        return [name for (name,) in rows]
+
+    def delete_agent(self, agent_name: str) -> None:
+        """Delete the agent and its nodes from the database."""
+        with savepoint(self.connection):
+            cursor = self.connection.execute("DELETE FROM agents WHERE name = ?", (agent_name,))
+        if cursor.rowcount == 0:
+            logger.warning(f"Agent '{agent_name}' does not exist.")
+            return
+        logger.info(f"Deleted agent '{agent_name}'.")
+
+    def _load_manifest(self, agent_name: str) -> Manifest | None:
+        """Load the manifest of the files in the agent's index, if it was generated from a library of files."""
+        row = self.connection.execute("SELECT manifest FROM agents WHERE name = ?", (agent_name,)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return Manifest.from_dict(json.loads(row[0]))
+
+    def _save_manifest(self, agent_name: str, manifest: Manifest | None) -> None:
+        """Save the manifest of the agent, creating the agent if it does not exist."""
+        data = json.dumps(manifest.to_dict()) if manifest is not None else None
+        with savepoint(self.connection):
+            self.connection.execute(
+                "INSERT INTO agents (name, manifest) VALUES (?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET manifest = excluded.manifest",
+                (agent_name, data),
+            )
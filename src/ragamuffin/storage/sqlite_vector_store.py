@@ -0,0 +1,278 @@
+import json
+import re
+import sqlite3
+import threading
+from collections.abc import Iterator, Sequence
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+from llama_index.core.schema import BaseNode, MetadataMode
+from llama_index.core.vector_stores.simple import _build_metadata_filter_fn
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    VectorStoreQuery,
+    VectorStoreQueryMode,
+    VectorStoreQueryResult,
+)
+from llama_index.core.vector_stores.utils import metadata_dict_to_node, node_to_metadata_dict
+from pydantic import PrivateAttr
+from typing_extensions import override
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS agents (name TEXT PRIMARY KEY, manifest TEXT)",
+    """
+    CREATE TABLE IF NOT EXISTS nodes (
+        id INTEGER PRIMARY KEY,
+        agent TEXT NOT NULL REFERENCES agents (name) ON DELETE CASCADE,
+        node_id TEXT NOT NULL,
+        ref_doc_id TEXT,
+        text TEXT NOT NULL,
+        metadata TEXT NOT NULL,
+        embedding BLOB NOT NULL,
+        UNIQUE (agent, node_id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS nodes_ref_doc_id ON nodes (agent, ref_doc_id)",
+    # Full-text index of the node text, kept in sync with the nodes table by triggers
+    "CREATE VIRTUAL TABLE IF NOT EXISTS nodes_fts USING fts5 (text, content='nodes', content_rowid='id')",
+    """
+    CREATE TRIGGER IF NOT EXISTS nodes_fts_insert AFTER INSERT ON nodes BEGIN
+        INSERT INTO nodes_fts (rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS nodes_fts_delete AFTER DELETE ON nodes BEGIN
+        INSERT INTO nodes_fts (nodes_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS nodes_fts_update AFTER UPDATE ON nodes BEGIN
+        INSERT INTO nodes_fts (nodes_fts, rowid, text) VALUES ('delete', old.id, old.text);
+        INSERT INTO nodes_fts (rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+]
+
+
+def connect(db_path: Path) -> sqlite3.Connection:
+    """Open the storage database in WAL mode and create its tables.
+
+    Transactions are not opened implicitly, changes are made in a `savepoint`.
+    """
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA foreign_keys=ON")
+    with savepoint(connection):
+        for statement in SCHEMA:
+            connection.execute(statement)
+    return connection
+
+
+@contextmanager
+def savepoint(connection: sqlite3.Connection) -> Iterator[None]:
+    """Make changes in a savepoint, which is committed when it ends unless it is nested in another one.
+
+    The changes made in the savepoint are rolled back if an exception is raised.
+    """
+    connection.execute("SAVEPOINT changes")
+    try:
+        yield
+    except BaseException:
+        connection.execute("ROLLBACK TO changes")
+        connection.execute("RELEASE changes")
+        raise
+    connection.execute("RELEASE changes")
+
+
+def to_fts_query(query_str: str) -> str:
+    """Convert a query to an FTS5 expression which matches any of its words."""
+    return " OR ".join(f'"{word}"' for word in re.findall(r"\w+", query_str))
+
+
+class SQLiteVectorStore(BasePydanticVectorStore):
+    """A vector store which keeps the nodes of an agent in an SQLite database.
+
+    Node text and metadata are stored with packed float32 embeddings, and the text is indexed for keyword
+    search with FTS5. Each call to `add` or `delete` is a single savepoint, so the changes are committed
+    when the call returns, or when the savepoint of the caller ends if the connection is shared. The
+    embeddings are loaded into memory for similarity search on the first query after the agent was changed.
+    """
+
+    stores_text: bool = True
+    flat_metadata: bool = False
+
+    _agent_name: str = PrivateAttr()
+    _connection: sqlite3.Connection = PrivateAttr()
+    _lock: threading.Lock = PrivateAttr()
+    _node_ids: list[str] | None = PrivateAttr(default=None)
+    _embeddings: np.ndarray | None = PrivateAttr(default=None)
+
+    def __init__(self, db_path: Path, agent_name: str, connection: sqlite3.Connection | None = None):
+        """Create the vector store.
+
+        Args:
+            db_path: The storage database.
+            agent_name: The agent whose nodes are stored.
+            connection: A connection to the database opened with `connect`, which is opened if not given.
+        """
+        super().__init__(stores_text=True)
+        self._agent_name = agent_name
+        self._connection = connection or connect(db_path)
+        self._lock = threading.Lock()
+
+    @classmethod
+    @override
+    def class_name(cls: type["SQLiteVectorStore"]) -> str:
+        return "SQLiteVectorStore"
+
+    @property
+    @override
+    def client(self) -> sqlite3.Connection:
+        return self._connection
+
+    @override
+    def add(self, nodes: Sequence[BaseNode], **add_kwargs: Any) -> list[str]:
+        rows = [
+            (
+                self._agent_name,
+                node.node_id,
+                node.ref_doc_id,
+                node.get_content(metadata_mode=MetadataMode.NONE),
+                json.dumps(node_to_metadata_dict(node, remove_text=True, flat_metadata=False)),
+                np.asarray(node.get_embedding(), dtype=np.float32).tobytes(),
+            )
+            for node in nodes
+        ]
+        with self._lock, savepoint(self._connection):
+            self._connection.execute("INSERT INTO agents (name) VALUES (?) ON CONFLICT DO NOTHING", (self._agent_name,))
+            self._connection.executemany(
+                """
+                INSERT INTO nodes (agent, node_id, ref_doc_id, text, metadata, embedding) VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (agent, node_id) DO UPDATE SET
+                    ref_doc_id = excluded.ref_doc_id,
+                    text = excluded.text,
+                    metadata = excluded.metadata,
+                    embedding = excluded.embedding
+                """,
+                rows,
+            )
+            self._embeddings = None
+        return [node.node_id for node in nodes]
+
+    @override
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        with self._lock, savepoint(self._connection):
+            self._connection.execute(
+                "DELETE FROM nodes WHERE agent = ? AND ref_doc_id = ?", (self._agent_name, ref_doc_id)
+            )
+            self._embeddings = None
+
+    def clear(self) -> None:
+        """Remove all nodes of the agent."""
+        with self._lock, savepoint(self._connection):
+            self._connection.execute("DELETE FROM nodes WHERE agent = ?", (self._agent_name,))
+            self._embeddings = None
+
+    @override
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if query.mode == VectorStoreQueryMode.TEXT_SEARCH:
+            return self._text_search(query)
+        if query.mode != VectorStoreQueryMode.DEFAULT:
+            raise ValueError(f"Unsupported query mode: {query.mode}")
+        if query.query_embedding is None:
+            return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+
+        node_ids, embeddings = self._load_embeddings()
+        if not node_ids:
+            return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+        query_vector = np.asarray(query.query_embedding, dtype=np.float32)
+        query_norm = np.linalg.norm(query_vector)
+        similarities = embeddings @ (query_vector / query_norm) if query_norm > 0 else np.zeros(len(node_ids))
+
+        # Exclude nodes which do not match the query filters
+        # The retriever passes an empty list of node IDs for vector stores which store text
+        if query.filters is not None or query.node_ids:
+            allowed_ids = set(query.node_ids) if query.node_ids else None
+            metadata_by_id = self._load_metadata() if query.filters is not None else {}
+            filter_fn = _build_metadata_filter_fn(lambda node_id: metadata_by_id[node_id], query.filters)
+            for row, node_id in enumerate(node_ids):
+                if (allowed_ids is not None and node_id not in allowed_ids) or not filter_fn(node_id):
+                    similarities[row] = -np.inf
+
+        top_k = min(query.similarity_top_k, len(node_ids))
+        if top_k == 0:
+            return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+        top_rows = np.argpartition(-similarities, top_k - 1)[:top_k]
+        top_rows = top_rows[np.argsort(-similarities[top_rows])]
+        top_rows = top_rows[np.isfinite(similarities[top_rows])]
+
+        top_ids = [node_ids[row] for row in top_rows]
+        return VectorStoreQueryResult(
+            nodes=self._get_nodes(top_ids), similarities=similarities[top_rows].tolist(), ids=top_ids
+        )
+
+    def _text_search(self, query: VectorStoreQuery) -> VectorStoreQueryResult:
+        """Find the nodes which best match the words of the query with BM25 ranking."""
+        fts_query = to_fts_query(query.query_str or "")
+        if not fts_query:
+            return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+
+        with self._lock:
+            rows = self._connection.execute(
+                """
+                SELECT nodes.node_id, nodes.text, nodes.metadata, bm25(nodes_fts) AS rank
+                FROM nodes_fts JOIN nodes ON nodes.id = nodes_fts.rowid
+                WHERE nodes_fts MATCH ? AND nodes.agent = ?
+                ORDER BY rank LIMIT ?
+                """,
+                (fts_query, self._agent_name, query.sparse_top_k or query.similarity_top_k),
+            ).fetchall()
+
+        metadata_by_id = {node_id: json.loads(metadata) for node_id, _, metadata, _ in rows}
+        filter_fn = _build_metadata_filter_fn(lambda node_id: metadata_by_id[node_id], query.filters)
+        matches = [(node_id, text, rank) for node_id, text, _, rank in rows if filter_fn(node_id)]
+        return VectorStoreQueryResult(
+            nodes=[metadata_dict_to_node(metadata_by_id[node_id], text=text) for node_id, text, _ in matches],
+            # Lower BM25 ranks are better matches
+            similarities=[-rank for _, _, rank in matches],
+            ids=[node_id for node_id, _, _ in matches],
+        )
+
+    def _load_embeddings(self) -> tuple[list[str], np.ndarray]:
+        """Load the IDs and unit-length embeddings of all nodes of the agent."""
+        with self._lock:
+            if self._embeddings is None or self._node_ids is None:
+                rows = self._connection.execute(
+                    "SELECT node_id, embedding FROM nodes WHERE agent = ? ORDER BY id", (self._agent_name,)
+                ).fetchall()
+                self._node_ids = [node_id for node_id, _ in rows]
+                if not rows:
+                    self._embeddings = np.zeros((0, 0), dtype=np.float32)
+                    return self._node_ids, self._embeddings
+
+                embeddings = np.array([np.frombuffer(blob, dtype=np.float32) for _, blob in rows])
+                norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+                self._embeddings = np.divide(embeddings, norms, out=np.zeros_like(embeddings), where=norms > 0)
+            return self._node_ids, self._embeddings
+
+    def _load_metadata(self) -> dict[str, dict]:
+        """Load the metadata of all nodes of the agent."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT node_id, metadata FROM nodes WHERE agent = ?", (self._agent_name,)
+            ).fetchall()
+        return {node_id: json.loads(metadata) for node_id, metadata in rows}
+
+    def _get_nodes(self, node_ids: list[str]) -> list[BaseNode]:
+        """Load nodes by ID, in the order of the IDs."""
+        placeholders = ",".join("?" * len(node_ids))
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT node_id, text, metadata FROM nodes WHERE agent = ? AND node_id IN ({placeholders})",  # noqa: S608
+                [self._agent_name, *node_ids],
+            ).fetchall()
+        nodes = {node_id: metadata_dict_to_node(json.loads(metadata), text=text) for node_id, text, metadata in rows}
+        return [nodes[node_id] for node_id in node_ids]
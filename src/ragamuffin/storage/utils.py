@@ -1,10 +1,12 @@
 import logging
+from pathlib import Path
 
-from ragamuffin.error_handling import ConfigurationError, ensure_string
+from ragamuffin.error_handling import ConfigurationError, ensure_int, ensure_string
 from ragamuffin.settings import get_settings
-from ragamuffin.storage.cassandra import CassandraStorage
+from ragamuffin.storage.cassandra import CassandraSessionOptions, CassandraStorage
 from ragamuffin.storage.file import FileStorage
 from ragamuffin.storage.interface import Storage
+from ragamuffin.storage.sqlite import SQLiteStorage
 
 logger = logging.getLogger(__name__)
 
@@ -17,10 +19,25 @@ def get_storage() -> Storage:
     if storage_type == "file":
         return FileStorage()
 
+    if storage_type == "sqlite":
+        sqlite_path = settings.get("sqlite_path")
+        if sqlite_path:
+            return SQLiteStorage(Path(str(sqlite_path)))
+        return SQLiteStorage(Path(str(settings.get("data_dir"))) / "storage.sqlite")
+
     if storage_type == "cassandra":
-        logger.info("Connecting to the Cassandra cluster...")
-        ip = ensure_string(settings.get("cassandra_cluster_ip"))
+        contact_points = ensure_string(settings.get("cassandra_cluster_ip")).split(",")
         keyspace = ensure_string(settings.get("cassandra_keyspace"))
-        return CassandraStorage(cluster_ip=ip, keyspace=keyspace)
+        local_dc = settings.get("cassandra_local_dc")
+        options = CassandraSessionOptions(
+            port=ensure_int(settings.get("cassandra_port")),
+            local_dc=ensure_string(local_dc) if local_dc else None,
+            protocol_version=ensure_int(settings.get("cassandra_protocol_version")),
+            connect_timeout=ensure_int(settings.get("cassandra_connect_timeout")),
+            request_timeout=ensure_int(settings.get("cassandra_request_timeout")),
+            executor_threads=ensure_int(settings.get("cassandra_executor_threads")),
+            fetch_size=ensure_int(settings.get("cassandra_fetch_size")),
+        )
+        return CassandraStorage([point.strip() for point in contact_points if point.strip()], keyspace, options)
 
     raise ConfigurationError(f"Unknown storage type '{storage_type}'.")
@@ -0,0 +1,445 @@
+import io
+import json
+import logging
+from collections.abc import Sequence
+from itertools import islice
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.simple import _build_metadata_filter_fn
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    VectorStoreQuery,
+    VectorStoreQueryMode,
+    VectorStoreQueryResult,
+)
+from pydantic import PrivateAttr
+from typing_extensions import override
+
+from ragamuffin.storage.ann_index import IVFIndex
+
+logger = logging.getLogger(__name__)
+
+VECTOR_STORE_FORMAT = "ragamuffin-mmap"
+# The side index is saved where StorageContext.persist saves the default vector store
+VECTOR_STORE_FILENAME = "default__vector_store.json"
+EMBEDDINGS_FILENAME = "vector_store.npy"
+NODES_FILENAME = "vector_store_nodes.jsonl"
+ANN_INDEX_FILENAME = "vector_store_ivf.npz"
+
+# Number of embeddings compared with the query at a time
+QUERY_CHUNK_SIZE = 65536
+
+
+class MmapVectorStore(BasePydanticVectorStore):
+    """A vector store which keeps the embeddings in a binary NumPy file, memory-mapped when it is loaded.
+
+    Node IDs, reference document IDs and node metadata are kept in a JSON lines side index, with one line
+    per row of the embeddings. Loading the store only reads the side index, and the pages of the embeddings
+    file are shared by all processes which load the same agent. Added and deleted embeddings are merged into
+    a single array when the store is queried or persisted.
+
+    When only embeddings were added since the store was last loaded or persisted to the same directory,
+    persisting it appends the new rows to both files, so checkpoints of a long run do not rewrite them.
+
+    Large stores can be searched with an approximate nearest-neighbour index (see `build_ann_index`),
+    which is used for queries until embeddings are added or deleted.
+    """
+
+    stores_text: bool = False
+    # Number of lists of the ANN index compared with each query
+    nprobe: int = 16
+
+    _dtype: np.dtype = PrivateAttr()
+    _blocks: list[np.ndarray] = PrivateAttr()
+    _node_ids: list[str] = PrivateAttr()
+    _ref_doc_ids: list[str] = PrivateAttr()
+    _metadata: list[dict[str, Any]] = PrivateAttr()
+    _deleted_rows: set[int] = PrivateAttr()
+    _norms: np.ndarray | None = PrivateAttr(default=None)
+    _ann_index: IVFIndex | None = PrivateAttr(default=None)
+    _is_ann_index_stale: bool = PrivateAttr(default=False)
+    # The directory the store was persisted to, with the number of rows and side index bytes stored there
+    _persisted: tuple[Path, int, int] | None = PrivateAttr(default=None)
+
+    def __init__(  # noqa: PLR0913
+        self,
+        dtype: str = "float32",
+        embeddings: np.ndarray | None = None,
+        node_ids: list[str] | None = None,
+        ref_doc_ids: list[str] | None = None,
+        metadata: list[dict[str, Any]] | None = None,
+        ann_index: IVFIndex | None = None,
+        nprobe: int = 16,
+    ):
+        super().__init__(stores_text=False)
+        self.nprobe = nprobe
+        self._dtype = np.dtype(dtype)
+        self._blocks = [embeddings] if embeddings is not None else []
+        self._node_ids = node_ids or []
+        self._ref_doc_ids = ref_doc_ids or []
+        self._metadata = metadata or []
+        self._deleted_rows = set()
+        self._ann_index = ann_index
+
+    @classmethod
+    @override
+    def class_name(cls: type["MmapVectorStore"]) -> str:
+        return "MmapVectorStore"
+
+    @property
+    @override
+    def client(self) -> None:
+        return None
+
+    @staticmethod
+    def is_persisted(persist_path: Path) -> bool:
+        """Check if the vector store at the path was persisted in this format."""
+        if not persist_path.exists():
+            return False
+        with persist_path.open() as f:
+            # Avoid parsing a legacy JSON vector store, which may be very large
+            return f'"format": "{VECTOR_STORE_FORMAT}"' in f.read(64)
+
+    @classmethod
+    def from_persist_path(cls: type["MmapVectorStore"], persist_path: Path, nprobe: int = 16) -> "MmapVectorStore":
+        """Load the side index and the ANN index and memory-map the embeddings."""
+        with persist_path.open() as f:
+            data = json.load(f)
+
+        persist_dir = persist_path.parent
+        nodes_size = None
+        if "nodes_file" in data:
+            node_ids, ref_doc_ids, metadata = [], [], []
+            nodes_size = 0
+            with (persist_dir / data["nodes_file"]).open("rb") as f:
+                # Rows appended after the side index was last saved are left out
+                for line in islice(f, data["num_rows"]):
+                    node_id, ref_doc_id, node_metadata = json.loads(line)
+                    node_ids.append(node_id)
+                    ref_doc_ids.append(ref_doc_id)
+                    metadata.append(node_metadata)
+                    nodes_size += len(line)
+        else:
+            # The side index of stores persisted before the JSON lines file holds all rows
+            node_ids, ref_doc_ids, metadata = data["node_ids"], data["ref_doc_ids"], data["metadata"]
+
+        embeddings = None
+        if node_ids:
+            embeddings = np.load(persist_dir / data["embeddings_file"], mmap_mode="r")[: len(node_ids)]
+        ann_index = None
+        if data.get("ann_index_file"):
+            ann_index = IVFIndex.load(persist_dir / data["ann_index_file"])
+        store = cls(
+            dtype=data["dtype"],
+            embeddings=embeddings,
+            node_ids=node_ids,
+            ref_doc_ids=ref_doc_ids,
+            metadata=metadata,
+            ann_index=ann_index,
+            nprobe=nprobe,
+        )
+        if nodes_size is not None:
+            store._persisted = (persist_dir, len(node_ids), nodes_size)  # noqa: SLF001
+        return store
+
+    @override
+    def persist(self, persist_path: str, fs: Any = None) -> None:
+        """Save the embeddings and the side index next to each other.
+
+        The file at `persist_path` is replaced last and records the number of rows, so rows which were
+        appended to the other files by an interrupted call are ignored when the store is loaded.
+        """
+        self._merge_blocks()
+        persist_dir = Path(persist_path).parent
+        persist_dir.mkdir(parents=True, exist_ok=True)
+
+        if self._persisted is None or self._persisted[0] != persist_dir or not self._append_rows():
+            self._write_rows(persist_dir)
+
+        ann_index = self.ann_index
+        ann_index_path = persist_dir / ANN_INDEX_FILENAME
+        if ann_index is not None:
+            tmp_ann_index_path = ann_index_path.with_suffix(".tmp.npz")
+            ann_index.save(tmp_ann_index_path)
+            tmp_ann_index_path.replace(ann_index_path)
+        else:
+            ann_index_path.unlink(missing_ok=True)
+
+        data = {
+            "format": VECTOR_STORE_FORMAT,
+            "dtype": self._dtype.name,
+            "embeddings_file": EMBEDDINGS_FILENAME,
+            "ann_index_file": ANN_INDEX_FILENAME if ann_index is not None else None,
+            "nodes_file": NODES_FILENAME,
+            "num_rows": len(self._node_ids),
+        }
+        tmp_path = Path(f"{persist_path}.tmp")
+        with tmp_path.open("w") as f:
+            json.dump(data, f)
+        tmp_path.replace(persist_path)
+
+    def _write_rows(self, persist_dir: Path) -> None:
+        """Write all embeddings and side index rows to new files."""
+        # Write to temporary files first, since the current embeddings file may be memory-mapped
+        embeddings_path = persist_dir / EMBEDDINGS_FILENAME
+        tmp_embeddings_path = embeddings_path.with_suffix(".tmp.npy")
+        np.save(tmp_embeddings_path, self.embeddings)
+
+        nodes_path = persist_dir / NODES_FILENAME
+        tmp_nodes_path = nodes_path.with_suffix(".tmp.jsonl")
+        with tmp_nodes_path.open("wb") as f:
+            nodes_size = f.write(self._encode_rows(0))
+
+        tmp_embeddings_path.replace(embeddings_path)
+        tmp_nodes_path.replace(nodes_path)
+        self._persisted = (persist_dir, len(self._node_ids), nodes_size)
+
+    def _append_rows(self) -> bool:
+        """Append the rows added since the store was persisted to its files.
+
+        Returns:
+            False if the files cannot be appended to, and must be written again.
+        """
+        if self._persisted is None:
+            return False
+        persist_dir, num_rows, nodes_size = self._persisted
+        embeddings_path = persist_dir / EMBEDDINGS_FILENAME
+        nodes_path = persist_dir / NODES_FILENAME
+        if not embeddings_path.exists() or not nodes_path.exists():
+            return False
+
+        embeddings = self.embeddings
+        header = io.BytesIO()
+        np.lib.format.write_array_header_1_0(
+            header,
+            {
+                "descr": np.lib.format.dtype_to_descr(embeddings.dtype),
+                "fortran_order": False,
+                "shape": embeddings.shape,
+            },
+        )
+        with embeddings_path.open("r+b") as f:
+            version = np.lib.format.read_magic(f)
+            if version != (1, 0):
+                return False
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            # The shape is rewritten in place, which only works if the header keeps its length
+            if (
+                f.tell() != len(header.getvalue())
+                or fortran_order
+                or dtype != embeddings.dtype
+                or shape[0] < num_rows
+                or shape[1:] != embeddings.shape[1:]
+            ):
+                return False
+
+            f.seek(f.tell() + num_rows * embeddings.dtype.itemsize * int(np.prod(shape[1:])))
+            f.write(np.ascontiguousarray(embeddings[num_rows:]).tobytes())
+            f.truncate()
+            f.seek(0)
+            f.write(header.getvalue())
+
+        with nodes_path.open("r+b") as f:
+            f.seek(nodes_size)
+            nodes_size += f.write(self._encode_rows(num_rows))
+            f.truncate()
+
+        self._persisted = (persist_dir, len(self._node_ids), nodes_size)
+        return True
+
+    def _encode_rows(self, start: int) -> bytes:
+        """Encode the side index rows from the given row on as JSON lines."""
+        rows = zip(self._node_ids[start:], self._ref_doc_ids[start:], self._metadata[start:], strict=True)
+        return b"".join(json.dumps(row).encode() + b"\n" for row in rows)
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        """All embeddings in the store, one row per node."""
+        self._merge_blocks()
+        if not self._blocks:
+            return np.empty((0, 0), dtype=self._dtype)
+        return self._blocks[0]
+
+    @property
+    def ann_index(self) -> IVFIndex | None:
+        """The ANN index, unless embeddings were added or deleted since it was built."""
+        return None if self._is_ann_index_stale else self._ann_index
+
+    def build_ann_index(self, num_lists: int | None = None) -> IVFIndex:
+        """Build the ANN index of all embeddings in the store.
+
+        The centroids of a previous index are reused when it was built for at least half as many embeddings,
+        so updating a large store only assigns the embeddings to lists again.
+        """
+        embeddings = self.embeddings
+        centroids = None
+        if self._ann_index is not None and num_lists is None and self._ann_index.num_rows * 2 >= len(embeddings):
+            centroids = self._ann_index.centroids
+        self._ann_index = IVFIndex.build(embeddings, num_lists=num_lists, centroids=centroids)
+        self._is_ann_index_stale = False
+        return self._ann_index
+
+    def drop_ann_index(self) -> None:
+        """Remove the ANN index, so all queries use exact search."""
+        self._ann_index = None
+        self._is_ann_index_stale = False
+
+    def measure_recall(self, k: int = 10, num_queries: int = 100, seed: int = 0) -> float:
+        """Measure the recall@k of the ANN index against exact search.
+
+        The queries are midpoints between random pairs of embeddings in the store.
+
+        Returns:
+            The fraction of the exact top k results which were also found by the ANN index.
+        """
+        ann_index = self.ann_index
+        if ann_index is None:
+            raise ValueError("The vector store has no up-to-date ANN index.")
+
+        embeddings = self.embeddings
+        rng = np.random.default_rng(seed)
+        pairs = rng.integers(len(embeddings), size=(num_queries, 2))
+        queries = embeddings[pairs[:, 0]].astype(np.float32) + embeddings[pairs[:, 1]].astype(np.float32)
+
+        found = 0
+        for query_vector in queries:
+            exact_rows = self._get_top_rows(self.get_similarities(query_vector), k)
+            ann_rows = self._get_top_rows(
+                self.get_similarities(query_vector, ann_index.probe(query_vector, self.nprobe)), k
+            )
+            found += len(set(exact_rows.tolist()) & set(ann_rows.tolist()))
+        return found / (num_queries * min(k, len(embeddings)))
+
+    def get(self, text_id: str) -> list[float]:
+        """Get the embedding of a node."""
+        # Merge first, so the rows of the embeddings match the node IDs after a deletion
+        embeddings = self.embeddings
+        row = self._node_ids.index(text_id)
+        return embeddings[row].astype(np.float32).tolist()
+
+    @override
+    def add(self, nodes: Sequence[BaseNode], **add_kwargs: Any) -> list[str]:
+        if not nodes:
+            return []
+        self._blocks.append(np.array([node.get_embedding() for node in nodes], dtype=self._dtype))
+        for node in nodes:
+            self._node_ids.append(node.node_id)
+            self._ref_doc_ids.append(node.ref_doc_id or "None")
+            self._metadata.append(node.metadata)
+        self._norms = None
+        self._is_ann_index_stale = True
+        return [node.node_id for node in nodes]
+
+    @override
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        rows = [row for row, doc_id in enumerate(self._ref_doc_ids) if doc_id == ref_doc_id]
+        if rows:
+            self._deleted_rows.update(rows)
+            self._is_ann_index_stale = True
+            # The stored rows no longer match the first rows of the store
+            self._persisted = None
+
+    def clear(self) -> None:
+        """Remove all embeddings from the store."""
+        self._blocks = []
+        self._node_ids = []
+        self._ref_doc_ids = []
+        self._metadata = []
+        self._deleted_rows = set()
+        self._norms = None
+        self._persisted = None
+        self.drop_ann_index()
+
+    @override
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if query.mode != VectorStoreQueryMode.DEFAULT:
+            raise ValueError(f"Unsupported query mode: {query.mode}")
+        if query.query_embedding is None or not self._node_ids:
+            return VectorStoreQueryResult(similarities=[], ids=[])
+
+        rows = None
+        ann_index = self.ann_index
+        if ann_index is not None:
+            rows = ann_index.probe(np.asarray(query.query_embedding, dtype=np.float32), self.nprobe)
+        similarities = self.get_similarities(query.query_embedding, rows)
+
+        # Exclude nodes which do not match the query filters
+        if query.filters is not None or query.node_ids is not None:
+            metadata_by_id = dict(zip(self._node_ids, self._metadata, strict=True))
+            filter_fn = _build_metadata_filter_fn(lambda node_id: metadata_by_id[node_id], query.filters)
+            allowed_ids = set(query.node_ids) if query.node_ids is not None else None
+            for row, node_id in enumerate(self._node_ids):
+                if (allowed_ids is not None and node_id not in allowed_ids) or not filter_fn(node_id):
+                    similarities[row] = -np.inf
+
+        top_rows = self._get_top_rows(similarities, query.similarity_top_k)
+        return VectorStoreQueryResult(
+            similarities=similarities[top_rows].tolist(),
+            ids=[self._node_ids[row] for row in top_rows],
+        )
+
+    def get_similarities(self, query_embedding: Sequence[float], rows: np.ndarray | None = None) -> np.ndarray:
+        """Calculate the cosine similarity of the query with the embeddings in the store.
+
+        Args:
+            query_embedding: The embedding of the query.
+            rows: Sorted row numbers of the embeddings to compare with the query. All other rows get a
+                similarity of minus infinity. Compares the query with every embedding if not set.
+        """
+        embeddings = self.embeddings
+        query_vector = np.asarray(query_embedding, dtype=np.float32)
+        query_norm = np.linalg.norm(query_vector)
+
+        if rows is not None:
+            similarities = np.full(len(embeddings), -np.inf, dtype=np.float32)
+            for start in range(0, len(rows), QUERY_CHUNK_SIZE):
+                chunk_rows = rows[start : start + QUERY_CHUNK_SIZE]
+                chunk = embeddings[chunk_rows].astype(np.float32)
+                norms = np.linalg.norm(chunk, axis=1) * query_norm
+                dot_products = chunk @ query_vector
+                similarities[chunk_rows] = np.divide(
+                    dot_products, norms, out=np.zeros_like(dot_products), where=norms > 0
+                )
+            return similarities
+
+        if self._norms is None:
+            self._norms = np.concatenate(
+                [
+                    np.linalg.norm(embeddings[start : start + QUERY_CHUNK_SIZE].astype(np.float32), axis=1)
+                    for start in range(0, len(embeddings), QUERY_CHUNK_SIZE)
+                ]
+            )
+
+        dot_products = np.concatenate(
+            [
+                embeddings[start : start + QUERY_CHUNK_SIZE].astype(np.float32) @ query_vector
+                for start in range(0, len(embeddings), QUERY_CHUNK_SIZE)
+            ]
+        )
+        norms = self._norms * query_norm
+        return np.divide(dot_products, norms, out=np.zeros_like(dot_products), where=norms > 0)
+
+    @staticmethod
+    def _get_top_rows(similarities: np.ndarray, top_k: int) -> np.ndarray:
+        """Get the rows with the highest similarities, best first, leaving out excluded rows."""
+        top_k = min(top_k, len(similarities))
+        top_rows = np.argpartition(-similarities, top_k - 1)[:top_k]
+        top_rows = top_rows[np.argsort(-similarities[top_rows])]
+        return top_rows[np.isfinite(similarities[top_rows])]
+
+    def _merge_blocks(self) -> None:
+        """Merge added embeddings into a single array and remove deleted ones."""
+        if len(self._blocks) <= 1 and not self._deleted_rows:
+            return
+
+        keep = np.ones(len(self._node_ids), dtype=bool)
+        keep[list(self._deleted_rows)] = False
+        self._blocks = [np.concatenate(self._blocks)[keep]] if self._blocks else []
+        self._node_ids = [node_id for node_id, kept in zip(self._node_ids, keep, strict=True) if kept]
+        self._ref_doc_ids = [doc_id for doc_id, kept in zip(self._ref_doc_ids, keep, strict=True) if kept]
+        self._metadata = [metadata for metadata, kept in zip(self._metadata, keep, strict=True) if kept]
+        self._deleted_rows = set()
+        self._norms = None
@@ -1,5 +1,8 @@
-import html
-from collections.abc import Callable, Generator
+import queue
+import threading
+import time
+from collections.abc import Callable, Generator, Iterable
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Any
 
@@ -10,7 +13,12 @@ from llama_index.core.llama_pack import BaseLlamaPack
 from llama_index.core.schema import NodeWithScore
 
 from ragamuffin.models.enhancer import QueryEnhancer
-from ragamuffin.models.highlighter import SemanticHighlighter
+from ragamuffin.models.highlighter import SemanticHighlighter, SentenceStore
+from ragamuffin.storage.hybrid_retriever import QueryRecordingRetriever
+
+# Streamed tokens are sent to the browser at most this often in seconds, or when this many characters are buffered
+STREAM_FLUSH_INTERVAL = 0.05
+STREAM_FLUSH_CHARS = 256
 
 
 class GradioAgentChatUI(BaseLlamaPack):
@@ -19,11 +27,16 @@ class GradioAgentChatUI(BaseLlamaPack):
         agent: BaseChatEngine,
         *,
         name: str = "Unnamed",
+        sentence_store: SentenceStore | None = None,
+        query_recorder: QueryRecordingRetriever | None = None,
         **kwargs: dict,
     ):
         """Init params."""
         self.agent = agent
-        self.semantic_highlighter = SemanticHighlighter()
+        self.query_recorder = query_recorder
+        self.semantic_highlighter = SemanticHighlighter(sentence_store=sentence_store)
+        # Sources are highlighted in the background while the answer is streamed
+        self.highlight_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="highlighter")
         self.query_enhancer = QueryEnhancer()
         self.title = f"Ragamuffin {snake_to_title_case(name)} Chat"
 
@@ -82,17 +95,35 @@ class GradioAgentChatUI(BaseLlamaPack):
 
         webui.launch(inbrowser=True, share=False)
 
-    def respond(self, chat_history: list[dict]) -> Generator[tuple[list[dict], str], None, None]:
-        """Respond to the user message."""
+    def respond(self, chat_history: list[dict]) -> Generator[tuple[list[dict], str | dict], None, None]:
+        """Respond to the user message.
+
+        Answer tokens are shown as soon as they are generated, coalesced into short flush windows so that
+        long answers are not sent to the browser once per token. The sources are highlighted in a worker
+        thread and shown when they are ready, without changing the sources panel in the meantime.
+        """
         query = chat_history[-1]["content"]
+        if self.query_recorder:
+            self.query_recorder.last_query = None
         response = self.agent.stream_chat(query)
 
-        sources_html = self.generate_sources_html(query, response.source_nodes)
+        sources_future = self.highlight_executor.submit(self.generate_sources_html, query, response.source_nodes)
+        sources_ready = threading.Event()
+        sources_future.add_done_callback(lambda _: sources_ready.set())
+        sources_shown = False
 
         chat_history.append({"role": "assistant", "content": ""})
-        for token in response.response_gen:
-            chat_history[-1]["content"] += token
-            yield chat_history, str(sources_html)
+        for chunk in coalesce_tokens(response.response_gen, flush=sources_ready.is_set):
+            chat_history[-1]["content"] += chunk
+            if sources_ready.is_set():
+                sources_ready.clear()
+                sources_shown = True
+                yield chat_history, sources_future.result()
+            else:
+                yield chat_history, gr.update()
+
+        if not sources_shown:
+            yield chat_history, sources_future.result()
 
     def accept_message(self, user_message: str, chat_history: list[dict]) -> tuple[str, list[dict]]:
         """Accept the user message."""
@@ -115,6 +146,7 @@ class GradioAgentChatUI(BaseLlamaPack):
         """Generate HTML for the sources."""
         output_html = ""
         sources_text = []
+        node_ids = []
         nodes_info = []
 
         if not source_nodes:
@@ -136,6 +168,7 @@ class GradioAgentChatUI(BaseLlamaPack):
             node_content = text_node.get_content()
             if node_content:
                 sources_text.append(node_content)
+                node_ids.append(text_node.node_id)
                 nodes_info.append(
                     {
                         "filename_html": filename_html,
@@ -145,8 +178,14 @@ class GradioAgentChatUI(BaseLlamaPack):
                 )
 
         # Highlight the texts
-        sources_text = [html.escape(text) for text in sources_text]
-        highlighted_texts = self.semantic_highlighter.highlight_multiple(query, sources_text)
+        # Highlight with the query of the retriever, whose embedding is already computed
+        query_embedding = None
+        last_query = self.query_recorder.last_query if self.query_recorder else None
+        if last_query is not None and self.semantic_highlighter.is_retrieval_model:
+            query, query_embedding = last_query.query_str, last_query.embedding
+        highlighted_texts = self.semantic_highlighter.highlight_multiple(
+            query, sources_text, node_ids=node_ids, query_embedding=query_embedding
+        )
 
         # Construct the output using the highlighted texts and metadata
         for highlighted_text, info in zip(highlighted_texts, nodes_info, strict=False):
@@ -159,6 +198,63 @@ class GradioAgentChatUI(BaseLlamaPack):
         return output_html
 
 
+def coalesce_tokens(
+    tokens: Iterable[str],
+    interval: float = STREAM_FLUSH_INTERVAL,
+    max_chars: int = STREAM_FLUSH_CHARS,
+    flush: Callable[[], bool] = lambda: False,
+) -> Generator[str, None, None]:
+    """Join streamed tokens into chunks.
+
+    The first token is yielded immediately. Later tokens are buffered until `interval` seconds have passed
+    since the last chunk, `max_chars` characters are buffered, or `flush` returns True. Tokens are read in a
+    background thread, so buffered text is also yielded on time when the stream stalls, and an empty chunk
+    is yielded if `flush` returns True while nothing is buffered.
+    """
+    token_queue: queue.Queue[str | BaseException | None] = queue.Queue()
+    threading.Thread(target=_read_tokens, args=(tokens, token_queue), daemon=True).start()
+
+    buffer: list[str] = []
+    buffered_chars = 0
+    last_flush_time = float("-inf")
+    while True:
+        if buffered_chars:
+            timeout: float | None = max(0.0, last_flush_time + interval - time.monotonic())
+        else:
+            timeout = interval if interval > 0 else None
+        try:
+            token = token_queue.get(timeout=timeout)
+        except queue.Empty:
+            token = ""
+        if token is None:
+            break
+        if isinstance(token, BaseException):
+            raise token
+
+        if token:
+            buffer.append(token)
+            buffered_chars += len(token)
+        is_due = buffered_chars >= max_chars or time.monotonic() - last_flush_time >= interval
+        if (buffered_chars and is_due) or flush():
+            yield "".join(buffer)
+            buffer = []
+            buffered_chars = 0
+            last_flush_time = time.monotonic()
+    if buffered_chars:
+        yield "".join(buffer)
+
+
+def _read_tokens(tokens: Iterable[str], token_queue: "queue.Queue[str | BaseException | None]") -> None:
+    """Put the tokens in the queue, followed by None at the end of the stream or the error which ended it."""
+    try:
+        for token in tokens:
+            token_queue.put(token)
+    except BaseException as e:  # noqa: BLE001
+        token_queue.put(e)
+        return
+    token_queue.put(None)
+
+
 def snake_to_title_case(snake_str: str) -> str:
     """Convert snake case to title case."""
     return snake_str.replace("_", " ").title()
@@ -0,0 +1,12 @@
+import nltk
+import pytest
+from nltk.tokenize import PunktSentenceTokenizer
+
+from ragamuffin.models import highlighter
+
+
+@pytest.fixture
+def offline_sentence_tokenizer(monkeypatch):
+    """Split sentences with an untrained tokenizer, because the pretrained tokenizer is downloaded."""
+    monkeypatch.setattr(nltk, "download", lambda *args, **kwargs: True)
+    monkeypatch.setattr(highlighter, "PunktTokenizer", lambda _: PunktSentenceTokenizer())
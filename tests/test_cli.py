@@ -9,7 +9,7 @@ from ragamuffin.storage.utils import get_storage
 from tests.utils import env_vars
 
 
-@pytest.mark.parametrize("storage_type", ["file", "cassandra"])
+@pytest.mark.parametrize("storage_type", ["file", "sqlite", "cassandra"])
 def test_muffin_cli_from_files(storage_type):
     with env_vars(
         RAGAMUFFIN_STORAGE_TYPE=storage_type,
@@ -30,7 +30,7 @@ def test_muffin_cli_from_files(storage_type):
         assert agent_name not in get_storage().list_agents()
 
 
-@pytest.mark.parametrize("storage_type", ["file", "cassandra"])
+@pytest.mark.parametrize("storage_type", ["file", "sqlite", "cassandra"])
 def test_muffin_cli_from_git(caplog, storage_type):
     with env_vars(
         RAGAMUFFIN_STORAGE_TYPE=storage_type,
@@ -1,3 +1,4 @@
+import shutil
 from pathlib import Path
 
 from llama_index.core import Document, SimpleDirectoryReader
@@ -35,3 +36,24 @@ def test_local_file():
 
     data = reader.load_data()
     assert len(data) == 8
+
+
+def test_local_directory_parallel(tmp_path):
+    test_data_path = Path(__file__).parent / "data" / "udhr"
+    for file_path in test_data_path.iterdir():
+        shutil.copy(file_path, tmp_path / file_path.name)
+    (tmp_path / "broken.pdf").write_bytes(b"not a PDF file")
+
+    sequential_reader = LocalLibrary(str(tmp_path)).get_reader()
+    sequential_data = list(sequential_reader.iter_data())
+
+    parallel_reader = LocalLibrary(str(tmp_path), workers=2).get_reader()
+    parallel_data = list(parallel_reader.iter_data())
+
+    assert len(parallel_data) == 2
+    assert [doc.text for docs in parallel_data for doc in docs] == [
+        doc.text for docs in sequential_data for doc in docs
+    ]
+    assert parallel_data[0][0].metadata["file_name"] == "udhr-en.pdf"
+    assert parallel_data[0][0].metadata["page_label"] == "1"
+    assert list(parallel_reader.failed_files) == [str(tmp_path / "broken.pdf")]
@@ -0,0 +1,133 @@
+from pathlib import Path
+
+from git import Repo
+
+from ragamuffin.libraries.git_repo import GitLibrary
+from tests.utils import env_vars
+
+
+def commit_files(repo: Repo, files: dict[str, str | None], message: str) -> str:
+    """Write (or delete, if the content is None) files in the repository and commit them."""
+    work_dir = Path(repo.working_dir)
+    for name, content in files.items():
+        path = work_dir / name
+        if content is None:
+            repo.index.remove([name], working_tree=True)
+            continue
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+        repo.index.add([name])
+    return repo.index.commit(message).hexsha
+
+
+def get_files(library: GitLibrary) -> dict[str, str]:
+    """Load the files of the library through its reader."""
+    reader = library.get_reader()
+    library.save_sync_state()
+    return {document.metadata["file_path"]: document.text for document in reader.load_data()}
+
+
+def test_git_library_reads_commit(tmp_path):
+    repo = Repo.init(tmp_path / "origin")
+    first_commit = commit_files(repo, {"a.txt": "a", "b.txt": "b", "docs/c.md": "c"}, "First commit")
+    second_commit = commit_files(repo, {"a.txt": "a2", "b.txt": None, "e.txt": "e"}, "Second commit")
+
+    with env_vars(RAGAMUFFIN_DATA_DIR=str(tmp_path / "data")):
+        library = GitLibrary(repo.working_dir, ref=first_commit, state_dir=tmp_path / "state")
+        assert get_files(library) == {"a.txt": "a", "b.txt": "b", "docs/c.md": "c"}
+
+        library = GitLibrary(repo.working_dir, ref=second_commit, state_dir=tmp_path / "state")
+        reader = library.get_reader()
+        assert library.commit == second_commit
+        assert (
+            reader.get_resource_info("docs/c.md")["content_hash"] == repo.commit(first_commit).tree["docs/c.md"].hexsha
+        )
+        assert {document.metadata["file_path"]: document.text for document in reader.load_data()} == {
+            "a.txt": "a2",
+            "docs/c.md": "c",
+            "e.txt": "e",
+        }
+
+
+def test_git_library_file_selection(tmp_path):
+    repo = Repo.init(tmp_path / "origin")
+    files = {
+        "main.py": "print()",
+        "README.md": "readme",
+        "vendor/lib.py": "vendored",
+        "big.py": "x" * 200,
+        "image.py": "\0binary",
+        ".github/workflow.py": "hidden",
+    }
+    commit_files(repo, files, "First commit")
+
+    with env_vars(RAGAMUFFIN_DATA_DIR=str(tmp_path / "data")):
+        library = GitLibrary(repo.working_dir, include=["*.py"], exclude=["vendor/*"], max_file_size=100)
+        assert get_files(library) == {"main.py": "print()"}
+
+    # Files are read from the repository cache, without a checkout
+    assert not any(path.name == "main.py" for path in (tmp_path / "data").rglob("*"))
+
+
+def test_git_library_updates_working_tree(tmp_path):
+    repo = Repo.init(tmp_path / "origin")
+    first_commit = commit_files(repo, {"a.pdf": "a", "b.pdf": "b", "docs/c.pdf": "c"}, "First commit")
+    second_commit = commit_files(repo, {"a.pdf": "a2", "b.pdf": None, "e.pdf": "e"}, "Second commit")
+
+    with env_vars(RAGAMUFFIN_DATA_DIR=str(tmp_path / "data")):
+        library = GitLibrary(repo.working_dir, ref=first_commit, state_dir=tmp_path / "state")
+        library.fetch_repo()
+        library.update_working_tree(first_commit, ["a.pdf", "b.pdf", "docs/c.pdf"])
+        unchanged_mtime = (library.work_tree_dir / "docs" / "c.pdf").stat().st_mtime_ns
+
+        library = GitLibrary(repo.working_dir, ref=second_commit, state_dir=tmp_path / "state")
+        library.fetch_repo()
+        library.update_working_tree(second_commit, ["a.pdf", "docs/c.pdf", "e.pdf"])
+
+    work_tree = library.work_tree_dir
+    assert {path.relative_to(work_tree).as_posix(): path.read_text() for path in work_tree.rglob("*.pdf")} == {
+        "a.pdf": "a2",
+        "docs/c.pdf": "c",
+        "e.pdf": "e",
+    }
+    # Files which did not change between the commits are not rewritten
+    assert (work_tree / "docs" / "c.pdf").stat().st_mtime_ns == unchanged_mtime
+
+
+def test_git_library_parses_files(tmp_path):
+    repo = Repo.init(tmp_path / "origin")
+    files = {
+        "data/table.csv": "name,value\nalpha,1\nbeta,2\n",
+        "broken.pdf": "not a pdf",
+        "main.py": "print()",
+        "generated.py": "x = 1\n" * 10,
+    }
+    commit_files(repo, files, "First commit")
+
+    with env_vars(RAGAMUFFIN_DATA_DIR=str(tmp_path / "data")):
+        library = GitLibrary(repo.working_dir, max_file_size=10, state_dir=tmp_path / "state", workers=2)
+        reader = library.get_reader()
+        documents = {
+            resource_id: documents for resource_id, documents in reader.iter_resources(reader.list_resources())
+        }
+
+    # Files with a parser are loaded from the working tree, and described by their path in the repository
+    # The size limit only applies to text files
+    assert list(documents) == ["data/table.csv", "main.py"]
+    [table] = documents["data/table.csv"]
+    assert table.doc_id == "data/table.csv_part_0"
+    assert "alpha, 1" in table.text
+    assert table.metadata["file_path"] == "data/table.csv"
+    assert "last_modified_date" not in table.metadata
+    assert documents["main.py"][0].text == "print()"
+    assert list(reader.failed_files) == ["broken.pdf"]
+
+
+def test_git_library_load_resource_skips_failed_files(tmp_path):
+    repo = Repo.init(tmp_path / "origin")
+    commit_files(repo, {"broken.pdf": "not a pdf", "main.py": "print()"}, "First commit")
+
+    with env_vars(RAGAMUFFIN_DATA_DIR=str(tmp_path / "data")):
+        reader = GitLibrary(repo.working_dir, state_dir=tmp_path / "state").get_reader()
+        assert reader.load_resource("broken.pdf") == []
+        assert [document.text for document in reader.load_resource("main.py")] == ["print()"]
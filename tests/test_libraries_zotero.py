@@ -0,0 +1,225 @@
+import hashlib
+
+import pytest
+import requests
+
+import ragamuffin.libraries.zotero
+from ragamuffin.libraries.zotero import DOWNLOAD_RETRIES, ZoteroLibrary
+
+
+def zotero_item(key: str, title: str, attachment_key: str | None = "ATT", **data) -> dict:
+    links = {}
+    if attachment_key:
+        links["attachment"] = {
+            "href": f"https://api.zotero.org/users/1/items/{attachment_key}",
+            "attachmentType": "application/pdf",
+            "attachmentSize": 100,
+        }
+    return {
+        "key": key,
+        "library": {"name": "user"},
+        "links": links,
+        "data": {"title": title, "creators": [{"lastName": "Doe"}], "date": "2020", **data},
+    }
+
+
+class FakeZotero:
+    """A Zotero library in memory, which answers the API calls used by `ZoteroLibrary`."""
+
+    endpoint = "https://api.zotero.org"
+    library_type = "users"
+    library_id = "1"
+
+    def __init__(self, **kwargs):
+        self.version = 1
+        self.items_by_key: dict[str, dict] = {}
+        self.changed_since: dict[str, int] = {}
+        self.attachments: list[tuple[int, dict]] = []
+        self.deleted_keys: list[tuple[int, str]] = []
+        self.fulltexts: dict[str, dict] = {}
+
+    def put(self, item: dict) -> None:
+        self.version += 1
+        self.items_by_key[item["key"]] = item
+        self.changed_since[item["key"]] = self.version
+
+    def delete(self, key: str) -> None:
+        self.version += 1
+        del self.items_by_key[key]
+        self.deleted_keys.append((self.version, key))
+
+    def everything(self, items: list[dict]) -> list[dict]:
+        return items
+
+    def last_modified_version(self) -> int:
+        return self.version
+
+    def all_collections(self) -> list[dict]:
+        return [{"key": "COL", "data": {"name": "Selected"}}, {"key": "OTHER", "data": {"name": "Other"}}]
+
+    def top(self, since: int = 0, includeTrashed: int = 0) -> list[dict]:  # noqa: N803
+        return [item for key, item in self.items_by_key.items() if self.changed_since[key] > since]
+
+    def collection_items_top(self, collection_key: str) -> list[dict]:
+        return [item for item in self.items_by_key.values() if collection_key in item["data"].get("collections", [])]
+
+    def items(self, since: int = 0, itemType: str = "", itemKey: str = "", includeTrashed: int = 0) -> list[dict]:  # noqa: N803
+        if itemKey:
+            return [self.items_by_key[key] for key in itemKey.split(",")]
+        return [attachment for version, attachment in self.attachments if version > since]
+
+    def deleted(self, since: int) -> dict:
+        return {"items": [key for version, key in self.deleted_keys if version > since]}
+
+    def new_fulltext(self, since: int) -> dict[str, int]:
+        return {key: fulltext["version"] for key, fulltext in self.fulltexts.items()}
+
+    def fulltext_item(self, attachment_key: str) -> dict:
+        return self.fulltexts[attachment_key]
+
+    def default_headers(self) -> dict[str, str]:
+        return {}
+
+
+@pytest.fixture
+def fake_zotero(monkeypatch) -> FakeZotero:
+    zot = FakeZotero()
+    monkeypatch.setattr(ragamuffin.libraries.zotero, "Zotero", lambda **kwargs: zot)
+    return zot
+
+
+def test_zotero_incremental_sync(tmp_path, fake_zotero):
+    for key in ["A", "B", "C", "D", "F"]:
+        fake_zotero.put(zotero_item(key, f"Article {key}", attachment_key=f"ATT{key}", collections=["COL"]))
+    fake_zotero.put(zotero_item("E", "Not selected", collections=["OTHER"]))
+    sync_state_path = tmp_path / "zotero_sync.json"
+
+    library = ZoteroLibrary("1", "key", collections=["Selected"], sync_state_path=sync_state_path)
+    assert sorted(library.fetch_articles()) == ["A", "B", "C", "D", "F"]
+    library.save_sync_state()
+
+    # Change one item, trash one, move one out of the collection, replace the PDF of one and delete one
+    fake_zotero.put(zotero_item("A", "Article A, revised", attachment_key="ATTA", collections=["COL"]))
+    fake_zotero.put(zotero_item("B", "Article B", attachment_key="ATTB", collections=["COL"], deleted=1))
+    fake_zotero.put(zotero_item("C", "Article C", attachment_key="ATTC", collections=["OTHER"]))
+    fake_zotero.version += 1
+    fake_zotero.attachments.append((fake_zotero.version, {"key": "ATTD", "data": {"parentItem": "D"}}))
+    # Standalone attachments have no parent item
+    fake_zotero.attachments.append((fake_zotero.version, {"key": "ATTX", "data": {}}))
+    fake_zotero.delete("F")
+
+    library = ZoteroLibrary("1", "key", collections=["Selected"], sync_state_path=sync_state_path)
+    changed_items, removed_keys = library.fetch_changed_items(since=library.load_sync_state()["version"])
+    assert sorted(item["key"] for item in changed_items) == ["A", "D"]
+    assert removed_keys == {"B", "C", "F"}
+
+    articles = library.fetch_articles()
+    assert sorted(articles) == ["A", "D"]
+    assert articles["A"]["name"] == "(Doe, 2020) Article A, revised"
+
+    # The sync state only applies to the same selection of collections
+    library.save_sync_state()
+    assert ZoteroLibrary("1", "key", collections=["Selected"], sync_state_path=sync_state_path).load_sync_state()
+    assert ZoteroLibrary("1", "key", sync_state_path=sync_state_path).load_sync_state() is None
+
+
+def test_zotero_fulltext(tmp_path, fake_zotero):
+    fake_zotero.put(zotero_item("A", "Indexed", attachment_key="ATTA"))
+    fake_zotero.put(zotero_item("B", "Partly indexed", attachment_key="ATTB"))
+    fake_zotero.fulltexts = {
+        "ATTA": {"version": 3, "content": "Page one\fPage two", "indexedPages": 2, "totalPages": 2},
+        "ATTB": {"version": 4, "content": "Page one", "indexedPages": 1, "totalPages": 2},
+    }
+    library = ZoteroLibrary("1", "key", use_fulltext=True)
+    library.storage_dir = tmp_path
+
+    remaining = library.download_fulltexts(library.fetch_articles())
+    assert list(remaining) == ["B"]
+    assert library.fulltext_versions == {"ATTA": 3}
+    assert (tmp_path / "(Doe, 2020) Indexed.txt").read_text() == "Page one\fPage two"
+
+
+def test_zotero_downloads_changed_attachments(tmp_path, fake_zotero, monkeypatch):
+    for key in ["A", "B"]:
+        fake_zotero.put(zotero_item(key, f"Article {key}", attachment_key=f"ATT{key}"))
+        # The files have the size given by the attachment links
+        (tmp_path / f"(Doe, 2020) Article {key}.pdf").write_bytes(key.encode() * 100)
+    fake_zotero.attachments = [
+        (1, {"key": "ATTA", "data": {"md5": hashlib.md5(b"A" * 100).hexdigest()}}),  # noqa: S324
+        (1, {"key": "ATTB", "data": {"md5": hashlib.md5(b"changed" * 10).hexdigest()}}),  # noqa: S324
+    ]
+    downloads = []
+    monkeypatch.setattr(ZoteroLibrary, "download_files", lambda self, files: downloads.extend(files))
+    library = ZoteroLibrary("1", "key")
+    library.storage_dir = tmp_path
+
+    library.download_articles()
+
+    # The file with the same size but another checksum is downloaded again
+    assert downloads == [("ATTB", tmp_path / "(Doe, 2020) Article B.pdf")]
+    assert library.downloaded_md5s["ATTA"] == fake_zotero.attachments[0][1]["data"]["md5"]
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, headers: dict[str, str] | None = None, content: bytes = b""):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = content
+
+    def __enter__(self) -> "FakeResponse":
+        return self
+
+    def __exit__(self, *args) -> None:
+        pass
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} error")
+
+    def iter_content(self, chunk_size: int) -> list[bytes]:
+        return [self.content]
+
+
+class FakeSession:
+    def __init__(self, responses: list[FakeResponse]):
+        self.responses = responses
+        self.urls: list[str] = []
+
+    def get(self, url: str, **kwargs) -> FakeResponse:
+        self.urls.append(url)
+        return self.responses.pop(0)
+
+
+def test_zotero_download_retries_and_backoff(tmp_path, fake_zotero, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(ragamuffin.libraries.zotero.time, "sleep", sleeps.append)
+    library = ZoteroLibrary("1", "key")
+
+    session = FakeSession(
+        [
+            FakeResponse(429, {"Retry-After": "30"}),
+            FakeResponse(503),
+            FakeResponse(200, {"Backoff": "60"}, content=b"%PDF"),
+        ]
+    )
+    library.download_file(session, "ATTA", tmp_path / "article.pdf")
+
+    assert session.urls == ["https://api.zotero.org/users/1/items/ATTA/file"] * 3
+    assert (tmp_path / "article.pdf").read_bytes() == b"%PDF"
+    assert not (tmp_path / "article.pdf.part").exists()
+    # The Retry-After delay is waited for, and the Backoff delay pauses the following downloads
+    assert sleeps[0] == pytest.approx(30, abs=1)
+    assert len(sleeps) == 2
+    library._wait_for_backoff()
+    assert sleeps[-1] == pytest.approx(60, abs=1)
+
+
+def test_zotero_download_gives_up_after_retries(tmp_path, fake_zotero, monkeypatch):
+    monkeypatch.setattr(ragamuffin.libraries.zotero.time, "sleep", lambda _: None)
+    library = ZoteroLibrary("1", "key")
+
+    session = FakeSession([FakeResponse(503) for _ in range(DOWNLOAD_RETRIES + 1)])
+    with pytest.raises(requests.HTTPError):
+        library.download_file(session, "ATTA", tmp_path / "article.pdf")
+    assert len(session.urls) == DOWNLOAD_RETRIES + 1
+    assert not (tmp_path / "article.pdf").exists()
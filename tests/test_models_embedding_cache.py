@@ -0,0 +1,81 @@
+import sqlite3
+import sys
+
+import pytest
+from llama_index.core import MockEmbedding
+
+from ragamuffin.models.embedding_cache import CachedEmbedding, EmbeddingCache
+
+
+class CountingEmbedding(MockEmbedding):
+    """Mock embedding model which records the texts it embeds."""
+
+    embedded_texts: list[str] = []
+
+    def _get_text_embedding(self, text: str) -> list[float]:
+        self.embedded_texts.append(text)
+        return [float(len(text))] * self.embed_dim
+
+
+def test_cached_embedding(tmp_path):
+    cache = EmbeddingCache(tmp_path / "cache.sqlite", max_size=1024 * 1024)
+    model = CountingEmbedding(embed_dim=4)
+    cached_model = CachedEmbedding(model, "mock/model", 4, cache)
+
+    embeddings = cached_model.get_text_embedding_batch(["a", "bb"])
+    assert embeddings == [[1.0] * 4, [2.0] * 4]
+    assert model.embedded_texts == ["a", "bb"]
+
+    # Embeddings are reused across model instances and only missing texts are embedded
+    model.embedded_texts = []
+    cached_model = CachedEmbedding(model, "mock/model", 4, EmbeddingCache(tmp_path / "cache.sqlite", 1024 * 1024))
+    embeddings = cached_model.get_text_embedding_batch(["bb", "ccc", "a"])
+    assert embeddings == [[2.0] * 4, [3.0] * 4, [1.0] * 4]
+    assert model.embedded_texts == ["ccc"]
+    assert (cached_model.cache.hits, cached_model.cache.misses) == (2, 1)
+
+    # The cache is keyed by the model name and dimension
+    model.embedded_texts = []
+    CachedEmbedding(model, "mock/other-model", 4, cache).get_text_embedding_batch(["a"])
+    assert model.embedded_texts == ["a"]
+
+
+def test_embedding_cache_eviction(tmp_path):
+    embedding_size = 4 * 4
+    cache = EmbeddingCache(tmp_path / "cache.sqlite", max_size=2 * embedding_size)
+
+    cache.put_many("model", 4, ["a", "b"], [[1.0] * 4, [2.0] * 4])
+    cache.get_many("model", 4, ["a"])
+    cache.put_many("model", 4, ["c"], [[3.0] * 4])
+
+    # The least recently used embedding is evicted
+    assert cache.get_many("model", 4, ["a", "b", "c"]) == [[1.0] * 4, None, [3.0] * 4]
+    assert cache.get_size() == 2 * embedding_size
+
+
+def test_embedding_cache_size(tmp_path):
+    embedding_size = 4 * 4
+    cache = EmbeddingCache(tmp_path / "cache.sqlite", max_size=10 * embedding_size)
+
+    cache.put_many("model", 4, ["a", "b"], [[1.0] * 4, [2.0] * 4])
+    cache.put_many("model", 4, ["a"], [[3.0] * 4])
+    cache.put_many("model", 2, ["a"], [[4.0] * 2])
+    cache.get_many("model", 4, ["a", "b"])
+
+    # The running total counts replaced embeddings once, and is kept when the cache is opened again
+    assert cache.get_size() == 2 * embedding_size + 2 * 4
+    assert EmbeddingCache(tmp_path / "cache.sqlite", max_size=10 * embedding_size).get_size() == cache.get_size()
+    assert cache.get_many("model", 4, ["a"]) == [[3.0] * 4]
+
+
+@pytest.mark.skipif(sys.version_info < (3, 11), reason="Connection.setlimit requires Python 3.11")
+def test_embedding_cache_looks_up_many_texts(tmp_path):
+    cache = EmbeddingCache(tmp_path / "cache.sqlite", max_size=1024 * 1024)
+    # The default limit of SQLite builds before version 3.32
+    cache._connection.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 999)
+    texts = [f"text {i}" for i in range(1500)]
+    cache.put_many("model", 1, texts[::2], [[float(i)] for i in range(0, 1500, 2)])
+
+    embeddings = cache.get_many("model", 1, texts)
+    assert embeddings == [[float(i)] if i % 2 == 0 else None for i in range(1500)]
+    assert (cache.hits, cache.misses) == (750, 750)
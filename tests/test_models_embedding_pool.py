@@ -0,0 +1,60 @@
+import os
+
+import pytest
+from llama_index.core import Settings
+from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+from ragamuffin.models import model_picker
+from ragamuffin.models.embedding_pool import EmbeddingPool, _init_worker
+from ragamuffin.models.model_picker import close_embedding_pool, configure_llamaindex_embedding_model
+from tests.utils import create_tiny_model, env_vars, seed
+
+
+@seed(42)
+def test_embedding_pool(tmp_path):
+    model_path = create_tiny_model(tmp_path)
+    texts = [f"human rights {'abc' * i}" for i in range(10)]
+
+    pool = EmbeddingPool(f"huggingface.co/{model_path}", num_workers=2)
+    try:
+        embeddings = pool.get_text_embedding_batch(texts)
+        query_embedding = pool.get_query_embedding("human rights")
+    finally:
+        pool.close()
+
+    # Embeddings are returned in the order of the texts
+    model = HuggingFaceEmbedding(model_name=str(model_path), device="cpu")
+    expected_embeddings = model.get_text_embedding_batch(texts)
+    assert len(embeddings) == len(texts)
+    for embedding, expected_embedding in zip(embeddings, expected_embeddings, strict=True):
+        assert embedding == pytest.approx(expected_embedding, abs=1e-5)
+    assert query_embedding == pytest.approx(model.get_query_embedding("human rights"), abs=1e-5)
+
+
+def test_embedding_pool_worker_threads(monkeypatch):
+    monkeypatch.setattr("os.cpu_count", lambda: 8)
+    monkeypatch.setattr("torch.set_num_threads", lambda threads: None)
+    monkeypatch.setattr("ragamuffin.models.model_picker.get_embedding_model_by_name", lambda name: None)
+    monkeypatch.setenv("RAGAMUFFIN_ONNX_THREADS", "0")
+
+    _init_worker("onnx/model", num_workers=4)
+
+    # ONNX Runtime in each worker uses its share of the cores
+    assert os.environ["RAGAMUFFIN_ONNX_THREADS"] == "2"
+
+
+def test_configured_embedding_pool_is_closed(tmp_path):
+    model_path = create_tiny_model(tmp_path)
+    with env_vars(
+        RAGAMUFFIN_DATA_DIR=str(tmp_path / "data"),
+        RAGAMUFFIN_EMBEDDING_MODEL=f"huggingface.co/{model_path}",
+        RAGAMUFFIN_EMBEDDING_DIMENSION="64",
+    ):
+        configure_llamaindex_embedding_model(embed_workers=2)
+        pool = model_picker._embedding_pool
+        assert pool is not None
+        Settings.embed_model.get_text_embedding("human rights")
+        assert pool._executor is not None
+
+        close_embedding_pool()
+    assert pool._executor is None
@@ -0,0 +1,57 @@
+from llama_index.core import Settings
+from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+from ragamuffin.models.highlighter import SemanticHighlighter
+from tests.utils import create_tiny_model, env_vars, seed
+
+
+@seed(42)
+def test_highlighter_shares_retrieval_model(tmp_path, monkeypatch, offline_sentence_tokenizer):
+    model_path = create_tiny_model(tmp_path)
+    embed_model = HuggingFaceEmbedding(model_name=str(model_path))
+    monkeypatch.setattr(Settings, "_embed_model", embed_model)
+    source = "Human rights are universal. They apply to everyone."
+
+    with env_vars(RAGAMUFFIN_EMBEDDING_MODEL=f"huggingface.co/{model_path}", RAGAMUFFIN_HIGHLIGHT_MODEL="retrieval"):
+        highlighter = SemanticHighlighter()
+    assert highlighter.model is embed_model
+    assert highlighter.is_retrieval_model
+    expected = highlighter.highlight_multiple("human rights", [source])
+
+    # The query embedding of the retriever is used instead of embedding the query again
+    query_embedding = embed_model.get_query_embedding("human rights")
+    embedded_queries = []
+    embed_model.__dict__["get_query_embedding"] = embedded_queries.append
+    assert highlighter.highlight_multiple("human rights", [source], query_embedding=query_embedding) == expected
+    assert embedded_queries == []
+
+
+@seed(42)
+def test_highlighter_caches_sentence_embeddings(tmp_path, offline_sentence_tokenizer):
+    model_path = create_tiny_model(tmp_path)
+    sources = ["Human rights are universal. They apply to everyone.", "A short source."]
+
+    with env_vars(RAGAMUFFIN_HIGHLIGHT_MODEL=f"huggingface.co/{model_path}", RAGAMUFFIN_HIGHLIGHT_CACHE_SIZE="2"):
+        highlighter = SemanticHighlighter()
+    expected = highlighter.highlight_multiple("human rights", sources)
+
+    embedded_texts = []
+    get_text_embedding_batch = highlighter.model.get_text_embedding_batch
+
+    def record_embedded_texts(texts: list[str], **kwargs) -> list[list[float]]:
+        embedded_texts.extend(texts)
+        return get_text_embedding_batch(texts, **kwargs)
+
+    highlighter.model.__dict__["get_text_embedding_batch"] = record_embedded_texts
+
+    # Cached sources are not split or embedded again, and the least recently used source is evicted
+    assert highlighter.highlight_multiple("rights", sources[::-1]) is not None
+    assert highlighter.highlight_multiple("human rights", sources) == expected
+    assert embedded_texts == []
+    assert highlighter.highlight_multiple("new", ["A new source."]) is not None
+    assert highlighter.highlight_multiple("short", ["A short source."]) is not None
+    assert embedded_texts == ["A new source."]
+    assert highlighter.highlight_multiple("human rights", sources[:1]) == expected[:1]
+    assert embedded_texts == ["A new source.", "Human rights are universal.", "They apply to everyone."]
+    assert highlighter.sentence_cache is not None
+    assert (highlighter.sentence_cache.hits, highlighter.sentence_cache.misses) == (5, 4)
@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+from sentence_transformers import SentenceTransformer
+
+from ragamuffin.models.onnx_embedding import get_onnx_embedding_model
+from tests.utils import create_tiny_model, env_vars, seed
+
+pytest.importorskip("optimum.onnxruntime")
+
+
+@seed(42)
+def test_onnx_embedding_model(tmp_path):
+    model_path = create_tiny_model(tmp_path)
+
+    with env_vars(RAGAMUFFIN_DATA_DIR=str(tmp_path / "data")):
+        model = get_onnx_embedding_model(str(model_path), threads=1, batch_size=4)
+
+    texts = ["human rights", "a b c", "rights of the human"]
+    embeddings = np.array(model.get_text_embedding_batch(texts))
+    fp32_embeddings = SentenceTransformer(str(model_path), device="cpu").encode(texts, normalize_embeddings=True)
+
+    assert model.embed_batch_size == 4
+    assert embeddings.shape == (3, 64)
+    assert np.all(np.sum(embeddings * fp32_embeddings, axis=1) > 0.95)
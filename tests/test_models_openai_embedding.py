@@ -0,0 +1,107 @@
+import asyncio
+import json
+import threading
+import time
+from collections.abc import Iterator
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from ragamuffin.models.openai_embedding import ScheduledOpenAIEmbedding
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    """A stand-in for the OpenAI embeddings API which rate limits the first requests."""
+
+    def __init__(self, rate_limited_requests: int):
+        super().__init__(("127.0.0.1", 0), FakeOpenAIHandler)
+        self.rate_limited_requests = rate_limited_requests
+        self.batches: list[list[str]] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    server: FakeOpenAIServer
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with self.server.lock:
+            self.server.in_flight += 1
+            self.server.max_in_flight = max(self.server.max_in_flight, self.server.in_flight)
+            is_rate_limited = self.server.rate_limited_requests > 0
+            self.server.rate_limited_requests -= 1
+        time.sleep(0.05)
+
+        if is_rate_limited:
+            self.send_json(
+                429, {"error": {"message": "Rate limit reached", "type": "requests"}}, {"retry-after-ms": "10"}
+            )
+        else:
+            self.server.batches.append(request["input"])
+            data = [
+                {"object": "embedding", "index": i, "embedding": [float(len(text)), 1.0]}
+                for i, text in enumerate(request["input"])
+            ]
+            usage = {"prompt_tokens": 1, "total_tokens": 1}
+            self.send_json(200, {"object": "list", "data": data, "model": request["model"], "usage": usage})
+
+        with self.server.lock:
+            self.server.in_flight -= 1
+
+    def send_json(self, status: int, body: dict, headers: dict | None = None):
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def fake_openai_server() -> Iterator[FakeOpenAIServer]:
+    server = FakeOpenAIServer(rate_limited_requests=2)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+
+
+def test_scheduled_openai_embedding(fake_openai_server):
+    host, port = fake_openai_server.server_address
+    model = ScheduledOpenAIEmbedding(
+        api_key="test", api_base=f"http://{host}:{port}/v1", max_batch_tokens=20, max_concurrency=4
+    )
+    texts = [f"text number {i} " * (i % 3 + 1) for i in range(30)]
+
+    embeddings = model.get_text_embedding_batch(texts)
+
+    # Results keep the order of the texts, even though batches complete out of order
+    assert embeddings == [[float(len(text)), 1.0] for text in texts]
+    assert sorted(text for batch in fake_openai_server.batches for text in batch) == sorted(texts)
+
+    # Texts are packed into several batches which are sent concurrently
+    assert len(fake_openai_server.batches) > 1
+    assert all(len(batch) < len(texts) for batch in fake_openai_server.batches)
+    assert 1 < fake_openai_server.max_in_flight <= 4
+
+
+def test_scheduled_openai_embedding_reuses_client(fake_openai_server):
+    host, port = fake_openai_server.server_address
+    model = ScheduledOpenAIEmbedding(api_key="test", api_base=f"http://{host}:{port}/v1", max_concurrency=4)
+
+    assert model.get_text_embedding_batch(["first"]) == [[5.0, 1.0]]
+    client, limiter = model._request_client, model._limiter
+    assert asyncio.run(model.aget_text_embedding_batch(["second"])) == [[6.0, 1.0]]
+
+    # The client and the adapted concurrency limit are kept between calls, also from another event loop
+    assert model._request_client is client
+    assert model._limiter is limiter
+    model.close()
+    assert model._request_client is None
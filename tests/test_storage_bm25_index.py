@@ -0,0 +1,75 @@
+import pytest
+from llama_index.core.schema import NodeWithScore, TextNode
+
+from ragamuffin.storage.bm25_index import BM25Index, tokenize
+from ragamuffin.storage.hybrid_retriever import reciprocal_rank_fusion
+
+NODES = [
+    ("node-0", "doc-a", "The GitLibrary class reads files from a Git repository."),
+    ("node-1", "doc-a", "Files are read from the object database of the repository."),
+    ("node-2", "doc-b", "Enzyme kinetics of protein folding."),
+]
+
+
+def test_tokenize_splits_identifiers():
+    assert tokenize("GitLibrary get_storage HTTPServer Files") == [
+        "gitlibrary",
+        "git",
+        "library",
+        "get_storage",
+        "get",
+        "storage",
+        "httpserver",
+        "http",
+        "server",
+        "files",
+    ]
+
+
+def test_bm25_index_search(tmp_path):
+    index = BM25Index.build(NODES)
+
+    assert [row for row, _ in index.search("gitlibrary", top_k=3)] == [0]
+    # Rarer terms have a higher weight
+    assert [row for row, _ in index.search("repository enzyme", top_k=3)][0] == 2
+    assert index.search("unknown words", top_k=3) == []
+
+    index.save(tmp_path / "bm25_index.npz")
+    loaded = BM25Index.load(tmp_path / "bm25_index.npz")
+    assert loaded.search("object database", top_k=3) == index.search("object database", top_k=3)
+    assert list(loaded.ref_doc_ids) == ["doc-a", "doc-a", "doc-b"]
+
+
+def test_bm25_index_update_matches_build(tmp_path):
+    index = BM25Index.build(NODES[:2])
+    index.save(tmp_path / "bm25_index.npz")
+    loaded = BM25Index.load(tmp_path / "bm25_index.npz")
+    assert loaded.is_updatable
+
+    new_nodes = {"node-3": ("node-3", "doc-c", "Folding of repository files.")}
+    loaded_node_ids = []
+
+    def load_nodes(node_ids: list[str]) -> list[tuple[str, str, str]]:
+        loaded_node_ids.extend(node_ids)
+        return [new_nodes[node_id] for node_id in node_ids]
+
+    updated = loaded.update(["node-1", "node-3"], load_nodes)
+    expected = BM25Index.build([NODES[1], new_nodes["node-3"]])
+
+    assert loaded_node_ids == ["node-3"]
+    assert list(updated.node_ids) == list(expected.node_ids)
+    assert sorted(updated.terms) == sorted(expected.terms)
+    for query in ["repository", "files folding", "object database", "gitlibrary"]:
+        assert updated.search(query, top_k=3) == pytest.approx(expected.search(query, top_k=3))
+
+
+def test_reciprocal_rank_fusion():
+    def ranking(*node_ids: str) -> list[NodeWithScore]:
+        return [NodeWithScore(node=TextNode(id_=node_id, text=node_id), score=1.0) for node_id in node_ids]
+
+    fused = reciprocal_rank_fusion([ranking("a", "b", "c"), ranking("c", "a", "d")], top_k=3)
+
+    # Nodes found by both retrievers are ranked first, and a node ranked first by both would score 1
+    assert [node.node.node_id for node in fused] == ["a", "c", "b"]
+    assert fused[0].score is not None
+    assert 0.9 < fused[0].score < 1
@@ -0,0 +1,28 @@
+from ragamuffin.storage.cassandra import CassandraStorage
+from ragamuffin.storage.cassandra_vector_store import group_by_partition
+from ragamuffin.storage.utils import get_storage
+
+
+def test_group_by_partition():
+    rows = [("doc-b", 10, "b1"), ("doc-a", 10, "a1"), ("doc-b", 10, "b2"), ("doc-a", 30, "a2"), ("doc-a", 50, "a3")]
+
+    batches = group_by_partition(rows, max_batch_bytes=40)
+
+    # Each batch writes to one partition and stays within the size limit, unless a row is larger
+    assert batches == [["a1", "a2"], ["a3"], ["b1", "b2"]]
+
+
+def test_get_storage_connects_lazily(monkeypatch):
+    monkeypatch.setenv("RAGAMUFFIN_STORAGE_TYPE", "cassandra")
+    monkeypatch.setenv("CASSANDRA_CLUSTER", "10.0.0.1, 10.0.0.2")
+    monkeypatch.setenv("CASSANDRA_LOCAL_DC", "dc1")
+    monkeypatch.setenv("CASSANDRA_FETCH_SIZE", "50")
+
+    storage = get_storage()
+
+    # No connection is opened until the cluster is used
+    assert isinstance(storage, CassandraStorage)
+    assert storage._session is None
+    assert storage.contact_points == ["10.0.0.1", "10.0.0.2"]
+    assert storage.options.local_dc == "dc1"
+    assert storage.options.fetch_size == 50
@@ -0,0 +1,75 @@
+import shutil
+from pathlib import Path
+
+import pytest
+
+import ragamuffin.storage.file
+from ragamuffin.libraries.files import LocalLibrary
+from ragamuffin.storage.checkpoint import CHECKPOINT_FILENAME
+from ragamuffin.storage.file import FileStorage
+from ragamuffin.storage.ingest import insert_documents
+from tests.utils import create_tiny_model, env_vars, seed
+
+
+class Interrupted(Exception):
+    pass
+
+
+def get_stored_nodes(storage: FileStorage, agent_name: str) -> list[tuple[str, str]]:
+    index = storage.load_index(agent_name)
+    return sorted((node.ref_doc_id or "", node.get_content()) for node in index.docstore.docs.values())
+
+
+@seed(42)
+def test_file_storage_resume(tmp_path, monkeypatch):
+    library_path = tmp_path / "library"
+    shutil.copytree(Path(__file__).parent / "data" / "udhr", library_path)
+    (library_path / "a.txt").write_text("All human beings are born free and equal in dignity and rights.")
+    (library_path / "b.txt").write_text("Everyone has the right to life, liberty and security of person.")
+    model_path = create_tiny_model(tmp_path)
+
+    def interrupted_insert(*args, on_batch, **kwargs):
+        batch_count = 0
+
+        def checkpoint_then_interrupt(batch):
+            nonlocal batch_count
+            on_batch(batch)
+            batch_count += 1
+            # Stop in the middle of the PDF, after a.txt and b.txt were indexed
+            if batch_count == 3:
+                raise Interrupted
+
+        return insert_documents(*args, on_batch=checkpoint_then_interrupt, **kwargs)
+
+    with env_vars(
+        RAGAMUFFIN_DATA_DIR=str(tmp_path / "data"),
+        RAGAMUFFIN_EMBEDDING_DIMENSION="64",
+        RAGAMUFFIN_EMBEDDING_MODEL=f"huggingface.co/{model_path}",
+        RAGAMUFFIN_INGEST_BATCH_SIZE="1",
+        RAGAMUFFIN_CHECKPOINT_INTERVAL="1",
+    ):
+        storage = FileStorage()
+        storage.generate_index("complete_agent", reader=LocalLibrary(str(library_path)).get_reader())
+
+        # Store a checkpoint after every batch
+        monkeypatch.setattr("ragamuffin.storage.checkpoint.time.monotonic", iter(range(0, 10**6, 10)).__next__)
+        monkeypatch.setattr(ragamuffin.storage.file, "insert_documents", interrupted_insert)
+        with pytest.raises(Interrupted):
+            storage.generate_index("resumed_agent", reader=LocalLibrary(str(library_path)).get_reader())
+        assert (storage.get_agent_storage_dir("resumed_agent") / CHECKPOINT_FILENAME).exists()
+
+        monkeypatch.setattr(ragamuffin.storage.file, "insert_documents", insert_documents)
+        indexed_files = []
+        original_iter = ragamuffin.storage.file.iter_changed_documents
+
+        def recording_iter(reader, paths, manifest):
+            indexed_files.extend(Path(path).name for path in paths)
+            return original_iter(reader, paths, manifest)
+
+        monkeypatch.setattr(ragamuffin.storage.file, "iter_changed_documents", recording_iter)
+        storage.generate_index("resumed_agent", reader=LocalLibrary(str(library_path)).get_reader(), resume=True)
+
+    # Files indexed before the checkpoint are skipped, and the index matches an uninterrupted run
+    assert sorted(indexed_files) == ["udhr-en.pdf", "udhr-pl.txt"]
+    assert not (storage.get_agent_storage_dir("resumed_agent") / CHECKPOINT_FILENAME).exists()
+    assert get_stored_nodes(storage, "resumed_agent") == get_stored_nodes(storage, "complete_agent")
@@ -0,0 +1,38 @@
+from llama_index.core.schema import TextNode
+
+from ragamuffin.storage.docstore import DOCSTORE_FILENAME, SQLiteDocumentStore
+
+
+def test_sqlite_docstore(tmp_path):
+    db_path = tmp_path / DOCSTORE_FILENAME
+    docstore = SQLiteDocumentStore(db_path, cache_size=2)
+    nodes = [TextNode(id_=f"node-{i}", text=f"Article {i} " * 100) for i in range(5)]
+    docstore.add_documents(nodes)
+    docstore.persist()
+
+    # Records are compressed
+    assert db_path.stat().st_size < sum(len(node.text) for node in nodes)
+
+    loaded = SQLiteDocumentStore(db_path, cache_size=2)
+    assert loaded.get_node("node-3").get_content() == nodes[3].text
+    assert loaded.document_exists("node-4")
+    assert not loaded.document_exists("node-5")
+    assert len(loaded.docs) == 5
+
+    # Changes are stored only when the docstore is persisted
+    loaded.delete_document("node-0")
+    loaded.clear()
+    assert not loaded.document_exists("node-1")
+    assert SQLiteDocumentStore(db_path, cache_size=2).document_exists("node-1")
+    loaded.persist()
+    assert not SQLiteDocumentStore(db_path, cache_size=2).document_exists("node-1")
+
+
+def test_sqlite_docstore_reads_selected_nodes(tmp_path):
+    docstore = SQLiteDocumentStore(tmp_path / DOCSTORE_FILENAME, cache_size=2)
+    docstore.add_documents([TextNode(id_=f"node-{i:04}", text=f"Article {i}") for i in range(1200)])
+
+    assert sorted(docstore.get_node_ids()) == [f"node-{i:04}" for i in range(1200)]
+    # More IDs than fit in one SQLite query, and an unknown one which is skipped
+    node_ids = [f"node-{i:04}" for i in range(0, 1200, 2)] + ["node-9999"]
+    assert sorted(node.node_id for node in docstore.iter_nodes(node_ids)) == node_ids[:-1]
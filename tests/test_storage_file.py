@@ -1,8 +1,9 @@
+import shutil
 from pathlib import Path
 
 from ragamuffin.libraries.files import LocalLibrary
 from ragamuffin.storage.file import FileStorage
-from tests.utils import env_vars, seed
+from tests.utils import create_tiny_model, env_vars, seed
 
 
 @seed(42)
@@ -29,3 +30,56 @@ def test_file_storage_create_agent():
 
     storage.delete_agent(agent_name)
     assert agent_name not in storage.list_agents()
+
+
+@seed(42)
+def test_file_storage_update_agent(tmp_path):
+    test_data_path = Path(__file__).parent / "data" / "udhr"
+    for file_path in test_data_path.iterdir():
+        shutil.copy(file_path, tmp_path / file_path.name)
+
+    storage = FileStorage()
+    agent_name = "test_agent"
+    with env_vars(
+        RAGAMUFFIN_EMBEDDING_DIMENSION="312",
+        RAGAMUFFIN_EMBEDDING_MODEL="huggingface.co/huawei-noah/TinyBERT_General_4L_312D",
+    ):
+        storage.generate_index(agent_name, reader=LocalLibrary(str(tmp_path)).get_reader())
+
+        # Modify one file and delete another
+        (tmp_path / "udhr-pl.txt").write_text("Wszyscy ludzie rodzą się wolni i równi pod względem swej godności.")
+        (tmp_path / "udhr-en.pdf").unlink()
+        storage.generate_index(agent_name, reader=LocalLibrary(str(tmp_path)).get_reader())
+
+    index = storage.load_index(agent_name)
+    ref_docs = list(index.ref_doc_info.values())
+    assert len(ref_docs) == 1
+    assert ref_docs[0].metadata["file_name"] == "udhr-pl.txt"
+    assert len(ref_docs[0].node_ids) == 1
+
+    storage.delete_agent(agent_name)
+    assert agent_name not in storage.list_agents()
+
+
+@seed(42)
+def test_file_storage_update_agent_after_deleting_files(tmp_path):
+    library_path = tmp_path / "library"
+    library_path.mkdir()
+    (library_path / "a.txt").write_text("All human beings are born free and equal in dignity and rights.")
+    (library_path / "b.txt").write_text("Everyone has the right to life, liberty and security of person.")
+    model_path = create_tiny_model(tmp_path)
+
+    with env_vars(
+        RAGAMUFFIN_DATA_DIR=str(tmp_path / "data"),
+        RAGAMUFFIN_EMBEDDING_DIMENSION="64",
+        RAGAMUFFIN_EMBEDDING_MODEL=f"huggingface.co/{model_path}",
+    ):
+        storage = FileStorage()
+        storage.generate_index("test_agent", reader=LocalLibrary(str(library_path)).get_reader())
+
+        # No file is loaded, only the documents of the deleted file are removed
+        (library_path / "b.txt").unlink()
+        storage.generate_index("test_agent", reader=LocalLibrary(str(library_path)).get_reader())
+
+        index = storage.load_index("test_agent")
+        assert [doc.metadata["file_name"] for doc in index.ref_doc_info.values()] == ["a.txt"]
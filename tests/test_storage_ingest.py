@@ -0,0 +1,45 @@
+import ragamuffin.storage.file
+from ragamuffin.libraries.files import LocalLibrary
+from ragamuffin.storage.file import FileStorage
+from ragamuffin.storage.ingest import insert_documents
+from tests.utils import create_tiny_model, env_vars, seed
+
+
+@seed(42)
+def test_documents_are_inserted_in_batches(tmp_path, monkeypatch):
+    library_path = tmp_path / "library"
+    library_path.mkdir()
+    for i in range(5):
+        (library_path / f"{i}.txt").write_text(f"Article {i}. Everyone has the right to education.")
+    model_path = create_tiny_model(tmp_path)
+
+    loaded_documents = 0
+    batches = []
+
+    def recording_insert(index, documents, batch_size, on_batch):
+        def count_loaded(documents):
+            nonlocal loaded_documents
+            for document in documents:
+                loaded_documents += 1
+                yield document
+
+        def record_batch(batch):
+            batches.append((len(batch), loaded_documents))
+            on_batch(batch)
+
+        return insert_documents(index, count_loaded(documents), batch_size, on_batch=record_batch)
+
+    monkeypatch.setattr(ragamuffin.storage.file, "insert_documents", recording_insert)
+    with env_vars(
+        RAGAMUFFIN_DATA_DIR=str(tmp_path / "data"),
+        RAGAMUFFIN_EMBEDDING_DIMENSION="64",
+        RAGAMUFFIN_EMBEDDING_MODEL=f"huggingface.co/{model_path}",
+        RAGAMUFFIN_INGEST_BATCH_SIZE="2",
+    ):
+        storage = FileStorage()
+        storage.generate_index("test_agent", reader=LocalLibrary(str(library_path)).get_reader())
+        index = storage.load_index("test_agent")
+
+    # Documents are loaded lazily, so each batch is inserted before the next one is loaded
+    assert batches == [(2, 2), (2, 4), (1, 5)]
+    assert len(index.ref_doc_info) == 5
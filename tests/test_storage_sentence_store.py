@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+from ragamuffin.models.highlighter import SemanticHighlighter
+from ragamuffin.storage.sentence_store import MmapSentenceStore
+from tests.utils import create_tiny_model, env_vars, seed
+
+NODES = [
+    ("node-0", "Human rights are universal. They apply to everyone. Rights & duties go together."),
+    ("node-1", "A short node."),
+]
+
+
+@pytest.fixture
+def tiny_highlighter(tmp_path, offline_sentence_tokenizer) -> SemanticHighlighter:
+    model_path = create_tiny_model(tmp_path)
+    with env_vars(RAGAMUFFIN_HIGHLIGHT_MODEL=f"huggingface.co/{model_path}"):
+        return SemanticHighlighter()
+
+
+@seed(42)
+def test_sentence_store_highlights_without_embedding_sentences(tmp_path, tiny_highlighter):
+    MmapSentenceStore.build(tmp_path, NODES, tiny_highlighter)
+    store = MmapSentenceStore.load(tmp_path)
+
+    sentences = store.get("node-0")
+    assert sentences is not None
+    assert [NODES[0][1][start:end] for start, end in sentences.spans] == [
+        "Human rights are universal.",
+        "They apply to everyone.",
+        "Rights & duties go together.",
+    ]
+    assert np.allclose(np.linalg.norm(sentences.embeddings.astype(np.float32), axis=1), 1, atol=1e-2)
+    assert store.get("unknown") is None
+
+    texts = [text for _, text in NODES]
+    expected = tiny_highlighter.highlight_multiple("human rights", texts, max_length=500)
+    assert "Rights &amp; duties" in "".join(expected)
+
+    embedded_texts = []
+    get_text_embedding_batch = tiny_highlighter.model.get_text_embedding_batch
+
+    def record_embedded_texts(texts: list[str], **kwargs) -> list[list[float]]:
+        embedded_texts.extend(texts)
+        return get_text_embedding_batch(texts, **kwargs)
+
+    tiny_highlighter.model.__dict__["get_text_embedding_batch"] = record_embedded_texts
+    tiny_highlighter.sentence_store = store
+    highlighted = tiny_highlighter.highlight_multiple(
+        "human rights", texts, max_length=500, node_ids=["node-0", "node-1"]
+    )
+
+    # No sentence is embedded, and the stored float16 embeddings select the same sentences
+    assert embedded_texts == []
+    assert [text.split('">')[1:] for text in highlighted] == [text.split('">')[1:] for text in expected]
+
+
+def test_sentence_store_update_embeds_only_new_nodes(tmp_path, tiny_highlighter):
+    MmapSentenceStore.build(tmp_path, NODES, tiny_highlighter)
+    first = MmapSentenceStore.load(tmp_path)
+
+    new_nodes = {"node-2": "A new node. With two sentences."}
+    loaded_node_ids = []
+
+    def load_nodes(node_ids: list[str]) -> list[tuple[str, str]]:
+        loaded_node_ids.extend(node_ids)
+        return [(node_id, new_nodes[node_id]) for node_id in node_ids]
+
+    MmapSentenceStore.update(tmp_path, ["node-0", "node-2"], load_nodes, tiny_highlighter)
+    second = MmapSentenceStore.load(tmp_path)
+
+    assert loaded_node_ids == ["node-2"]
+    first_sentences, second_sentences = first.get("node-0"), second.get("node-0")
+    assert first_sentences is not None and second_sentences is not None
+    assert np.array_equal(first_sentences.embeddings, second_sentences.embeddings)
+    assert second.get_text_hash("node-0") == first.get_text_hash("node-0")
+    assert second.get("node-1") is None
+    assert len(second.get("node-2").spans) == 2
+
+    MmapSentenceStore.delete(tmp_path)
+    assert not MmapSentenceStore.is_persisted(tmp_path)
+
+
+def test_sentence_store_ignores_changed_text(tmp_path, tiny_highlighter):
+    MmapSentenceStore.build(tmp_path, NODES, tiny_highlighter)
+    tiny_highlighter.sentence_store = MmapSentenceStore.load(tmp_path)
+
+    # A changed text of the same length, whose sentences end at other offsets
+    changed_text = "Everyone has rights. Human rights are universal ones. Duties go with rights too."
+    assert len(changed_text) == len(NODES[0][1])
+    highlighted = tiny_highlighter.highlight_multiple("human rights", [changed_text], node_ids=["node-0"])
+
+    assert highlighted == tiny_highlighter.highlight_multiple("human rights", [changed_text])
@@ -0,0 +1,122 @@
+import shutil
+from pathlib import Path
+
+import pytest
+from llama_index.core.vector_stores.types import VectorStoreQuery, VectorStoreQueryMode
+
+from ragamuffin.libraries.files import LocalLibrary
+from ragamuffin.storage import sqlite
+from ragamuffin.storage.sqlite import SQLiteStorage
+from ragamuffin.storage.sqlite_vector_store import SQLiteVectorStore
+from tests.utils import create_tiny_model, env_vars, seed
+
+
+@seed(42)
+def test_sqlite_storage(tmp_path):
+    library_path = tmp_path / "library"
+    shutil.copytree(Path(__file__).parent / "data" / "udhr", library_path)
+    model_path = create_tiny_model(tmp_path)
+
+    storage = SQLiteStorage(tmp_path / "storage.sqlite")
+    agent_name = "test_agent"
+    with env_vars(
+        RAGAMUFFIN_DATA_DIR=str(tmp_path / "data"),
+        RAGAMUFFIN_EMBEDDING_DIMENSION="64",
+        RAGAMUFFIN_EMBEDDING_MODEL=f"huggingface.co/{model_path}",
+    ):
+        storage.generate_index(agent_name, reader=LocalLibrary(str(library_path)).get_reader())
+        assert storage.list_agents() == [agent_name]
+
+        # Only the changed file is indexed again
+        (library_path / "udhr-pl.txt").write_text("Wszyscy ludzie rodzą się wolni i równi pod względem swej godności.")
+        (library_path / "udhr-en.pdf").unlink()
+        storage.generate_index(agent_name, reader=LocalLibrary(str(library_path)).get_reader())
+
+        index = storage.load_index(agent_name)
+        retrieved = index.as_retriever(similarity_top_k=6).retrieve("wolni")
+        assert [node.metadata["file_name"] for node in retrieved] == ["udhr-pl.txt"]
+
+        # The results of embedding and keyword search are fused
+        retriever = storage.load_retriever(agent_name, similarity_top_k=1)
+        assert [node.metadata["file_name"] for node in retriever.retrieve("godności")] == ["udhr-pl.txt"]
+
+    vector_store = index.vector_store
+    result = vector_store.query(
+        VectorStoreQuery(query_str="ludzie godności", mode=VectorStoreQueryMode.TEXT_SEARCH, similarity_top_k=3)
+    )
+    assert result.nodes is not None
+    assert len(result.nodes) == 1
+    assert "równi" in result.nodes[0].get_content()
+
+    storage.delete_agent(agent_name)
+    assert storage.list_agents() == []
+    assert vector_store.query(VectorStoreQuery(query_str="ludzie", mode=VectorStoreQueryMode.TEXT_SEARCH)).ids == []
+
+
+@seed(42)
+def test_sqlite_storage_update_agent_after_deleting_files(tmp_path):
+    library_path = tmp_path / "library"
+    library_path.mkdir()
+    (library_path / "a.txt").write_text("All human beings are born free and equal in dignity and rights.")
+    (library_path / "b.txt").write_text("Everyone has the right to life, liberty and security of person.")
+    model_path = create_tiny_model(tmp_path)
+
+    storage = SQLiteStorage(tmp_path / "storage.sqlite")
+    with env_vars(
+        RAGAMUFFIN_DATA_DIR=str(tmp_path / "data"),
+        RAGAMUFFIN_EMBEDDING_DIMENSION="64",
+        RAGAMUFFIN_EMBEDDING_MODEL=f"huggingface.co/{model_path}",
+    ):
+        storage.generate_index("test_agent", reader=LocalLibrary(str(library_path)).get_reader())
+
+        # No file is loaded, only the documents of the deleted file are removed
+        (library_path / "b.txt").unlink()
+        storage.generate_index("test_agent", reader=LocalLibrary(str(library_path)).get_reader())
+
+        index = storage.load_index("test_agent")
+        retrieved = index.as_retriever(similarity_top_k=6).retrieve("rights")
+        assert [node.metadata["file_name"] for node in retrieved] == ["a.txt"]
+
+
+def test_sqlite_vector_store_query_unknown_agent(tmp_path):
+    vector_store = SQLiteVectorStore(tmp_path / "storage.sqlite", "unknown_agent")
+    result = vector_store.query(VectorStoreQuery(query_embedding=[1.0, 0.0, 0.0], similarity_top_k=3))
+
+    assert result.ids == []
+    assert result.nodes == []
+
+
+@seed(42)
+def test_sqlite_storage_interrupted_update_keeps_agent(tmp_path, monkeypatch):
+    library_path = tmp_path / "library"
+    library_path.mkdir()
+    (library_path / "a.txt").write_text("All human beings are born free and equal in dignity and rights.")
+    (library_path / "b.txt").write_text("Everyone has the right to life, liberty and security of person.")
+    model_path = create_tiny_model(tmp_path)
+
+    storage = SQLiteStorage(tmp_path / "storage.sqlite")
+    with env_vars(
+        RAGAMUFFIN_DATA_DIR=str(tmp_path / "data"),
+        RAGAMUFFIN_EMBEDDING_DIMENSION="64",
+        RAGAMUFFIN_EMBEDDING_MODEL=f"huggingface.co/{model_path}",
+    ):
+        storage.generate_index("test_agent", reader=LocalLibrary(str(library_path)).get_reader())
+        manifest = storage._load_manifest("test_agent")
+
+        insert_documents = sqlite.insert_documents
+
+        def insert_and_fail(index, documents, batch_size, **kwargs) -> None:
+            insert_documents(index, documents, batch_size, **kwargs)
+            raise KeyboardInterrupt
+
+        (library_path / "b.txt").unlink()
+        (library_path / "c.txt").write_text("No one shall be held in slavery or servitude.")
+        monkeypatch.setattr(sqlite, "insert_documents", insert_and_fail)
+        with pytest.raises(KeyboardInterrupt):
+            storage.generate_index("test_agent", reader=LocalLibrary(str(library_path)).get_reader())
+
+        # The deleted and added documents are rolled back together with the manifest
+        assert storage._load_manifest("test_agent").to_dict() == manifest.to_dict()
+        reloaded = SQLiteStorage(tmp_path / "storage.sqlite")
+        retrieved = reloaded.load_index("test_agent").as_retriever(similarity_top_k=6).retrieve("rights")
+        assert sorted(node.metadata["file_name"] for node in retrieved) == ["a.txt", "b.txt"]
@@ -0,0 +1,172 @@
+import json
+
+import numpy as np
+from llama_index.core.schema import NodeRelationship, RelatedNodeInfo, TextNode
+from llama_index.core.vector_stores.types import (
+    MetadataFilter,
+    MetadataFilters,
+    VectorStoreQuery,
+)
+
+from ragamuffin.storage.vector_store import EMBEDDINGS_FILENAME, VECTOR_STORE_FILENAME, MmapVectorStore
+
+
+def make_node(node_id: str, doc_id: str, embedding: list[float]) -> TextNode:
+    return TextNode(
+        id_=node_id,
+        text=node_id,
+        embedding=embedding,
+        metadata={"doc": doc_id},
+        relationships={NodeRelationship.SOURCE: RelatedNodeInfo(node_id=doc_id)},
+    )
+
+
+def get_nodes() -> list[TextNode]:
+    nodes = []
+    for i, doc_id in enumerate(["a", "a", "b", "c"]):
+        embedding = [0.0, 0.0, 0.0, 0.0]
+        embedding[i] = 1.0
+        embedding[(i + 1) % 4] = 0.5
+        nodes.append(make_node(f"node-{i}", doc_id, embedding))
+    return nodes
+
+
+def test_mmap_vector_store_persist_and_load(tmp_path):
+    store = MmapVectorStore(dtype="float16")
+    store.add(get_nodes())
+    persist_path = tmp_path / VECTOR_STORE_FILENAME
+    store.persist(str(persist_path))
+
+    assert MmapVectorStore.is_persisted(persist_path)
+    loaded = MmapVectorStore.from_persist_path(persist_path)
+    assert isinstance(loaded.embeddings, np.memmap)
+    assert loaded.embeddings.dtype == np.float16
+    assert loaded.get("node-2") == [0.0, 0.0, 1.0, 0.5]
+
+    result = loaded.query(VectorStoreQuery(query_embedding=[0.0, 0.0, 1.0, 0.0], similarity_top_k=2))
+    assert result.ids == ["node-2", "node-1"]
+    assert result.similarities is not None
+    assert result.similarities[0] > result.similarities[1]
+
+
+def test_mmap_vector_store_filters_and_delete(tmp_path):
+    store = MmapVectorStore()
+    store.add(get_nodes())
+    filters = MetadataFilters(filters=[MetadataFilter(key="doc", value="a")])
+
+    result = store.query(VectorStoreQuery(query_embedding=[0.0, 0.0, 1.0, 0.0], similarity_top_k=3, filters=filters))
+    assert result.ids == ["node-1", "node-0"]
+
+    # Deleted documents are removed from results and from the persisted store
+    store.delete("a")
+    store.add([make_node("node-4", "d", [1.0, 0.0, 0.0, 0.0])])
+    result = store.query(VectorStoreQuery(query_embedding=[1.0, 0.0, 0.0, 0.0], similarity_top_k=10))
+    assert sorted(result.ids) == ["node-2", "node-3", "node-4"]
+    assert result.ids[0] == "node-4"
+
+    persist_path = tmp_path / VECTOR_STORE_FILENAME
+    store.persist(str(persist_path))
+    loaded = MmapVectorStore.from_persist_path(persist_path)
+    assert loaded.embeddings.shape == (3, 4)
+
+
+def test_mmap_vector_store_detects_legacy_format(tmp_path):
+    persist_path = tmp_path / VECTOR_STORE_FILENAME
+    persist_path.write_text('{"embedding_dict": {}, "text_id_to_ref_doc_id": {}, "metadata_dict": {}}')
+    assert not MmapVectorStore.is_persisted(persist_path)
+    assert not MmapVectorStore.is_persisted(tmp_path / "missing.json")
+
+
+def test_mmap_vector_store_ann_index(tmp_path):
+    rng = np.random.default_rng(42)
+    centers = rng.normal(size=(20, 16))
+    embeddings = centers[rng.integers(20, size=2000)] + 0.3 * rng.normal(size=(2000, 16))
+    node_ids = [f"node-{i}" for i in range(2000)]
+    store = MmapVectorStore(
+        embeddings=embeddings.astype(np.float32), node_ids=node_ids, ref_doc_ids=node_ids, metadata=[{}] * 2000
+    )
+
+    ann_index = store.build_ann_index()
+    assert ann_index.num_rows == 2000
+    assert store.measure_recall(k=10) > 0.9
+
+    persist_path = tmp_path / VECTOR_STORE_FILENAME
+    store.persist(str(persist_path))
+    loaded = MmapVectorStore.from_persist_path(persist_path, nprobe=4)
+    assert loaded.ann_index is not None
+    assert loaded.nprobe == 4
+
+    query = VectorStoreQuery(query_embedding=embeddings[7].tolist(), similarity_top_k=5)
+    assert loaded.query(query).ids[0] == "node-7"
+
+    # Added embeddings are found by exact search until the ANN index is built again
+    loaded.add([make_node("node-new", "new", embeddings[7].tolist())])
+    assert loaded.ann_index is None
+    assert set(loaded.query(query).ids[:2]) == {"node-7", "node-new"}
+
+
+def test_mmap_vector_store_get_after_delete():
+    store = MmapVectorStore()
+    store.add([make_node("n0", "a", [1.0, 0.0]), make_node("n1", "b", [0.0, 1.0]), make_node("n2", "b", [1.0, 1.0])])
+    store.delete("a")
+
+    assert store.get("n1") == [0.0, 1.0]
+    assert store.get("n2") == [1.0, 1.0]
+
+
+def test_mmap_vector_store_appends_rows(tmp_path):
+    nodes = get_nodes()
+    persist_path = tmp_path / VECTOR_STORE_FILENAME
+    store = MmapVectorStore(dtype="float16")
+    store.add(nodes[:2])
+    store.persist(str(persist_path))
+    embeddings_inode = (tmp_path / EMBEDDINGS_FILENAME).stat().st_ino
+
+    store = MmapVectorStore.from_persist_path(persist_path)
+    store.add(nodes[2:3])
+    store.persist(str(persist_path))
+    store.add(nodes[3:])
+    store.persist(str(persist_path))
+
+    # Added rows are appended to the files written by the first call
+    assert (tmp_path / EMBEDDINGS_FILENAME).stat().st_ino == embeddings_inode
+    loaded = MmapVectorStore.from_persist_path(persist_path)
+    assert loaded.get("node-3") == [0.5, 0.0, 0.0, 1.0]
+    assert loaded.query(VectorStoreQuery(query_embedding=[1.0, 0.0, 0.0, 0.0], similarity_top_k=1)).ids == ["node-0"]
+
+    # Rows appended by an interrupted call are ignored, and replaced by the next one
+    loaded.add([make_node("node-4", "d", [1.0, 1.0, 0.0, 0.0])])
+    loaded._append_rows()
+    assert len(MmapVectorStore.from_persist_path(persist_path).embeddings) == 4
+    resumed = MmapVectorStore.from_persist_path(persist_path)
+    resumed.add([make_node("node-5", "e", [0.0, 1.0, 1.0, 0.0])])
+    resumed.persist(str(persist_path))
+    loaded = MmapVectorStore.from_persist_path(persist_path)
+    assert loaded.embeddings.shape == (5, 4)
+    assert loaded.get("node-5") == [0.0, 1.0, 1.0, 0.0]
+
+    # Deleting rows writes the files again
+    loaded.delete("a")
+    loaded.persist(str(persist_path))
+    assert MmapVectorStore.from_persist_path(persist_path).embeddings.shape == (3, 4)
+
+
+def test_mmap_vector_store_loads_inline_side_index(tmp_path):
+    np.save(tmp_path / EMBEDDINGS_FILENAME, np.array([[1.0, 0.0], [0.0, 1.0]], dtype=np.float32))
+    side_index = {
+        "format": "ragamuffin-mmap",
+        "dtype": "float32",
+        "embeddings_file": EMBEDDINGS_FILENAME,
+        "ann_index_file": None,
+        "node_ids": ["n0", "n1"],
+        "ref_doc_ids": ["a", "b"],
+        "metadata": [{}, {}],
+    }
+    persist_path = tmp_path / VECTOR_STORE_FILENAME
+    persist_path.write_text(json.dumps(side_index))
+
+    store = MmapVectorStore.from_persist_path(persist_path)
+    assert store.get("n1") == [0.0, 1.0]
+    store.add([make_node("n2", "c", [1.0, 1.0])])
+    store.persist(str(persist_path))
+    assert MmapVectorStore.from_persist_path(persist_path).get("n2") == [1.0, 1.0]
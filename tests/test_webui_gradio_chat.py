@@ -0,0 +1,118 @@
+import threading
+import time
+from collections.abc import Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from types import SimpleNamespace
+
+import gradio as gr
+import pytest
+
+from ragamuffin.webui.gradio_chat import GradioAgentChatUI, coalesce_tokens
+
+TOKENS = ["The", " answer", " is", " forty", "-two", "."]
+
+
+def test_coalesce_tokens_flushes_by_size_and_on_request():
+    # The first token is sent immediately, the others wait until enough characters are buffered
+    assert list(coalesce_tokens(iter(TOKENS), interval=3600, max_chars=10)) == ["The", " answer is", " forty-two", "."]
+
+    flushes = iter([False, False, True, False, False])
+    chunks = list(coalesce_tokens(iter(TOKENS), interval=3600, max_chars=1000, flush=lambda: next(flushes)))
+    assert chunks == ["The", " answer is forty", "-two."]
+
+
+def test_coalesce_tokens_flushes_by_time():
+    assert list(coalesce_tokens(iter(TOKENS), interval=0, max_chars=1000)) == TOKENS
+    assert list(coalesce_tokens(iter([]))) == []
+
+
+def test_coalesce_tokens_flushes_when_stream_stalls():
+    def generate_tokens() -> Iterator[str]:
+        yield "The"
+        yield " answer"
+        time.sleep(1)
+        yield " is"
+
+    start_time = time.monotonic()
+    chunks = [(chunk, time.monotonic() - start_time) for chunk in coalesce_tokens(generate_tokens(), interval=0.1)]
+
+    # The buffered token is sent within the interval, without waiting for the next token
+    assert [chunk for chunk, _ in chunks] == ["The", " answer", " is"]
+    assert chunks[1][1] < 0.5
+
+
+def test_coalesce_tokens_raises_stream_errors():
+    def generate_tokens() -> Iterator[str]:
+        yield "The"
+        raise RuntimeError("Connection lost")
+
+    chunks = coalesce_tokens(generate_tokens(), interval=3600)
+    assert next(chunks) == "The"
+    with pytest.raises(RuntimeError, match="Connection lost"):
+        next(chunks)
+
+
+class ImmediateExecutor:
+    """An executor which runs each task as soon as it is submitted."""
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+
+def create_chat_ui(tokens: Iterator[str], generate_sources_html) -> GradioAgentChatUI:
+    """Create the chat UI with a fake agent, without loading any models."""
+    response = SimpleNamespace(response_gen=tokens, source_nodes=[])
+    chat_ui = GradioAgentChatUI.__new__(GradioAgentChatUI)
+    chat_ui.agent = SimpleNamespace(stream_chat=lambda query: response)
+    chat_ui.query_recorder = None
+    chat_ui.highlight_executor = ThreadPoolExecutor(max_workers=1)
+    chat_ui.generate_sources_html = generate_sources_html
+    return chat_ui
+
+
+def respond(chat_ui: GradioAgentChatUI) -> list[tuple[str, str | dict]]:
+    """Collect the answer shown so far and the sources update of each step of the response."""
+    chat_history = [{"role": "user", "content": "question"}]
+    return [(history[-1]["content"], sources) for history, sources in chat_ui.respond(chat_history)]
+
+
+def test_respond_shows_sources_once_when_ready_first():
+    chat_ui = create_chat_ui(iter(TOKENS), lambda query, source_nodes: "<p>sources</p>")
+    chat_ui.highlight_executor = ImmediateExecutor()
+
+    updates = respond(chat_ui)
+
+    # The sources are sent with the first chunk of the answer, and left unchanged afterwards
+    assert updates[0] == ("The", "<p>sources</p>")
+    assert all(sources == gr.update() for _, sources in updates[1:])
+    assert updates[-1][0] == "".join(TOKENS)
+
+
+def test_respond_streams_answer_before_sources():
+    first_chunk_shown = threading.Event()
+    answer_done = threading.Event()
+
+    def generate_tokens() -> Iterator[str]:
+        yield TOKENS[0]
+        # Tokens are read in the background, so wait until the first chunk is shown
+        first_chunk_shown.wait(timeout=10)
+        yield from TOKENS[1:]
+        answer_done.set()
+
+    def generate_sources_html(query, source_nodes) -> str:
+        answer_done.wait(timeout=10)
+        return "<p>sources</p>"
+
+    chat_ui = create_chat_ui(generate_tokens(), generate_sources_html)
+
+    updates = []
+    for history, sources in chat_ui.respond([{"role": "user", "content": "question"}]):
+        updates.append((history[-1]["content"], sources))
+        first_chunk_shown.set()
+
+    # The answer is shown while the sources are highlighted, and the sources are sent once when ready
+    assert updates[0] == ("The", gr.update())
+    assert [sources for _, sources in updates if sources != gr.update()] == ["<p>sources</p>"]
+    assert updates[-1][0] == "".join(TOKENS)
@@ -3,10 +3,13 @@ import random
 from collections.abc import Callable
 from contextlib import contextmanager
 from functools import wraps
+from pathlib import Path
 from typing import Any
 
 import numpy as np
 import torch
+from sentence_transformers import SentenceTransformer, models
+from transformers import BertConfig, BertModel, BertTokenizerFast
 
 
 def seed(seed_value: int):
@@ -75,3 +78,19 @@ def env_vars(func: Callable | None = None, **vars) -> Any:
             return func(*args, **kwargs)
 
     return wrapper
+
+
+def create_tiny_model(model_dir: Path) -> Path:
+    """Save a small, randomly initialized Sentence Transformers model."""
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", *"abcdefghijklmnopqrstuvwxyz", "human", "rights"]
+    (model_dir / "vocab.txt").write_text("\n".join(vocab))
+    config = BertConfig(
+        vocab_size=len(vocab), hidden_size=64, num_hidden_layers=2, num_attention_heads=4, intermediate_size=128
+    )
+    BertModel(config).save_pretrained(model_dir / "bert")
+    BertTokenizerFast(str(model_dir / "vocab.txt")).save_pretrained(model_dir / "bert")
+
+    transformer = models.Transformer(str(model_dir / "bert"), max_seq_length=64)
+    pooling = models.Pooling(transformer.get_word_embedding_dimension(), "cls")
+    SentenceTransformer(modules=[transformer, pooling]).save(str(model_dir / "model"))
+    return model_dir / "model"